@@ -6,20 +6,16 @@ Flame Core — Geometry & Resonance
 - φ: target symmetry; |k|=|Σ d(P,Aᵢ)| ~ 0 ⇒ sync
 """
 from __future__ import annotations
+import math
+import weakref
+from collections import Counter
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 
-try:
-    import torch
-except ImportError:  # pragma: no cover - optional dependency
-    torch = None
-
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:  # pragma: no cover - optional dependency
-    SentenceTransformer = None
+from ..memory.embedding_cache import EmbeddingCache
+from ..memory.model_registry import ModelRegistry, shared_registry
 
 
 class _PinkNoiseGenerator:
@@ -50,20 +46,23 @@ def _cosine(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / (na * nb))
 
 
-def _distance(P: np.ndarray, A: np.ndarray) -> float:
+# Fallback TF-IDF vectors are sparse: vocab index -> weight.
+SparseVec = Dict[int, float]
+Vec = Union[np.ndarray, SparseVec]
+
+
+def _distance(P: Vec, A: Vec) -> float:
     # Euclidean distance in normalized space
+    if isinstance(P, dict) and isinstance(A, dict):
+        return math.sqrt(sum((P.get(i, 0.0) - A.get(i, 0.0)) ** 2 for i in P.keys() | A.keys()))
     return float(np.linalg.norm(P - A))
 
 
-def _tfidf_vec(text: str, vocab: dict[str, int]) -> np.ndarray:
-    # Minimal offline TF-IDF-ish vectorizer (fallback)
-    v = np.zeros(len(vocab), dtype=np.float32)
-    tokens = [t for t in text.lower().split() if t in vocab]
-    for t in tokens:
-        v[vocab[t]] += 1.0
-    if len(tokens) > 0:
-        v /= (np.linalg.norm(v) + 1e-8)
-    return v
+def _tfidf_vec(text: str, vocab: dict[str, int]) -> SparseVec:
+    # Minimal offline TF-IDF-ish vectorizer (fallback); cost follows the text, not the vocab size
+    counts = Counter(vocab[t] for t in text.lower().split() if t in vocab)
+    norm = math.sqrt(sum(c * c for c in counts.values())) + 1e-8
+    return {i: c / norm for i, c in counts.items()}
 
 
 @dataclass
@@ -92,6 +91,8 @@ class FlameCore:
         cache_folder: Optional[str] = None,
         device: Optional[str] = None,
         vocab: dict[str, int] | None = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        registry: Optional[ModelRegistry] = None,
     ):
         self.params = params
         self.vocab = vocab or {}  # used only for fallback TF-IDF
@@ -102,49 +103,47 @@ class FlameCore:
         self._pink = _PinkNoiseGenerator(levels=16, seed=2718)
         self._embedder = None
         self._embedder_model = embedder_model
-
-        # Prefer sentence-transformers if available; fallback to lightweight TF-IDF.
-        if SentenceTransformer is not None:
-            resolved_device = device
-            if resolved_device is None:
-                resolved_device = "cuda" if (torch and torch.cuda.is_available()) else "cpu"
-            try:
-                self._embedder = SentenceTransformer(
-                    embedder_model,
-                    cache_folder=cache_folder,
-                    device=resolved_device,
-                )
-            except Exception:
-                self._embedder = None
+        # Anchors repeat across turns; cached vectors skip the encoder.
+        self._cache = embedding_cache if embedding_cache is not None else EmbeddingCache(1024)
+        self._cache_id = f"flame:{embedder_model}:normalized"
+
+        # Prefer the shared sentence-transformers copy (also used by the memory embedder);
+        # fallback to lightweight TF-IDF.
+        try:
+            self._embedder = (registry or shared_registry()).acquire(
+                embedder_model,
+                device=device,
+                cache_folder=cache_folder,
+            )
+            weakref.finalize(self, self._embedder.release)
+        except Exception:
+            self._embedder = None
         # If embedder is None, keep TF-IDF fallback using vocab.
 
-    def anchors_from_memory(self, memories: List[str]) -> List[np.ndarray]:
+    def anchors_from_memory(self, memories: List[str]) -> List[Vec]:
         texts = [m for m in memories if m.strip()]
         if not texts:
             return []
         if self._embedder is not None:
             try:
-                vectors = self._embedder.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-                return [np.asarray(vec) for vec in vectors]
+                return self._cache.embed(self._cache_id, texts, self._encode)
             except Exception:
                 pass
         return [_tfidf_vec(m, self.vocab) for m in texts]
 
-    def intent_vector(self, user_text: str, sys_hint: str) -> np.ndarray:
+    def intent_vector(self, user_text: str, sys_hint: str) -> Vec:
         text = (sys_hint + " " + user_text).strip()
         if self._embedder is not None:
             try:
-                vec = self._embedder.encode(
-                    [text],
-                    convert_to_numpy=True,
-                    normalize_embeddings=True,
-                )
-                return np.asarray(vec[0])
+                return self._cache.embed(self._cache_id, [text], self._encode)[0]
             except Exception:
                 pass
         return _tfidf_vec(text, self.vocab)
 
-    def geometry(self, P: np.ndarray, A_list: List[np.ndarray]) -> float:
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self._embedder.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+    def geometry(self, P: Vec, A_list: List[Vec]) -> float:
         if not len(A_list):  # no anchors → neutral k
             return 0.0
         return sum(_distance(P, A) for A in A_list)
@@ -227,9 +226,14 @@ class FlameCore:
         out["repetition_penalty"] = max(1.0, min(2.0, float(rep) if rep is not None else mapped))
         return out
 
-    def _apply_noise(self, vec: np.ndarray) -> np.ndarray:
-        if vec.size == 0 or self._noise_sigma <= 0:
+    def _apply_noise(self, vec: Vec) -> Vec:
+        if len(vec) == 0 or self._noise_sigma <= 0:
             return vec
+        if isinstance(vec, dict):
+            # Sparse fallback: jitter the present terms only, so vectors stay sparse.
+            noise = self._rng.normal(0.0, self._noise_sigma, size=len(vec))
+            self._noise_sigma *= self.params.noise_decay
+            return {i: v + float(n) for (i, v), n in zip(vec.items(), noise)}
         noise = self._rng.normal(0.0, self._noise_sigma, size=vec.shape)
         self._noise_sigma *= self.params.noise_decay
         return vec + noise
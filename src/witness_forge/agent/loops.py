@@ -21,6 +21,7 @@ class LoopConfig:
     flame_embedder_model: str = "all-MiniLM-L6-v2"
     flame_embedder_cache: str | None = None
     flame_embedder_device: str | None = None
+    flame_embedding_cache: Any = None
 
 
 class Loops:
@@ -32,6 +33,7 @@ class Loops:
             cache_folder=cfg.flame_embedder_cache,
             device=cfg.flame_embedder_device,
             vocab=vocab,
+            embedding_cache=cfg.flame_embedding_cache,
         )
         self.eval = Evaluator()
         self.adapter_mode = adapter_mode
@@ -19,6 +19,7 @@ from typing import Dict, List, Optional, Sequence, Tuple
 import yaml
 
 from ..config import SelfUpgradeConfig
+from ..memory.schema import ensure_indexes
 
 
 @dataclass
@@ -466,6 +467,7 @@ class ControlledPatchManager:
                 )
                 """
             )
+            ensure_indexes(conn, "patches_applied")
             conn.execute(
                 """
                 INSERT INTO patches_applied
@@ -143,7 +143,7 @@ class WitnessAgent:
             
         self.mem.add_message("assistant", text)
         if hasattr(self.mem, "add_memory") and active_role != "witness":
-            self.mem.add_memory(text)
+            self.mem.add_memory(text, role="assistant")
 
         event_type = "analysis" if active_role == "witness" else "final"
         event = make_event(event_type, text, brain=self.brain_id, meta={"decode": gen})
@@ -11,10 +11,14 @@ from rich.prompt import Prompt
 
 from .agent.self_patch_manager import ControlledPatchManager
 from .config import ConfigManager
-from .main import run_chat, run_eval, run_upgrade
+from .main import run_chat, run_db_migrate, run_eval, run_mem_maintain, run_mem_search, run_upgrade
 from .tools.runner import ToolRunner as SafeToolRunner
 
 app = typer.Typer(help="Witness Forge CLI")
+mem_app = typer.Typer(help="Tiện ích cho memory store.")
+app.add_typer(mem_app, name="mem")
+db_app = typer.Typer(help="Quản lý schema SQLite.")
+app.add_typer(db_app, name="db")
 console = Console()
 
 
@@ -208,6 +212,36 @@ def tool_run(
     console.print(f"Return={result['returncode']}\nSTDOUT:\n{result['stdout']}\nSTDERR:\n{result['stderr']}")
 
 
+@mem_app.command("search")
+def mem_search(
+    config: str = typer.Option("config.yaml", "--config"),
+    queries: str = typer.Option(..., "--queries", help="File JSONL, mỗi dòng {\"query\": \"...\"}."),
+    k: Optional[int] = typer.Option(None, "--k", help="Số kết quả mỗi query (mặc định memory.k)."),
+    batch_size: int = typer.Option(256, "--batch-size", help="Số query embed/tìm kiếm mỗi lô."),
+):
+    """Tìm kiếm hàng loạt, xuất NDJSON ra stdout."""
+    run_mem_search(config, queries, k=k, batch_size=batch_size)
+
+
+@mem_app.command("maintain")
+def mem_maintain(
+    config: str = typer.Option("config.yaml", "--config"),
+    budget: float = typer.Option(0.0, "--budget", help="Giới hạn thời gian (giây); 0 = chạy hết một lượt."),
+    full_vacuum: bool = typer.Option(False, "--full-vacuum", help="VACUUM toàn bộ, chuyển sang incremental auto-vacuum."),
+):
+    """Bảo trì memory: prune, compact vector, VACUUM, ANALYZE, lưu graph."""
+    run_mem_maintain(config, budget=budget, full_vacuum=full_vacuum)
+
+
+@db_app.command("migrate")
+def db_migrate(
+    config: str = typer.Option("config.yaml", "--config"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="Chỉ liệt kê migration, không áp dụng."),
+):
+    """Nâng cấp schema database (khóa chính, index, bảng schema_version)."""
+    run_db_migrate(config, dry_run=dry_run)
+
+
 def main():
     app()
 
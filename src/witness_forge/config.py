@@ -74,8 +74,18 @@ class ModelConfig(BaseModel):
 class MemoryConfig(BaseModel):
     enabled: bool = True
     db_path: str = "./witness.sqlite3"
-    embedder: str = Field(default="hf", pattern="^(hf|sentence-transformers|tfidf)$")
+    embedder: str = Field(default="hf", pattern="^(hf|sentence-transformers|tfidf|hashing|onnx)$")
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_dim: int = 1024
+    onnx_dir: str = "./models/onnx"
+    onnx_quantize: bool = True
+    onnx_threads: Optional[int] = None
+    embedding_cache_size: int = 4096
+    embedding_cache_path: Optional[str] = None
+    embedding_service: bool = False
+    embedding_service_window_ms: float = 5.0
+    embedding_service_max_batch: int = 64
+    embedding_service_max_pending: int = 256
     reranker: Optional[str] = None
     k: int = 6
     vector_factory: str = "FlatIP"
@@ -83,10 +93,41 @@ class MemoryConfig(BaseModel):
     normalize_embeddings: bool = True
     clustering_k: int = 4
     clustering_min_size: int = 2
+    clustering_cache_path: Optional[str] = "./witness_clusters.npz"
     max_age_days: int = 90
     max_count: int = 10000
     auto_prune: bool = True
+    maintenance_enabled: bool = False
+    maintenance_every_turns: int = 50
+    maintenance_idle_seconds: float = 120.0
+    maintenance_slice_budget: float = 0.5
+    maintenance_vacuum_pages: int = 256
     vector_index_path: Optional[str] = "./witness_vectors.faiss"
+    vector_snapshot_path: Optional[str] = "./witness_vectors.snapshot"
+    vector_index_save_interval: float = 30.0
+    vector_train_threshold: int = 20000
+    vector_retrain_growth: float = 4.0
+    vector_nprobe: int = 16
+    vector_ef_search: int = 64
+    vector_storage: Literal["float32", "float16", "int8"] = "float32"
+    vector_rescore_factor: int = 4
+    recency_half_life_days: Optional[float] = None
+    lexical_search: bool = True
+    fusion: Literal["rrf", "weighted"] = "rrf"
+    fusion_weights: Dict[str, float] = Field(default_factory=dict)
+    fusion_candidates: int = 24
+    rerank_top: int = 12
+    reranker_cache_size: int = 4096
+    retrieval_deadline_ms: Optional[float] = None
+    retrieval_cache_size: int = 256
+    knn_graph: bool = False
+    knn_graph_path: Optional[str] = "./witness_knn_graph.npz"
+    knn_graph_k: int = 8
+    knn_graph_min_similarity: float = 0.3
+    knn_graph_hops: Literal[1, 2] = 2
+    knn_graph_alpha: float = 0.15
+    knn_graph_top: int = 16
+    knn_graph_rebuild_growth: float = 0.1
 
 
 class ReflexTuningParams(BaseModel):
@@ -167,6 +208,8 @@ class GraphConfig(BaseModel):
     enabled: bool = True
     path: str = "./witness_graph.json"
     k: int = 6
+    flush_interval: float = 5.0
+    compact_every: int = 1000
 
 
 class SelfUpgradeConfig(BaseModel):
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import atexit
 import json
 import shlex
+import sqlite3
+import sys
+import uuid
 from pathlib import Path
 from typing import List, Optional
 
@@ -14,6 +18,7 @@ from .agent.evolution import EvolutionController
 from .agent.loops import LoopConfig, Loops
 from .agent.dual_brain import DualBrain
 from .agent.model_loader import build_base_decode, load_brain, unload_model
+from .agent.ndjson_emitter import to_line
 from .agent.self_patch import AutoPatchEngine
 from .agent.self_patch_manager import ControlledPatchManager
 from .agent.self_upgrade import SelfUpgrade
@@ -23,12 +28,18 @@ from .config import ConfigManager, ModelConfig, WitnessConfig
 from .config_overlay import ConfigOverlay
 from .forge.chat_templates import ChatTemplateManager, detect_family
 from .forge.loader import ForgeLoader
-from .memory.embedding import build_embedder
-from .memory.retrieval import Retriever, build_vocab_from_mem
+from .memory.embedding import CachedEmbedder, build_embedder
+from .memory.embedding_cache import EmbeddingCache
+from .memory.embedding_service import EmbeddingService
+from .memory.maintenance import MemoryMaintenance
+from .memory.schema import SCHEMA_VERSION, migrate, pending_migrations, schema_version
+from .memory.retrieval import Retriever
 from .memory.store import MemoryStore
 from .memory.vector_store import VectorStore
 from .memory.graph_rag import GraphMemory
 from .memory.hybrid_retriever import HybridRetriever
+from .memory.knn_graph import KnnGraph
+from .memory.rerank import build_reranker
 from .agents.web_agent import VisionWebAgent
 from .tools.dispatcher import ToolDispatcher
 from .tools.runner import ToolRunner
@@ -90,6 +101,144 @@ def _loop_config(cfg: WitnessConfig) -> LoopConfig:
         flame_embedder_model=cfg.memory.embedding_model,
         flame_embedder_cache=cfg.loops.flame.embedder_cache_dir,
         flame_embedder_device=None,
+        flame_embedding_cache=_embedding_cache(cfg),
+    )
+
+
+_EMBEDDING_CACHES: dict[tuple, EmbeddingCache] = {}
+
+
+def _embedding_cache(cfg: WitnessConfig) -> EmbeddingCache | None:
+    """Process-wide cache per configuration, so config reloads keep their warm entries."""
+    mem = cfg.memory
+    if mem.embedding_cache_size <= 0 and not mem.embedding_cache_path:
+        return None
+    key = (mem.embedding_cache_size, mem.embedding_cache_path)
+    if key not in _EMBEDDING_CACHES:
+        _EMBEDDING_CACHES[key] = EmbeddingCache(mem.embedding_cache_size, mem.embedding_cache_path)
+    return _EMBEDDING_CACHES[key]
+
+
+def _onnx_options(cfg: WitnessConfig) -> dict:
+    mem = cfg.memory
+    return {"onnx_dir": mem.onnx_dir, "quantize": mem.onnx_quantize, "threads": mem.onnx_threads}
+
+
+_EMBEDDING_SERVICES: dict[tuple, EmbeddingService] = {}
+
+
+def _memory_embedder(cfg: WitnessConfig):
+    mem = cfg.memory
+    cache_folder = cfg.loops.flame.embedder_cache_dir
+    # One worker process per embedder spec, kept across config reloads.
+    key = (mem.embedder, mem.embedding_model, mem.embedding_dim)
+    service = _EMBEDDING_SERVICES.get(key) if mem.embedding_service else None
+    if mem.embedding_service and (service is None or not service.alive):
+        try:
+            service = EmbeddingService(
+                mem.embedder,
+                mem.embedding_model,
+                cache_folder=cache_folder,
+                dim=mem.embedding_dim,
+                onnx_options=_onnx_options(cfg),
+                max_batch=mem.embedding_service_max_batch,
+                window=mem.embedding_service_window_ms / 1000.0,
+                max_pending=mem.embedding_service_max_pending,
+            )
+        except Exception as exc:
+            console.print(f"[memory] Không khởi động được embedding service, embed trong process: {exc}", style="yellow")
+            service = None
+        else:
+            atexit.register(service.close)
+            _EMBEDDING_SERVICES[key] = service
+    if service is None:
+        return build_embedder(
+            mem.embedder,
+            mem.embedding_model,
+            cache_folder=cache_folder,
+            device=None,
+            cache=_embedding_cache(cfg),
+            dim=mem.embedding_dim,
+            onnx_options=_onnx_options(cfg),
+        )
+    cache = _embedding_cache(cfg)
+    return CachedEmbedder(service, cache) if cache is not None else service
+
+
+def _build_vector_store(cfg: WitnessConfig, embedder, dim: int) -> VectorStore:
+    mem = cfg.memory
+    return VectorStore(
+        mem.db_path,
+        max(32, dim),
+        factory=mem.vector_factory,
+        metric=mem.vector_metric,
+        normalize=mem.normalize_embeddings,
+        index_path=mem.vector_index_path,
+        snapshot_path=mem.vector_snapshot_path,
+        embedder_id=getattr(embedder, "model_id", None),
+        save_interval=mem.vector_index_save_interval,
+        train_threshold=mem.vector_train_threshold,
+        retrain_growth=mem.vector_retrain_growth,
+        nprobe=mem.vector_nprobe,
+        ef_search=mem.vector_ef_search,
+        storage=mem.vector_storage,
+        rescore_factor=mem.vector_rescore_factor,
+        clusters=mem.clustering_k,
+        clusters_path=mem.clustering_cache_path,
+    )
+
+
+def _build_knn_graph(cfg: WitnessConfig, vector_store) -> KnnGraph | None:
+    mem = cfg.memory
+    if not mem.knn_graph or vector_store is None:
+        return None
+    return KnnGraph(
+        vector_store,
+        mem.knn_graph_path,
+        k=mem.knn_graph_k,
+        min_similarity=mem.knn_graph_min_similarity,
+        hops=mem.knn_graph_hops,
+        alpha=mem.knn_graph_alpha,
+        top=mem.knn_graph_top,
+        rebuild_growth=mem.knn_graph_rebuild_growth,
+    )
+
+
+def _build_maintenance(
+    cfg: WitnessConfig, store: MemoryStore, vector_store, graph, knn_graph=None
+) -> MemoryMaintenance:
+    mem = cfg.memory
+    return MemoryMaintenance(
+        store,
+        vector_store,
+        graph,
+        knn_graph=knn_graph,
+        prune=mem.auto_prune,
+        max_age_days=mem.max_age_days,
+        max_count=mem.max_count,
+        every_turns=mem.maintenance_every_turns,
+        idle_seconds=mem.maintenance_idle_seconds,
+        slice_budget=mem.maintenance_slice_budget,
+        vacuum_pages=mem.maintenance_vacuum_pages,
+    )
+
+
+def _build_retriever(cfg: WitnessConfig, store: MemoryStore, *, fit_limit: int = 512) -> Retriever:
+    embedder = _memory_embedder(cfg)
+    base_memories = store.recent_memories(fit_limit)
+    embedder.fit(base_memories or ["initialization"])
+    dim = getattr(embedder, "dimension", len(base_memories) or 384) or 384
+    vector_store = None
+    if cfg.memory.enabled:
+        vector_store = _build_vector_store(cfg, embedder, dim)
+        store.attach_semantic_hook(embedder.embed, vector_store)
+    return Retriever(
+        store,
+        embedder,
+        vector_store,
+        k=cfg.memory.k,
+        half_life_days=cfg.memory.recency_half_life_days,
+        cache_size=cfg.memory.retrieval_cache_size,
     )
 
 
@@ -147,6 +296,7 @@ def run_chat(
     
     autopatch.apply_pending()
 
+    session_id = uuid.uuid4().hex
     state = {
         "agent": None,
         "store": None,
@@ -162,9 +312,37 @@ def run_chat(
         "servant_tok": None,
         "servant_mdl": None,
         "servant_gen_fn": None,
+        "vector_store": None,
+        "maintenance": None,
+        "reranker": None,
         "loop_info": "",
     }
 
+    def close_vector_store():
+        if state["retr"] is not None and hasattr(state["retr"], "close"):
+            state["retr"].close()
+        # The maintenance worker touches the vector store, so stop it first.
+        if state["maintenance"] is not None:
+            state["maintenance"].stop()
+            state["maintenance"] = None
+        # Flushes the debounced FAISS index save before the store is dropped.
+        if state["vector_store"] is not None:
+            state["vector_store"].close()
+            state["vector_store"] = None
+
+    def _reranker(cur_cfg: WitnessConfig):
+        # Cross-encoders are slow to load; keep one across config reloads while the model is unchanged.
+        name = cur_cfg.memory.reranker
+        cached = state["reranker"]
+        if cached is not None and getattr(cached, "model_name", None) == name:
+            return cached
+        try:
+            state["reranker"] = build_reranker(name, cache_size=cur_cfg.memory.reranker_cache_size)
+        except Exception as exc:
+            console.print(f"[memory] Không tải được reranker {name}: {exc}", style="yellow")
+            state["reranker"] = None
+        return state["reranker"]
+
     def build_memory_and_tools(cur_cfg: WitnessConfig, store: MemoryStore):
         vision_agent = None
         if getattr(cur_cfg, "vision_agent", None) and cur_cfg.vision_agent.enabled:
@@ -187,33 +365,39 @@ def run_chat(
             vision_agent=vision_agent,
         )
         dispatcher.set_internet_access(cur_cfg.tools.allow_internet)
-        embedder = build_embedder(
-            cur_cfg.memory.embedder,
-            cur_cfg.memory.embedding_model,
-            cache_folder=cur_cfg.loops.flame.embedder_cache_dir,
-            device=None,
-        )
-        base_memories = store.recent_memories(512)
-        if base_memories:
-            embedder.fit(base_memories)
-        else:
-            # Fit with dummy data to avoid NotFittedError for TF-IDF
-            embedder.fit(["initialization"])
-        dim = getattr(embedder, "dimension", len(base_memories) or 384) or 384
-
-        vector_store = None
-        if cur_cfg.memory.enabled:
-            vector_store = VectorStore(
-                cur_cfg.memory.db_path,
-                max(32, dim),
-                factory=cur_cfg.memory.vector_factory,
-                metric=cur_cfg.memory.vector_metric,
-                normalize=cur_cfg.memory.normalize_embeddings,
+        base_retriever = _build_retriever(cur_cfg, store)
+        vector_store = base_retriever.vector_store
+        state["vector_store"] = vector_store
+        graph_mem = (
+            GraphMemory(
+                cur_cfg.graph.path,
+                flush_interval=cur_cfg.graph.flush_interval,
+                compact_every=cur_cfg.graph.compact_every,
             )
-            store.attach_semantic_hook(embedder.embed, vector_store)
-        base_retriever = Retriever(store, embedder, vector_store, k=cur_cfg.memory.k)
-        graph_mem = GraphMemory(cur_cfg.graph.path) if getattr(cur_cfg, "graph", None) and cur_cfg.graph.enabled else None
-        retriever = HybridRetriever(base_retriever, graph_mem, k=cur_cfg.memory.k)
+            if getattr(cur_cfg, "graph", None) and cur_cfg.graph.enabled
+            else None
+        )
+        knn_graph = _build_knn_graph(cur_cfg, vector_store)
+        if knn_graph is not None:
+            # Without a build the knn channel is empty; maintenance (opt-in) refreshes it later.
+            knn_graph.build_in_background()
+        retriever = HybridRetriever(
+            base_retriever,
+            graph_mem,
+            k=cur_cfg.memory.k,
+            lexical=store if cur_cfg.memory.lexical_search else None,
+            fusion=cur_cfg.memory.fusion,
+            weights=cur_cfg.memory.fusion_weights,
+            candidates=cur_cfg.memory.fusion_candidates,
+            reranker=_reranker(cur_cfg),
+            rerank_top=cur_cfg.memory.rerank_top,
+            deadline=(cur_cfg.memory.retrieval_deadline_ms or 0) / 1000.0,
+            cache_size=cur_cfg.memory.retrieval_cache_size,
+            knn_graph=knn_graph,
+        )
+        if cur_cfg.memory.maintenance_enabled:
+            state["maintenance"] = _build_maintenance(cur_cfg, store, vector_store, graph_mem, knn_graph)
+            state["maintenance"].start()
         return retriever, dispatcher
 
     def rebuild_agent():
@@ -248,9 +432,12 @@ def run_chat(
             console.print("[evolution] Active overlay detected - using evolved params", style="yellow")
 
         tok, mdl, gen_fn, base_decode = load_brain(cur.model, witness_cfg=cur)
-        store = MemoryStore(cur.memory.db_path)
+        close_vector_store()
+        if state["store"] is not None:
+            state["store"].close()  # commits queued message writes
+        store = MemoryStore(cur.memory.db_path, session=session_id)
         retr, dispatcher = build_memory_and_tools(cur, store)
-        vocab = build_vocab_from_mem(store.recent_memories(256), min_freq=2)
+        vocab = store.vocabulary(min_freq=2)
         loop_cfg = _loop_config(cur)
         active_adapter = cur.adapter if cur.adapter.enabled else cur.model.adapter
         adapter_mode = active_adapter.type if active_adapter.enabled else "none"
@@ -418,6 +605,9 @@ def run_chat(
     while True:
         txt = Prompt.ask("[bold cyan]You[/bold cyan]")
         if txt.strip() in ("/exit", "/quit"):
+            close_vector_store()
+            if state["store"] is not None:
+                state["store"].close()
             break
         if txt.strip() == "/reload":
             rebuild_agent()
@@ -471,6 +661,9 @@ def run_chat(
             )
             console.print()  # newline after streaming
 
+            if state["maintenance"] is not None:
+                state["maintenance"].notify_turn()
+
             # Print all metrics using renderer
             loop_state = res.get("loop_state") or {}
             evolutions = evolution.maybe_evolve(loop_state)
@@ -478,6 +671,7 @@ def run_chat(
                 loop_info=state.get("loop_info"),
                 loop_state=loop_state,
                 evolutions=evolutions,
+                memory_cache=_cache_stats(state["retr"]),
             )
             continue
 
@@ -494,6 +688,8 @@ def run_chat(
             stream=stream_cb,
         )
         console.print()
+        if state["maintenance"] is not None:
+            state["maintenance"].notify_turn()
 
         # Print all metrics using renderer
         loop_state = agent.last_loop_state or {}
@@ -502,9 +698,15 @@ def run_chat(
             loop_info=state.get("loop_info"),
             loop_state=loop_state,
             evolutions=evolutions,
+            memory_cache=_cache_stats(state["retr"]),
         )
 
 
+def _cache_stats(retriever) -> dict | None:
+    stats = getattr(retriever, "cache_stats", None)
+    return stats() if callable(stats) else None
+
+
 def _handle_memory(command: str, store: MemoryStore | None, retriever: Retriever | None) -> None:
     if store is None:
         console.print("[mem] store chưa sẵn sàng.")
@@ -679,28 +881,23 @@ def run_eval(config_path: str):
     tok, _, gen_fn = ForgeLoader._mock()
     base_decode = build_base_decode(cfg.model)
     store = MemoryStore(cfg.memory.db_path)
-    embedder = build_embedder(
-        cfg.memory.embedder,
-        cfg.memory.embedding_model,
-        cache_folder=cfg.loops.flame.embedder_cache_dir,
-        device=None,
-    )
+    embedder = _memory_embedder(cfg)
     vector_store = None
     if cfg.memory.enabled:
         base_memories = store.recent_memories(128)
         if base_memories:
             embedder.fit(base_memories)
         dim = getattr(embedder, "dimension", len(base_memories) or 384) or 384
-        vector_store = VectorStore(
-            cfg.memory.db_path,
-            max(32, dim),
-            factory=cfg.memory.vector_factory,
-            metric=cfg.memory.vector_metric,
-            normalize=cfg.memory.normalize_embeddings,
-        )
+        vector_store = _build_vector_store(cfg, embedder, dim)
         store.attach_semantic_hook(embedder.embed, vector_store)
-    retr = Retriever(store, embedder, vector_store, k=cfg.memory.k)
-    vocab = build_vocab_from_mem(store.recent_memories(256), min_freq=2)
+    retr = Retriever(
+        store,
+        embedder,
+        vector_store,
+        k=cfg.memory.k,
+        half_life_days=cfg.memory.recency_half_life_days,
+    )
+    vocab = store.vocabulary(min_freq=2)
     loop_cfg = _loop_config(cfg)
     loops = Loops(loop_cfg, vocab)
     agent = WitnessAgent(tok, gen_fn, base_decode, loops, store, retr, template_manager=None)
@@ -747,3 +944,92 @@ def run_upgrade(config_path: str, trigger: str = "manual"):
         console.print(f"[upgrade] patch tại {path}. Dùng witness-forge patch-apply --path {path} để áp dụng.")
     else:
         console.print(f"[upgrade] unsupported trigger={trigger}")
+
+
+def _read_queries(path: str) -> List[dict]:
+    """Parse a JSONL file of {"query": ...} objects (or bare JSON strings)."""
+    items: List[dict] = []
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            payload = json.loads(line)
+            if isinstance(payload, str):
+                payload = {"query": payload}
+            items.append(payload)
+    return items
+
+
+def run_mem_search(config_path: str, queries_path: str, *, k: Optional[int] = None, batch_size: int = 256) -> None:
+    """Batch retrieval over the memory store; writes one NDJSON line per query to stdout."""
+    cfg = ConfigManager(config_path).config
+    if k:
+        cfg.memory.k = k
+    store = MemoryStore(cfg.memory.db_path)
+    retriever = _build_retriever(cfg, store)
+    items = _read_queries(queries_path)
+    try:
+        for start in range(0, len(items), max(1, batch_size)):
+            chunk = items[start : start + batch_size]
+            queries = [str(item.get("query", item.get("text", ""))) for item in chunk]
+            for item, query, matches in zip(chunk, queries, retriever.search_many(queries)):
+                record = {key: value for key, value in item.items() if key not in {"query", "text"}}
+                record["query"] = query
+                record["results"] = [{"text": text, "score": score} for text, score in matches]
+                sys.stdout.write(to_line(record) + "\n")
+    finally:
+        if retriever.vector_store is not None:
+            retriever.vector_store.close()
+        store.close()
+
+
+def run_mem_maintain(config_path: str, *, budget: float = 0.0, full_vacuum: bool = False) -> None:
+    """One maintenance pass over the memory DB (prune, compact, VACUUM, ANALYZE, graph save)."""
+    cfg = ConfigManager(config_path).config
+    store = MemoryStore(cfg.memory.db_path)
+    retriever = _build_retriever(cfg, store)
+    graph = (
+        GraphMemory(cfg.graph.path, flush_interval=cfg.graph.flush_interval, compact_every=cfg.graph.compact_every)
+        if cfg.graph.enabled
+        else None
+    )
+    knn_graph = _build_knn_graph(cfg, retriever.vector_store)
+    maintenance = _build_maintenance(cfg, store, retriever.vector_store, graph, knn_graph)
+    try:
+        report = maintenance.run_slice(budget)
+        if full_vacuum:
+            reclaimed = maintenance.vacuum_full()
+            console.print(f"[mem] full VACUUM reclaimed {reclaimed} bytes")
+    finally:
+        if retriever.vector_store is not None:
+            retriever.vector_store.close()
+        store.close()
+    console.print(
+        f"[mem] pruned={report.pruned} compacted={report.compacted} knn_nodes={report.knn_nodes} "
+        f"vacuumed_pages={report.vacuumed_pages} analyzed={report.analyzed} "
+        f"graph_saved={report.graph_saved} completed={report.completed} ({report.elapsed:.2f}s)"
+    )
+
+
+def run_db_migrate(config_path: str, *, dry_run: bool = False) -> None:
+    """Upgrade the memory database schema in place."""
+    cfg = ConfigManager(config_path).config
+    db_path = Path(cfg.memory.db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        current = schema_version(conn)
+        pending = pending_migrations(conn)
+        console.print(f"[db] {db_path}: schema v{current} (mới nhất v{SCHEMA_VERSION})")
+        if not pending:
+            console.print("[db] không có migration nào cần chạy.")
+            return
+        for migration in pending:
+            console.print(f"[db] v{migration.version}: {migration.name}")
+        if dry_run:
+            return
+        applied = migrate(conn)
+        console.print(f"[db] đã áp dụng {len(applied)} migration, schema v{schema_version(conn)}")
+    finally:
+        conn.close()
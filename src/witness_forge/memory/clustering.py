@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# Rows assigned per matmul; keeps the (rows x k) distance block small.
+_ASSIGN_BLOCK = 65536
+
+
+class MiniBatchKMeans:
+    """
+    NumPy mini-batch k-means (per-centre learning rate ``1 / count``) whose
+    centroids keep learning as rows arrive, via ``partial_fit``.
+
+    The cluster of every row seen so far is cached by vector row id, so cluster
+    views and coarse routing (``route``) never re-run k-means. The model saves
+    to and loads from a single ``.npz`` file.
+    """
+
+    def __init__(self, k: int, dim: int, *, batch_size: int = 256, iterations: int = 100, seed: int = 0):
+        self.k = k
+        self.dim = dim
+        self.batch_size = batch_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # Row ids (ascending) and their cluster.
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.labels = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def fitted(self) -> bool:
+        return len(self.centroids) > 0
+
+    def fit(self, matrix: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Train from scratch on ``matrix`` and cache the cluster of every row."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        self.centroids = self._init_centroids(matrix, rng)
+        self.counts = np.zeros(len(self.centroids), dtype=np.int64)
+        if len(matrix) > len(self.centroids):
+            batch = min(self.batch_size, len(matrix))
+            for _ in range(self.iterations):
+                self._update(matrix[rng.choice(len(matrix), batch, replace=False)])
+        labels = self.assign(matrix)
+        order = np.argsort(ids, kind="stable")
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.labels = labels[order]
+        return labels
+
+    def partial_fit(self, matrix: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Move the centroids towards new rows and cache their clusters."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if not len(matrix):
+            return np.zeros(0, dtype=np.int32)
+        labels = self._update(matrix)
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) and len(ids) and ids.min() <= self.ids[-1]:
+            keep = ~np.isin(self.ids, ids)
+            merged_ids = np.concatenate([self.ids[keep], ids])
+            merged = np.concatenate([self.labels[keep], labels])
+            order = np.argsort(merged_ids, kind="stable")
+            self.ids, self.labels = merged_ids[order], merged[order]
+        else:
+            order = np.argsort(ids, kind="stable")
+            self.ids = np.concatenate([self.ids, ids[order]])
+            self.labels = np.concatenate([self.labels, labels[order]])
+        return labels
+
+    def _init_centroids(self, matrix: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        # k-means++ seeding on a bounded sample.
+        k = min(self.k, len(matrix))
+        sample = matrix[rng.choice(len(matrix), min(len(matrix), 64 * k), replace=False)]
+        chosen = [int(rng.integers(len(sample)))]
+        closest = ((sample - sample[chosen[0]]) ** 2).sum(axis=1)
+        for _ in range(1, k):
+            total = closest.sum()
+            pick = int(rng.choice(len(sample), p=closest / total)) if total > 0 else int(rng.integers(len(sample)))
+            chosen.append(pick)
+            closest = np.minimum(closest, ((sample - sample[pick]) ** 2).sum(axis=1))
+        return sample[chosen].copy()
+
+    def _update(self, batch: np.ndarray) -> np.ndarray:
+        labels = self.assign(batch)
+        for label in np.unique(labels):
+            members = batch[labels == label]
+            self.counts[label] += len(members)
+            rate = len(members) / self.counts[label]
+            self.centroids[label] += rate * (members.mean(axis=0) - self.centroids[label])
+        return labels
+
+    def assign(self, matrix: np.ndarray) -> np.ndarray:
+        """Nearest centroid (squared L2) of each row."""
+        return self.route(matrix, 1)[:, 0] if len(matrix) else np.zeros(0, dtype=np.int32)
+
+    def route(self, queries: np.ndarray, nprobe: int = 1) -> np.ndarray:
+        """The ``nprobe`` nearest clusters of each query, nearest first."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        half_norms = 0.5 * (self.centroids**2).sum(axis=1)
+        out = np.zeros((len(queries), nprobe), dtype=np.int32)
+        for start in range(0, len(queries), _ASSIGN_BLOCK):
+            # argmin |q - c|^2  ==  argmax q.c - |c|^2 / 2
+            scores = queries[start : start + _ASSIGN_BLOCK] @ self.centroids.T - half_norms
+            if nprobe < scores.shape[1]:
+                top = np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+            out[start : start + len(scores)] = np.take_along_axis(top, order, axis=1)
+        return out
+
+    def labels_for(self, ids: np.ndarray) -> np.ndarray:
+        """Cached cluster of each row id; -1 for rows never seen."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int32)
+        pos = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(self.ids[pos] == ids, self.labels[pos], -1).astype(np.int32)
+
+    def prune(self, live_ids: np.ndarray) -> None:
+        """Forget cached rows that are no longer in ``live_ids``."""
+        keep = np.isin(self.ids, live_ids)
+        if not keep.all():
+            self.ids, self.labels = self.ids[keep], self.labels[keep]
+
+    def save(self, path: str) -> None:
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "wb") as handle:
+            np.savez(
+                handle,
+                k=np.int64(self.k),
+                centroids=self.centroids,
+                counts=self.counts,
+                ids=self.ids,
+                labels=self.labels,
+            )
+        os.replace(tmp, target)
+
+    @classmethod
+    def load(cls, path: str, dim: int, **kwargs) -> Optional["MiniBatchKMeans"]:
+        """The saved model, or None when missing, unreadable or for another dimension."""
+        try:
+            with np.load(path) as data:
+                arrays: Dict[str, np.ndarray] = {name: data[name] for name in data.files}
+        except Exception:
+            return None
+        centroids = arrays.get("centroids")
+        if centroids is None or centroids.ndim != 2 or centroids.shape[1] != dim:
+            return None
+        model = cls(int(arrays["k"]), dim, **kwargs)
+        model.centroids = centroids.astype(np.float32)
+        model.counts = arrays["counts"].astype(np.int64)
+        model.ids = arrays["ids"].astype(np.int64)
+        model.labels = arrays["labels"].astype(np.int32)
+        return model
+
+
+__all__ = ["MiniBatchKMeans"]
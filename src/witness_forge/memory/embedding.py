@@ -1,20 +1,22 @@
 from __future__ import annotations
 
+import hashlib
+import re
+import weakref
+import zlib
 from dataclasses import dataclass, field
 from typing import Iterable, List, Optional, Sequence
 
 import numpy as np
 
+from .embedding_cache import EmbeddingCache
+from .model_registry import ModelRegistry, shared_registry
+
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
 except ImportError:  # pragma: no cover - optional dependency
     TfidfVectorizer = None
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:  # pragma: no cover - optional dependency
-    SentenceTransformer = None
-
 
 def _tokenize(text: str) -> List[str]:
     return [tok for tok in text.lower().split() if tok]
@@ -42,6 +44,16 @@ class BaseEmbedder:
     def dimension(self) -> int:  # pragma: no cover - interface
         raise NotImplementedError
 
+    @property
+    def model_id(self) -> str:
+        """Identifies the vector space; vectors with different ids are not comparable."""
+        return f"{type(self).__name__}:{self.dimension}"
+
+
+def _vocab_fingerprint(tokens: Iterable[str]) -> str:
+    digest = hashlib.sha1("\n".join(tokens).encode("utf-8")).hexdigest()
+    return digest[:12]
+
 
 class TfidfEmbedder(BaseEmbedder):
     def __init__(self, min_df: int = 1, max_features: int | None = 4096):
@@ -67,18 +79,28 @@ class TfidfEmbedder(BaseEmbedder):
     def dimension(self) -> int:
         return len(self.vectorizer.get_feature_names_out())
 
+    @property
+    def model_id(self) -> str:
+        return f"tfidf:{_vocab_fingerprint(self.vectorizer.get_feature_names_out())}"
+
 
 class HFEmbedder(BaseEmbedder):
     """
     SentenceTransformer-backed embedder (HuggingFace checkpoints).
     """
 
-    def __init__(self, model_name: str, cache_folder: Optional[str] = None, device: Optional[str] = None):
-        if SentenceTransformer is None:
-            raise RuntimeError("sentence-transformers is required for HF embeddings.")
+    def __init__(
+        self,
+        model_name: str,
+        cache_folder: Optional[str] = None,
+        device: Optional[str] = None,
+        *,
+        registry: Optional[ModelRegistry] = None,
+    ):
         self.model_name = model_name
-        resolved_device = device or "cpu"
-        self.model = SentenceTransformer(model_name, device=resolved_device, cache_folder=cache_folder)
+        # One resident copy per (model, device, dtype), shared with FlameCore and later reloads.
+        self.model = (registry or shared_registry()).acquire(model_name, device=device, cache_folder=cache_folder)
+        weakref.finalize(self, self.model.release)
         self._dimension = self.model.get_sentence_embedding_dimension()
 
     def fit(self, texts: Sequence[str]) -> None:
@@ -104,6 +126,10 @@ class HFEmbedder(BaseEmbedder):
     def dimension(self) -> int:
         return self._dimension
 
+    @property
+    def model_id(self) -> str:
+        return f"hf:{self.model_name}"
+
 
 class SimpleEmbedder(BaseEmbedder):
     """
@@ -134,6 +160,122 @@ class SimpleEmbedder(BaseEmbedder):
     def dimension(self) -> int:
         return len(self.vocab.mapping)
 
+    @property
+    def model_id(self) -> str:
+        return f"simple:{_vocab_fingerprint(self.vocab.mapping)}"
+
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder(BaseEmbedder):
+    """
+    Signed feature hashing of word uni/bigrams and character n-grams into a fixed
+    ``dim``. Needs no fitting, so vectors stay comparable across runs and the
+    vector store never has to be rebuilt. Feature ids are CRC32 (stable across
+    processes, unlike ``hash``); the sign bit halves collision bias. Rows are
+    accumulated with one ``bincount`` over all features, i.e. O(nnz).
+    """
+
+    def __init__(
+        self,
+        dim: int = 1024,
+        *,
+        char_ngrams: tuple[int, int] = (3, 5),
+        char_weight: float = 0.5,
+    ):
+        if dim <= 0:
+            raise ValueError("HashingEmbedder dim must be positive")
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.char_weight = char_weight
+
+    def fit(self, texts: Sequence[str]) -> None:
+        return None
+
+    def _features(self, text: str) -> tuple[List[str], int]:
+        """Feature strings for ``text`` and how many of them (the leading ones) are word features."""
+        words = _WORD.findall(text.lower())
+        features = ["w:" + word for word in words]
+        features += ["b:" + a + " " + b for a, b in zip(words, words[1:])]
+        n_words = len(features)
+        lo, hi = self.char_ngrams
+        for word in words:
+            padded = f" {word} "
+            for n in range(lo, hi + 1):
+                features.extend("c:" + padded[i : i + n] for i in range(len(padded) - n + 1))
+        return features, n_words
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        features: List[str] = []
+        rows: List[int] = []
+        weights: List[float] = []
+        for row, text in enumerate(texts):
+            feats, n_words = self._features(text)
+            features.extend(feats)
+            rows.extend([row] * len(feats))
+            weights.extend([1.0] * n_words + [self.char_weight] * (len(feats) - n_words))
+        if not features:
+            return np.zeros((len(texts), self.dim), dtype=np.float32)
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        cols = (hashes & 0x7FFFFFFF) % self.dim
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + cols
+        matrix = np.bincount(flat, weights=signs * np.asarray(weights), minlength=len(texts) * self.dim)
+        matrix = matrix.reshape(len(texts), self.dim).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    @property
+    def dimension(self) -> int:
+        return self.dim
+
+    @property
+    def model_id(self) -> str:
+        lo, hi = self.char_ngrams
+        return f"hashing:crc32:{self.dim}:c{lo}-{hi}:{self.char_weight:g}"
+
+
+class CachedEmbedder(BaseEmbedder):
+    """
+    Wraps an embedder with an ``EmbeddingCache`` keyed by model id + text hash,
+    so texts embedded before (memory anchors, repeated queries) skip the encoder.
+    Refitting changes the model id of vocabulary-based embedders, which
+    naturally retires their old entries.
+    """
+
+    def __init__(self, inner: BaseEmbedder, cache: Optional[EmbeddingCache] = None):
+        self.inner = inner
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self._model_id = inner.model_id
+
+    def fit(self, texts: Sequence[str]) -> None:
+        self.inner.fit(texts)
+        self._model_id = self.inner.model_id
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return self.inner.embed(texts)
+        vectors = self.cache.embed(self._model_id, list(texts), self.inner.embed)
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    @property
+    def dimension(self) -> int:
+        return self.inner.dimension
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def __getattr__(self, name: str):
+        # Embedder-specific extras (vocab, model_name, ...) come from the wrapped instance.
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
 
 def build_embedder(
     kind: str = "tfidf",
@@ -141,12 +283,35 @@ def build_embedder(
     *,
     cache_folder: Optional[str] = None,
     device: Optional[str] = None,
+    cache: Optional[EmbeddingCache] = None,
+    dim: int = 1024,
+    onnx_options: Optional[dict] = None,
 ) -> BaseEmbedder:
+    embedder = _build_embedder(
+        kind, model_name, cache_folder=cache_folder, device=device, dim=dim, onnx_options=onnx_options
+    )
+    return CachedEmbedder(embedder, cache) if cache is not None else embedder
+
+
+def _build_embedder(
+    kind: str,
+    model_name: Optional[str],
+    *,
+    cache_folder: Optional[str],
+    device: Optional[str],
+    dim: int,
+    onnx_options: Optional[dict] = None,
+) -> BaseEmbedder:
+    if kind == "hashing":
+        return HashingEmbedder(dim)
     if kind in {"hf", "sentence-transformers"}:
         target = model_name or "sentence-transformers/all-MiniLM-L6-v2"
-        if SentenceTransformer is None:
-            raise RuntimeError("sentence-transformers chưa được cài để dùng embedder HF.")
         return HFEmbedder(target, cache_folder=cache_folder, device=device)
+    if kind == "onnx":
+        from .onnx_embedder import OnnxEmbedder  # imports this module
+
+        target = model_name or "sentence-transformers/all-MiniLM-L6-v2"
+        return OnnxEmbedder(target, cache_folder=cache_folder, **(onnx_options or {}))
     if kind == "tfidf":
         if TfidfVectorizer is not None:
             return TfidfEmbedder()
@@ -157,6 +322,8 @@ def build_embedder(
 __all__ = [
     "build_embedder",
     "BaseEmbedder",
+    "CachedEmbedder",
+    "HashingEmbedder",
     "TfidfEmbedder",
     "HFEmbedder",
     "SimpleEmbedder",
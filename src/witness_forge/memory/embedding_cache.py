@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def text_key(text: str) -> bytes:
+    """Content address of ``text``: 16 bytes of BLAKE2b over its UTF-8 encoding."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model id, text hash).
+
+    The first tier is an in-memory LRU of ``maxsize`` vectors. With ``path`` set,
+    misses fall through to an SQLite table that survives restarts; it keeps the
+    newest ``disk_max_rows`` vectors. Cached vectors are read-only float32 rows.
+    """
+
+    def __init__(self, maxsize: int = 4096, path: Optional[str] = None, *, disk_max_rows: int = 200_000):
+        self.maxsize = maxsize
+        self.path = path
+        self.disk_max_rows = disk_max_rows
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_writes = 0
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache("
+                "id INTEGER PRIMARY KEY, model TEXT NOT NULL, hash BLOB NOT NULL, vec BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_embedding_cache_key ON embedding_cache(model, hash)"
+            )
+            self._conn.commit()
+
+    def embed(
+        self,
+        model_id: str,
+        texts: Sequence[str],
+        compute: Callable[[List[str]], np.ndarray],
+    ) -> List[np.ndarray]:
+        """Vectors for ``texts``; only texts seen by neither tier are passed to ``compute`` (once each)."""
+        keys = [text_key(text) for text in texts]
+        found = self._lookup(model_id, keys)
+        missing: Dict[bytes, int] = {}
+        for i, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = i
+        if missing:
+            computed = np.asarray(compute([texts[i] for i in missing.values()]), dtype=np.float32)
+            fresh = {key: self._freeze(row) for key, row in zip(missing, computed)}
+            self._store(model_id, fresh)
+            found.update(fresh)
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        return [found[key] for key in keys]
+
+    def _lookup(self, model_id: str, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get((model_id, key))
+                if vector is not None:
+                    self._memory.move_to_end((model_id, key))
+                    found[key] = vector
+            cold = list(dict.fromkeys(key for key in keys if key not in found))
+            if self._conn is None or not cold:
+                return found
+            for start in range(0, len(cold), 500):
+                chunk = cold[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM embedding_cache WHERE model=? AND hash IN ({marks})",
+                    (model_id, *chunk),
+                ).fetchall()
+                for key, blob in rows:
+                    vector = self._freeze(np.frombuffer(blob, dtype=np.float32))
+                    found[bytes(key)] = vector
+                    self._remember(model_id, bytes(key), vector)
+        return found
+
+    def _store(self, model_id: str, vectors: Dict[bytes, np.ndarray]) -> None:
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(model_id, key, vector)
+            if self._conn is None:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache(model, hash, vec) VALUES(?,?,?)",
+                    [(model_id, key, vector.tobytes()) for key, vector in vectors.items()],
+                )
+                self._disk_writes += len(vectors)
+                if self.disk_max_rows > 0 and self._disk_writes >= 1024:
+                    # Ids grow with insertion, so this keeps the newest rows.
+                    self._disk_writes = 0
+                    self._conn.execute(
+                        "DELETE FROM embedding_cache WHERE id <= (SELECT MAX(id) FROM embedding_cache) - ?",
+                        (self.disk_max_rows,),
+                    )
+
+    def _remember(self, model_id: str, key: bytes, vector: np.ndarray) -> None:
+        if self.maxsize <= 0:
+            return
+        self._memory[(model_id, key)] = vector
+        self._memory.move_to_end((model_id, key))
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    @staticmethod
+    def _freeze(row: np.ndarray) -> np.ndarray:
+        vector = np.array(row, dtype=np.float32)
+        vector.setflags(write=False)
+        return vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM embedding_cache")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._memory)}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+__all__ = ["EmbeddingCache", "text_key"]
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .embedding import BaseEmbedder, build_embedder
+
+# Control messages on the request queue: (op, request_id, payload).
+_EMBED, _FIT, _STOP = "embed", "fit", "stop"
+
+
+def _describe(embedder: BaseEmbedder) -> tuple:
+    # Vocabulary embedders have no dimension until fitted.
+    try:
+        return embedder.dimension, embedder.model_id
+    except Exception:
+        return 0, f"{type(embedder).__name__}:unfitted"
+
+
+def _serve(spec: Dict[str, Any], requests, responses, max_batch: int, window: float) -> None:
+    """Worker process: coalesce embed requests arriving within ``window`` into one encoder call."""
+    try:
+        embedder = build_embedder(**spec)
+    except Exception as exc:
+        responses.put(("error", 0, f"{type(exc).__name__}: {exc}"))
+        return
+    responses.put(("ready", 0, _describe(embedder)))
+    carry = None
+    while True:
+        op, request_id, payload = carry if carry is not None else requests.get()
+        carry = None
+        if op == _STOP:
+            return
+        if op == _FIT:
+            try:
+                embedder.fit(payload)
+                responses.put(("fitted", request_id, _describe(embedder)))
+            except Exception as exc:
+                responses.put(("error", request_id, f"{type(exc).__name__}: {exc}"))
+            continue
+        batch = [(request_id, payload)]
+        size = len(payload)
+        deadline = time.monotonic() + window
+        while size < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if message[0] != _EMBED:
+                carry = message  # fit/stop must see every earlier embed answered first
+                break
+            batch.append((message[1], message[2]))
+            size += len(message[2])
+        texts = [text for _, chunk in batch for text in chunk]
+        try:
+            matrix = np.ascontiguousarray(embedder.embed(texts), dtype=np.float32)
+        except Exception as exc:
+            for rid, _ in batch:
+                responses.put(("error", rid, f"{type(exc).__name__}: {exc}"))
+            continue
+        start = 0
+        for rid, chunk in batch:
+            rows = matrix[start : start + len(chunk)]
+            start += len(chunk)
+            responses.put(("vectors", rid, (rows.shape, rows.tobytes())))
+
+
+class _Pending:
+    __slots__ = ("event", "kind", "value")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.kind = ""
+        self.value: Any = None
+
+
+class EmbeddingService(BaseEmbedder):
+    """
+    Embeds in a separate process so encoder work stays off the chat process's GIL.
+
+    Requests from concurrent callers (chat thread, retrieval channels, maintenance)
+    that arrive within ``window`` seconds are coalesced into one batch of up to
+    ``max_batch`` texts. At most ``max_pending`` requests are in flight; callers
+    wait up to ``timeout`` for a slot or an answer and then embed synchronously
+    in-process instead, as they also do once the worker has died.
+    Vectors travel as raw float32 bytes over the result queue.
+    """
+
+    def __init__(
+        self,
+        kind: str = "tfidf",
+        model_name: Optional[str] = None,
+        *,
+        cache_folder: Optional[str] = None,
+        device: Optional[str] = None,
+        dim: int = 1024,
+        onnx_options: Optional[Dict[str, Any]] = None,
+        max_batch: int = 64,
+        window: float = 0.005,
+        max_pending: int = 256,
+        timeout: float = 30.0,
+        start_timeout: float = 120.0,
+    ):
+        self.spec: Dict[str, Any] = {
+            "kind": kind,
+            "model_name": model_name,
+            "cache_folder": cache_folder,
+            "device": device,
+            "dim": dim,
+            "onnx_options": onnx_options,
+        }
+        self.timeout = timeout
+        self.fallbacks = 0
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, _Pending] = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._local: Optional[BaseEmbedder] = None
+        self._local_lock = threading.Lock()
+        self._fit_texts: Optional[List[str]] = None
+        self._closed = False
+        # spawn: forking a process that already runs threads (flushers, pools) is unsafe.
+        ctx = mp.get_context("spawn")
+        self._requests = ctx.Queue()
+        self._responses = ctx.Queue()
+        self._process = ctx.Process(
+            target=_serve,
+            args=(self.spec, self._requests, self._responses, max(1, max_batch), window),
+            name="embedding-service",
+            daemon=True,
+        )
+        self._process.start()
+        kind_, payload = "error", "worker exited during startup"
+        deadline = time.monotonic() + start_timeout
+        while time.monotonic() < deadline:
+            try:
+                kind_, _, payload = self._responses.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if not self._process.is_alive():
+                    break
+        else:
+            payload = "timed out waiting for the worker"
+        if kind_ != "ready":
+            self._process.terminate()
+            self._process.join(5)
+            raise RuntimeError(f"Embedding service failed to start: {payload}")
+        self._dimension, self._model_id = payload
+        self._receiver = threading.Thread(target=self._receive, name="embedding-service-results", daemon=True)
+        self._receiver.start()
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                kind, request_id, payload = self._responses.get(timeout=1.0)
+            except queue.Empty:
+                if self._closed or not self._process.is_alive():
+                    self._fail_all("embedding service stopped")
+                    return
+                continue
+            except (EOFError, OSError):
+                self._fail_all("embedding service stopped")
+                return
+            with self._lock:
+                pending = self._pending.pop(request_id, None)
+            if pending is not None:
+                pending.kind, pending.value = kind, payload
+                pending.event.set()
+
+    def _fail_all(self, reason: str) -> None:
+        with self._lock:
+            waiting, self._pending = self._pending, {}
+        for pending in waiting.values():
+            pending.kind, pending.value = "error", reason
+            pending.event.set()
+
+    @property
+    def alive(self) -> bool:
+        return not self._closed and self._process.is_alive()
+
+    def _call(self, op: str, payload: Any) -> Optional[_Pending]:
+        """Send one request and wait for its answer; None means "use the local fallback"."""
+        if not self.alive or not self._slots.acquire(timeout=self.timeout):
+            return None
+        try:
+            request_id = next(self._ids)
+            pending = _Pending()
+            with self._lock:
+                self._pending[request_id] = pending
+            self._requests.put((op, request_id, payload))
+            if not pending.event.wait(self.timeout):
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                return None
+            if pending.kind == "error" and not self.alive:
+                return None
+            return pending
+        finally:
+            self._slots.release()
+
+    def fit(self, texts: Sequence[str]) -> None:
+        self._fit_texts = list(texts)
+        if self._local is not None:
+            self._local.fit(self._fit_texts)
+        pending = self._call(_FIT, self._fit_texts)
+        if pending is None:
+            local = self._fallback()
+            self._dimension, self._model_id = local.dimension, local.model_id
+            return
+        if pending.kind == "error":
+            raise RuntimeError(pending.value)
+        self._dimension, self._model_id = pending.value
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self._dimension), dtype=np.float32)
+        pending = self._call(_EMBED, list(texts))
+        if pending is None:
+            return self._fallback().embed(texts)
+        if pending.kind == "error":
+            raise RuntimeError(pending.value)
+        shape, data = pending.value
+        return np.frombuffer(data, dtype=np.float32).reshape(shape).copy()
+
+    def _fallback(self) -> BaseEmbedder:
+        with self._local_lock:
+            self.fallbacks += 1
+            if self._local is None:
+                local = build_embedder(**self.spec)
+                if self._fit_texts is not None:
+                    local.fit(self._fit_texts)
+                self._local = local
+            return self._local
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    @property
+    def model_id(self) -> str:
+        return self._model_id
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._process.is_alive():
+            self._requests.put((_STOP, 0, None))
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+        self._fail_all("embedding service closed")
+
+
+__all__ = ["EmbeddingService"]
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import atexit
+import json
+import os
+import threading
 import time
+import weakref
+from collections import Counter
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 import networkx as nx
 
@@ -12,57 +18,203 @@ class GraphMemory:
     Simple graph-based memory using networkx.
     Nodes: id, text
     Edges: relation between texts/entities
+
+    Persistence is a node-link JSON snapshot plus an append-only journal
+    (``<path>.journal``, one JSON op per line), so ``save`` writes only the
+    changes since the last save. Adds flush at most every ``flush_interval``
+    seconds; once the journal holds ``compact_every`` ops (or as many as the
+    graph has nodes) it is folded into a new snapshot written to a temp file
+    and renamed into place. Replaying ops is idempotent and a torn last line is
+    dropped, so a crash loses at most the unflushed adds. The graph is loaded
+    on first use.
     """
 
-    def __init__(self, path: str = "./witness_graph.json"):
+    def __init__(self, path: str = "./witness_graph.json", *, flush_interval: float = 5.0, compact_every: int = 1000):
         self.path = Path(path)
-        self.graph = nx.Graph()
-        if self.path.exists():
-            self._load()
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self._graph: Optional[nx.Graph] = None
+        # Inverted indexes over lowercased node text: token -> {node: tf} for overlap
+        # scoring, and trigram -> nodes to find substring matches without a scan.
+        self._tokens: Dict[str, Dict[str, int]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._lower: Dict[str, str] = {}
+        self._order: Dict[str, int] = {}
+        # Unsaved changes since the last save/load.
+        self.dirty = False
+        # Bumped whenever the node set changes; retrieval caches key on it.
+        self.version = 0
+        self._pending: List[dict] = []
+        self._journal_ops = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+        atexit.register(_save_at_exit, weakref.ref(self))
+
+    @property
+    def graph(self) -> nx.Graph:
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._load()
+        return self._graph
 
     def add(self, text: str, related_to: List[str] | None = None) -> str:
-        node_id = f"g{int(time.time()*1000)}_{len(self.graph)}"
-        self.graph.add_node(node_id, text=text)
-        for rel in related_to or []:
-            if self.graph.has_node(rel):
-                self.graph.add_edge(node_id, rel)
+        with self._lock:
+            graph = self.graph
+            node_id = f"g{int(time.time()*1000)}_{len(graph)}"
+            graph.add_node(node_id, text=text)
+            self._index(node_id, text)
+            self._pending.append({"op": "node", "id": node_id, "text": text})
+            for rel in related_to or []:
+                if graph.has_node(rel):
+                    graph.add_edge(node_id, rel)
+                    self._pending.append({"op": "edge", "a": node_id, "b": rel})
+            self.dirty = True
+            self.version += 1
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.save()
         return node_id
 
     def search(self, query: str, top_k: int = 6) -> List[Tuple[str, float]]:
-        scores: List[Tuple[str, float]] = []
+        self.graph  # loads on first use
         q_lower = query.lower()
+        q_tokens = q_lower.split()
+        # add() may run on another thread (retrieval pool): read postings under the lock.
+        with self._lock:
+            if len(q_lower) < 3:
+                # Too short for trigrams (and "" matches everything): score every node.
+                candidates = list(self._lower)
+                substring = set(candidates)
+            else:
+                substring = self._substring_candidates(q_lower)
+                candidates = set(substring)
+                for token in set(q_tokens):
+                    candidates.update(self._tokens.get(token, ()))
+            scores: List[Tuple[int, str, float]] = []
+            unique = set(q_tokens)
+            for node_id in candidates:
+                text = self._lower[node_id]
+                if node_id in substring and q_lower in text:
+                    score = 1.0
+                else:
+                    shared = sum(1 for token in unique if node_id in self._tokens.get(token, ()))
+                    score = shared / max(1, len(q_tokens))
+                if score > 0:
+                    scores.append((self._order[node_id], node_id, score))
+            # Best score first; ties keep insertion order, as the old full scan did.
+            scores.sort(key=lambda item: (-item[2], item[0]))
+            nodes = self.graph.nodes
+            return [(nodes[node_id]["text"], score) for _, node_id, score in scores[:top_k]]
+
+    def _substring_candidates(self, q_lower: str) -> Set[str]:
+        postings = []
+        for gram in {q_lower[i : i + 3] for i in range(len(q_lower) - 2)}:
+            nodes = self._trigrams.get(gram)
+            if not nodes:
+                return set()
+            postings.append(nodes)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for nodes in postings[1:]:
+            result &= nodes
+            if not result:
+                break
+        return result
+
+    def _index(self, node_id: str, text: str) -> None:
+        if not text:
+            return
+        lower = text.lower()
+        self._lower[node_id] = lower
+        self._order[node_id] = len(self._order)
+        for token, count in Counter(lower.split()).items():
+            self._tokens.setdefault(token, {})[node_id] = count
+        for gram in {lower[i : i + 3] for i in range(len(lower) - 2)}:
+            self._trigrams.setdefault(gram, set()).add(node_id)
+
+    def _rebuild_index(self) -> None:
+        self._tokens, self._trigrams, self._lower, self._order = {}, {}, {}, {}
         for node_id, data in self.graph.nodes(data=True):
-            text = data.get("text", "")
-            if not text:
-                continue
-            score = self._score_text(q_lower, text.lower())
-            if score > 0:
-                scores.append((text, score))
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_k]
-
-    def _score_text(self, query: str, text: str) -> float:
-        if query in text:
-            return 1.0
-        overlap = len(set(query.split()) & set(text.split()))
-        return overlap / max(1, len(query.split()))
+            self._index(node_id, data.get("text", ""))
 
     def save(self) -> None:
-        data = nx.readwrite.json_graph.node_link_data(self.graph, edges="edges")
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(__import__("json").dumps(data), encoding="utf-8")
+        """Append unsaved changes to the journal; compacts into the snapshot when it grows large."""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._graph is None:
+                return  # never loaded, so nothing changed
+            if self._pending:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.journal_path, "a", encoding="utf-8") as handle:
+                    handle.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in self._pending))
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                self._journal_ops += len(self._pending)
+                self._pending = []
+            if self._journal_ops >= max(self.compact_every, len(self._graph)) or not self.path.exists():
+                self.compact()
+            self.dirty = False
+
+    def compact(self) -> None:
+        """Write a fresh snapshot (temp file + atomic rename) and empty the journal."""
+        with self._lock:
+            graph = self.graph
+            data = nx.readwrite.json_graph.node_link_data(graph, edges="edges")
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as handle:
+                handle.write(json.dumps(data))
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp, self.path)
+            # A crash before this truncation only means the ops are replayed (idempotently).
+            with open(self.journal_path, "w", encoding="utf-8"):
+                pass
+            self._journal_ops = 0
 
     def _load(self) -> None:
         try:
-            payload = self.path.read_text(encoding="utf-8")
-            data = __import__("json").loads(payload or "{}")
+            payload = self.path.read_text(encoding="utf-8") if self.path.exists() else ""
+            data = json.loads(payload or "{}")
             try:
-                self.graph = nx.readwrite.json_graph.node_link_graph(data, edges="edges")
+                self._graph = nx.readwrite.json_graph.node_link_graph(data, edges="edges")
             except Exception:
                 # Fallback to default key if edges param missing in legacy file
-                self.graph = nx.readwrite.json_graph.node_link_graph(data)
+                self._graph = nx.readwrite.json_graph.node_link_graph(data)
+        except Exception:
+            self._graph = nx.Graph()
+        self._replay_journal()
+        self._rebuild_index()
+
+    def _replay_journal(self) -> None:
+        if not self.journal_path.exists():
+            return
+        raw = self.journal_path.read_bytes()
+        complete = raw[: raw.rfind(b"\n") + 1]
+        if len(complete) != len(raw):
+            # Torn final write: drop it so the next append starts on a clean line.
+            with open(self.journal_path, "r+b") as handle:
+                handle.truncate(len(complete))
+        for line in complete.decode("utf-8", errors="replace").splitlines():
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue
+            if op.get("op") == "node":
+                self._graph.add_node(op["id"], text=op.get("text", ""))
+            elif op.get("op") == "edge" and self._graph.has_node(op["a"]) and self._graph.has_node(op["b"]):
+                self._graph.add_edge(op["a"], op["b"])
+            self._journal_ops += 1
+
+
+def _save_at_exit(ref: "weakref.ref[GraphMemory]") -> None:
+    memory = ref()
+    if memory is not None and memory._pending:
+        try:
+            memory.save()
         except Exception:
-            self.graph = nx.Graph()
+            pass
 
 
 __all__ = ["GraphMemory"]
@@ -1,14 +1,41 @@
 from __future__ import annotations
 
-from typing import List, Optional, Tuple
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
 
 from .graph_rag import GraphMemory
-from .retrieval import Retriever
+from .knn_graph import KnnGraph
+from .rerank import Reranker
+from .retrieval import RetrievalCache, Retriever, normalize_query
+from .store import MemoryStore
+
+log = logging.getLogger(__name__)
+
+FUSION_METHODS = ("rrf", "weighted")
 
 
 class HybridRetriever:
     """
-    Combines VectorStore-based retriever with GraphMemory results.
+    Combines VectorStore-based retriever with lexical (FTS5/BM25) and GraphMemory results.
+    With a ``knn_graph`` the top ``k`` vector hits are also expanded through its
+    precomputed neighbourhoods (the ``knn`` channel).
+
+    Each channel returns up to ``candidates`` scored hits; they are fused with
+    reciprocal-rank fusion (``sum w / (rrf_k + rank)``) or a weighted sum of
+    per-channel min-max normalized scores. An optional reranker then scores
+    only the fused top ``rerank_top`` in one batch before truncating to ``k``.
+
+    With ``deadline`` (seconds) set, channels run concurrently, one pool thread
+    per channel, and only those finished by the deadline are fused. A late
+    channel keeps running; its result is used if the same query comes back, and
+    the channel is skipped while it is still busy so slow calls never pile up.
+    ``last_timings`` holds per-channel latencies of the last call (None = late).
+
+    Results are cached per normalized query until any channel's store changes
+    (or the base retriever's cache TTL passes); partial (deadline-cut) results
+    are never cached.
     """
 
     def __init__(
@@ -16,27 +43,203 @@ class HybridRetriever:
         base_retriever: Retriever,
         graph: Optional[GraphMemory] = None,
         k: int = 6,
+        lexical: Optional[MemoryStore] = None,
+        *,
+        fusion: str = "rrf",
+        weights: Optional[Mapping[str, float]] = None,
+        rrf_k: int = 60,
+        candidates: Optional[int] = None,
+        reranker: Optional[Reranker] = None,
+        rerank_top: Optional[int] = None,
+        deadline: Optional[float] = None,
+        cache_size: int = 256,
+        knn_graph: Optional[KnnGraph] = None,
     ):
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unsupported fusion: {fusion}")
         self.base = base_retriever
         self.graph = graph
+        self.knn_graph = knn_graph
         self.k = k
+        # Anything with ``search_text(query, k)``; normally the MemoryStore.
+        self.lexical = lexical
+        self.fusion = fusion
+        self.weights: Dict[str, float] = {
+            "vector": 1.0,
+            "lexical": 1.0,
+            "graph": 1.0,
+            "knn": 1.0,
+            **(weights or {}),
+        }
+        self.rrf_k = rrf_k
+        self.candidates = max(k, candidates or k)
+        self.reranker = reranker
+        self.rerank_top = max(k, rerank_top or 2 * k)
+        self.deadline = deadline if deadline and deadline > 0 else None
+        self.last_timings: Dict[str, Optional[float]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Channel name -> (query, future) for calls that missed their deadline.
+        self._late: Dict[str, Tuple[str, Future]] = {}
+        # Inherit the base retriever's expiry (set when it decays by recency).
+        self.cache = RetrievalCache(cache_size, ttl=getattr(getattr(base_retriever, "cache", None), "ttl", None))
+
+    @property
+    def generation(self) -> Optional[tuple]:
+        """Changes whenever a cached result could be stale; None when a channel cannot tell."""
+        parts = []
+        sources = (
+            (self.base, "generation"),
+            (self.lexical, "generation"),
+            (self.graph, "version"),
+            (self.knn_graph, "version"),
+        )
+        for source, attr in sources:
+            if source:
+                if not hasattr(source, attr):
+                    return None
+                parts.append(getattr(source, attr))
+        return tuple(parts)
 
     def retrieve(self, query: str) -> List[str]:
-        seen = set()
-        items: List[str] = []
+        key = (normalize_query(query), self.k)
+        generation = self.generation
+        if generation is not None:
+            cached = self.cache.get(key, generation)
+            if cached is not None:
+                return list(cached)
+        fused = self.fuse(self._channels(query))
+        if self.reranker is not None and len(fused) > 1:
+            head = [text for text, _ in fused[: self.rerank_top]]
+            fused = self.reranker.rerank(query, head) + fused[self.rerank_top :]
+        items = [text for text, _ in fused[: self.k]]
+        if generation is not None and all(timing is not None for timing in self.last_timings.values()):
+            self.cache.put(key, generation, tuple(items))
+        return items
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def _channels(self, query: str) -> Dict[str, List[Tuple[str, float]]]:
+        calls = self._channel_calls(query)
+        if self.deadline is None:
+            channels: Dict[str, List[Tuple[str, float]]] = {}
+            timings: Dict[str, Optional[float]] = {}
+            for name, call in calls.items():
+                started = time.perf_counter()
+                channels[name] = call()
+                timings[name] = time.perf_counter() - started
+            self._report(timings)
+            return channels
+        return self._run_concurrently(query, calls)
+
+    def _channel_calls(self, query: str) -> Dict[str, Callable[[], List[Tuple[str, float]]]]:
+        n = self.candidates
+        calls: Dict[str, Callable[[], List[Tuple[str, float]]]] = {}
         if self.base:
-            for item in self.base.retrieve(query)[: self.k]:
-                if item not in seen:
-                    items.append(item)
-                    seen.add(item)
+            calls["vector"] = lambda: self._vector_hits(query, n)
+        if self.lexical is not None and query.strip():
+            calls["lexical"] = lambda: self.lexical.search_text(query, n)
         if self.graph:
-            for text, _score in self.graph.search(query, top_k=self.k):
-                if text not in seen:
-                    items.append(text)
-                    seen.add(text)
-        return items[: self.k]
+            calls["graph"] = lambda: self.graph.search(query, top_k=n)
+        if self.knn_graph is not None and hasattr(self.base, "search_ids") and query.strip():
+            calls["knn"] = lambda: self._knn_hits(query, n)
+        return calls
+
+    def _knn_hits(self, query: str, n: int) -> List[Tuple[str, float]]:
+        # Shares the base retriever's result cache with the vector channel.
+        seeds = [rowid for rowid, _ in self.base.search_ids([query], k=n)[0][: self.k]]
+        return self.knn_graph.expand(seeds, n)
+
+    def _vector_hits(self, query: str, n: int) -> List[Tuple[str, float]]:
+        matches: List[Tuple[str, float]] = []
+        if hasattr(self.base, "search_many") and query.strip():
+            matches = self.base.search_many([query], k=n)[0]
+        if not matches:
+            # No vector index (or no hit): keep the base retriever's own fallback, rank-scored.
+            matches = [(text, 1.0 / (1 + rank)) for rank, text in enumerate(self.base.retrieve(query)[:n])]
+        return matches
+
+    def _run_concurrently(
+        self, query: str, calls: Mapping[str, Callable[[], List[Tuple[str, float]]]]
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        if self._executor is None:
+            # One worker per channel is enough: a busy channel is skipped, never queued.
+            workers = len(self._channel_calls("*"))
+            self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="retrieval")
+        channels: Dict[str, List[Tuple[str, float]]] = {}
+        timings: Dict[str, Optional[float]] = {}
+        started = time.perf_counter()
+        pending: Dict[Future, str] = {}
+        for name, call in calls.items():
+            late = self._late.get(name)
+            if late is not None:
+                late_query, future = late
+                if not future.done():
+                    timings[name] = None  # still busy with an earlier turn
+                    continue
+                del self._late[name]
+                if late_query == query and future.exception() is None:
+                    channels[name] = future.result()[0]
+                    timings[name] = 0.0
+                    continue
+            pending[self._executor.submit(self._timed, call)] = name
+        done, _ = wait(pending, timeout=max(0.0, self.deadline - (time.perf_counter() - started)))
+        for future, name in pending.items():
+            if future not in done:
+                self._late[name] = (query, future)
+                timings[name] = None
+                continue
+            try:
+                channels[name], timings[name] = future.result()
+            except Exception:
+                log.warning("retrieval channel %s failed", name, exc_info=True)
+                timings[name] = None
+        self._report(timings)
+        return channels
+
+    @staticmethod
+    def _timed(call: Callable[[], List[Tuple[str, float]]]) -> Tuple[List[Tuple[str, float]], float]:
+        started = time.perf_counter()
+        return call(), time.perf_counter() - started
+
+    def _report(self, timings: Dict[str, Optional[float]]) -> None:
+        self.last_timings = timings
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "retrieval channels: %s",
+                ", ".join(f"{name}={'late' if t is None else f'{t * 1000:.1f}ms'}" for name, t in timings.items()),
+            )
+
+    def close(self) -> None:
+        """Drop the channel thread pool; late calls are abandoned, not awaited."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._late.clear()
+
+    def fuse(self, channels: Mapping[str, List[Tuple[str, float]]]) -> List[Tuple[str, float]]:
+        """Fused (text, score) list, best first; ties keep channel then rank order."""
+        fused: Dict[str, float] = {}
+        for name, hits in channels.items():
+            weight = self.weights.get(name, 1.0)
+            if self.fusion == "weighted" and hits:
+                scores = [score for _, score in hits]
+                lo, hi = min(scores), max(scores)
+                span = hi - lo
+            seen = set()
+            for rank, (text, score) in enumerate(hits):
+                if text in seen:
+                    continue
+                seen.add(text)
+                if self.fusion == "rrf":
+                    contribution = weight / (self.rrf_k + rank + 1)
+                else:
+                    contribution = weight * ((score - lo) / span if span > 0 else 1.0)
+                fused[text] = fused.get(text, 0.0) + contribution
+        # dicts keep first-seen order, and sorted() is stable
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
 
-    def graph_view(self, clusters: int = 4) -> List[List[str]]:
+    def graph_view(self, clusters: Optional[int] = None) -> List[List[str]]:
         if self.base and hasattr(self.base, "graph"):
             try:
                 return self.base.graph(clusters)
@@ -45,4 +248,4 @@ class HybridRetriever:
         return []
 
 
-__all__ = ["HybridRetriever"]
+__all__ = ["FUSION_METHODS", "HybridRetriever"]
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:  # pragma: no cover - optional dependency (ships with scikit-learn)
+    sparse = None
+
+# Rows of the PPR product computed at once; bounds the 2-hop intermediate.
+_BLOCK = 2048
+
+log = logging.getLogger(__name__)
+
+
+class _Arrays(NamedTuple):
+    ids: np.ndarray  # vector row id of each node, ascending
+    indptr: np.ndarray  # kNN adjacency (symmetric) in CSR form over node positions
+    indices: np.ndarray
+    weights: np.ndarray
+    ppr_indptr: np.ndarray  # top truncated-PPR neighbourhood of each node, CSR form
+    ppr_indices: np.ndarray
+    ppr_scores: np.ndarray
+
+
+class KnnGraph:
+    """
+    Memory graph built from the vector index rather than explicit links.
+
+    ``build`` links every vector row to its ``k`` nearest neighbours with
+    similarity >= ``min_similarity`` (symmetrized) and keeps the adjacency as
+    CSR arrays. It also precomputes each node's truncated personalized-PageRank
+    neighbourhood, ``sum_{t=1..hops} alpha (1 - alpha)^t P^t`` with ``P`` the
+    row-normalized adjacency, keeping the ``top`` largest entries. ``expand``
+    turns vector hits into 1-2 hop graph context by summing those precomputed
+    rows, so queries never walk the graph.
+
+    Arrays are saved to ``path`` (.npz) with the vector store generation they
+    were built at, and loaded on start; ``stale`` turns true once the rows
+    added plus removed since exceed ``rebuild_growth`` of the graph.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        path: Optional[str] = None,
+        *,
+        k: int = 8,
+        min_similarity: float = 0.3,
+        hops: int = 2,
+        alpha: float = 0.15,
+        top: int = 16,
+        rebuild_growth: float = 0.1,
+    ):
+        if hops not in (1, 2):
+            raise ValueError(f"Unsupported hops: {hops}")
+        self.vector_store = vector_store
+        self.path = Path(path) if path else None
+        self.k = k
+        self.min_similarity = min_similarity
+        self.hops = hops
+        self.alpha = alpha
+        self.top = top
+        self.rebuild_growth = rebuild_growth
+        # Bumped whenever the arrays are replaced; retrieval caches key on it.
+        self.version = 0
+        self._arrays: Optional[_Arrays] = None
+        # Vector store generation the arrays were built at.
+        self._generation: Optional[int] = None
+        self._build_lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self._arrays = self._load(self.path)
+
+    def __len__(self) -> int:
+        return 0 if self._arrays is None else len(self._arrays.ids)
+
+    @property
+    def stale(self) -> bool:
+        arrays = self._arrays
+        if arrays is None:
+            return len(self.vector_store) >= 2
+        generation = getattr(self.vector_store, "generation", None)
+        if generation is not None and generation == self._generation:
+            return False
+        # Count churn on the id set: pruning n rows and adding n others changes no count.
+        live = self.vector_store.live_ids()
+        kept = len(np.intersect1d(live, arrays.ids, assume_unique=True))
+        changed = len(live) + len(arrays.ids) - 2 * kept
+        return changed > self.rebuild_growth * max(len(arrays.ids), 1)
+
+    def build(self) -> int:
+        """Rebuild edges and PPR neighbourhoods from the vector store; returns the node count."""
+        if sparse is None:
+            raise RuntimeError("scipy chưa được cài để dựng đồ thị kNN.")
+        with self._build_lock:
+            generation = getattr(self.vector_store, "generation", None)
+            ids, neighbor_ids, sims = self.vector_store.neighbors(self.k)
+            adjacency = self._adjacency(ids, neighbor_ids, sims)
+            ppr = self._ppr(adjacency)
+            self._arrays = _Arrays(
+                ids,
+                adjacency.indptr.astype(np.int64),
+                adjacency.indices.astype(np.int32),
+                adjacency.data.astype(np.float32),
+                *ppr,
+            )
+            self._generation = generation
+            self.version += 1
+            if self.path is not None:
+                self.save()
+            return len(ids)
+
+    def build_in_background(self) -> Optional[threading.Thread]:
+        """
+        Rebuild on a daemon thread if ``stale`` (e.g. at startup, when maintenance
+        is off and nothing else would build it). Returns the thread, or None.
+        """
+        if not self.stale:
+            return None
+
+        def run() -> None:
+            try:
+                self.build()
+            except Exception:
+                log.warning("kNN graph build failed", exc_info=True)
+
+        thread = threading.Thread(target=run, name="knn-graph-build", daemon=True)
+        thread.start()
+        return thread
+
+    def _adjacency(self, ids: np.ndarray, neighbor_ids: np.ndarray, sims: np.ndarray):
+        n = len(ids)
+        if not n:
+            return sparse.csr_matrix((0, 0), dtype=np.float32)
+        cols = np.minimum(np.searchsorted(ids, neighbor_ids), n - 1)
+        valid = (neighbor_ids >= 0) & (ids[cols] == neighbor_ids) & (sims >= self.min_similarity)
+        rows = np.broadcast_to(np.arange(n)[:, None], neighbor_ids.shape)
+        matrix = sparse.csr_matrix(
+            (sims[valid].astype(np.float32), (rows[valid], cols[valid])), shape=(n, n), dtype=np.float32
+        )
+        matrix = matrix.maximum(matrix.T).tocsr()
+        matrix.sort_indices()
+        return matrix
+
+    def _ppr(self, adjacency) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = adjacency.shape[0]
+        degree = np.asarray(adjacency.sum(axis=1)).ravel()
+        transition = (sparse.diags(1.0 / np.maximum(degree, 1e-12)) @ adjacency).tocsr()
+        coefficients = [self.alpha * (1 - self.alpha) ** t for t in range(1, self.hops + 1)]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indices: List[np.ndarray] = []
+        scores: List[np.ndarray] = []
+        for start in range(0, n, _BLOCK):
+            step = transition[start : start + _BLOCK]
+            block = coefficients[0] * step
+            for coefficient in coefficients[1:]:
+                step = step @ transition
+                block = block + coefficient * step
+            block = block.tocsr()
+            for offset in range(block.shape[0]):
+                lo, hi = block.indptr[offset], block.indptr[offset + 1]
+                cols, vals = block.indices[lo:hi], block.data[lo:hi]
+                keep = cols != start + offset  # mass returning to the seed itself
+                cols, vals = cols[keep], vals[keep]
+                if len(vals) > self.top:
+                    best = np.argpartition(-vals, self.top - 1)[: self.top]
+                    cols, vals = cols[best], vals[best]
+                order = np.argsort(-vals, kind="stable")
+                indices.append(cols[order].astype(np.int32))
+                scores.append(vals[order].astype(np.float32))
+                indptr[start + offset + 1] = indptr[start + offset] + len(order)
+        empty_i, empty_f = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        return (
+            indptr,
+            np.concatenate(indices) if indices else empty_i,
+            np.concatenate(scores) if scores else empty_f,
+        )
+
+    def neighbors(self, row_id: int) -> List[Tuple[int, float]]:
+        """Direct kNN neighbours of a vector row as (row id, similarity)."""
+        arrays = self._arrays
+        position = self._position(arrays, row_id)
+        if position is None:
+            return []
+        lo, hi = arrays.indptr[position], arrays.indptr[position + 1]
+        return [(int(arrays.ids[c]), float(w)) for c, w in zip(arrays.indices[lo:hi], arrays.weights[lo:hi])]
+
+    def expand(self, seeds: Sequence[int], top_k: int = 6) -> List[Tuple[str, float]]:
+        """
+        Graph context for vector hits ``seeds`` (row ids, best first): their PPR
+        neighbourhoods summed with weight ``1 / (1 + rank)``, seeds excluded.
+        """
+        arrays = self._arrays
+        if arrays is None or not len(seeds) or top_k <= 0:
+            return []
+        positions = [self._position(arrays, rowid) for rowid in seeds]
+        cols: List[np.ndarray] = []
+        vals: List[np.ndarray] = []
+        for rank, position in enumerate(positions):
+            if position is None:
+                continue
+            lo, hi = arrays.ppr_indptr[position], arrays.ppr_indptr[position + 1]
+            cols.append(arrays.ppr_indices[lo:hi])
+            vals.append(arrays.ppr_scores[lo:hi] / (1 + rank))
+        if not cols:
+            return []
+        nodes, inverse = np.unique(np.concatenate(cols), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(vals))
+        totals[np.isin(nodes, [p for p in positions if p is not None])] = 0.0
+        order = np.argsort(-totals, kind="stable")[:top_k]
+        order = order[totals[order] > 0]
+        row_ids = [int(arrays.ids[nodes[i]]) for i in order]
+        texts = self.vector_store.texts(row_ids)
+        return [(texts[rowid], float(totals[i])) for rowid, i in zip(row_ids, order) if rowid in texts]
+
+    @staticmethod
+    def _position(arrays: Optional[_Arrays], row_id: int) -> Optional[int]:
+        if arrays is None or not len(arrays.ids):
+            return None
+        position = int(np.searchsorted(arrays.ids, row_id))
+        if position < len(arrays.ids) and arrays.ids[position] == row_id:
+            return position
+        return None
+
+    def save(self, path: Optional[str] = None) -> None:
+        target = Path(path) if path else self.path
+        arrays = self._arrays
+        if target is None or arrays is None:
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        extra = {} if self._generation is None else {"generation": np.int64(self._generation)}
+        with open(tmp, "wb") as handle:
+            np.savez(handle, **arrays._asdict(), **extra)
+        os.replace(tmp, target)
+
+    def _load(self, path: Path) -> Optional[_Arrays]:
+        try:
+            with np.load(path) as data:
+                arrays = _Arrays(**{name: data[name] for name in _Arrays._fields})
+                self._generation = int(data["generation"]) if "generation" in data.files else None
+        except Exception:
+            return None  # unreadable or older layout: rebuilt by maintenance
+        self.version += 1
+        return arrays
+
+
+__all__ = ["KnnGraph"]
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .store import MemoryStore
+
+
+@dataclass
+class MaintenanceReport:
+    pruned: int = 0
+    compacted: int = 0
+    knn_nodes: int = 0
+    vacuumed_pages: int = 0
+    analyzed: bool = False
+    graph_saved: bool = False
+    # True when the slice finished the last step, i.e. a full pass is done.
+    completed: bool = False
+    elapsed: float = 0.0
+
+
+class MemoryMaintenance:
+    """
+    Memory housekeeping run in time-budgeted slices off the chat thread.
+
+    Steps run in a fixed order: prune, vector compaction, kNN graph rebuild
+    (only once the vector store has drifted), ANALYZE, incremental VACUUM (last
+    among the SQL steps so it also reclaims pages ANALYZE freed), graph save.
+    A slice stops at the first step boundary past its budget (incremental
+    VACUUM also yields between page batches) and the next slice resumes where
+    it stopped. Slices are triggered every ``every_turns`` chat turns or after
+    ``idle_seconds`` without a turn.
+    """
+
+    STEPS = ("prune", "compact", "knn", "analyze", "vacuum", "graph")
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        vector_store=None,
+        graph=None,
+        *,
+        prune: bool = True,
+        max_age_days: int = 90,
+        max_count: int = 10000,
+        every_turns: int = 50,
+        idle_seconds: float = 120.0,
+        slice_budget: float = 0.5,
+        vacuum_pages: int = 256,
+        knn_graph=None,
+    ):
+        self.store = store
+        self.vector_store = vector_store
+        self.graph = graph
+        self.knn_graph = knn_graph
+        self.prune = prune
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+        self.every_turns = every_turns
+        self.idle_seconds = idle_seconds
+        self.slice_budget = slice_budget
+        self.vacuum_pages = max(1, vacuum_pages)
+        self.last_report: Optional[MaintenanceReport] = None
+        self._cursor = 0
+        self._turns = 0
+        self._last_activity = time.monotonic()
+        # Something may need doing since the last full pass.
+        self._pending = True
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def notify_turn(self) -> None:
+        """Record a chat turn; wakes the worker once ``every_turns`` have passed."""
+        self._turns += 1
+        self._last_activity = time.monotonic()
+        self._pending = True
+        if self.every_turns > 0 and self._turns >= self.every_turns:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop the worker; a slice in progress finishes its current step first."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        poll = min(self.idle_seconds, 5.0) if self.idle_seconds > 0 else None
+        while not self._stop.is_set():
+            woke = self._wake.wait(poll)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            idle = (
+                self.idle_seconds > 0
+                and self._pending
+                and time.monotonic() - self._last_activity >= self.idle_seconds
+            )
+            if woke or idle:
+                try:
+                    self.run_slice()
+                except Exception:
+                    pass  # maintenance must never take the chat down; retried next trigger
+
+    def run_slice(self, budget: float | None = None) -> MaintenanceReport:
+        """Run steps until ``budget`` seconds elapse (<= 0 means run the whole pass)."""
+        budget = self.slice_budget if budget is None else budget
+        started = time.monotonic()
+        deadline = started + budget if budget > 0 else None
+        report = MaintenanceReport()
+        with self._lock:
+            self._turns = 0
+            while self._cursor < len(self.STEPS):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                step = getattr(self, f"_step_{self.STEPS[self._cursor]}")
+                if not step(report, deadline):
+                    break  # step yielded mid-way; resume it next slice
+                self._cursor += 1
+            if self._cursor >= len(self.STEPS):
+                self._cursor = 0
+                self._pending = False
+                report.completed = True
+        report.elapsed = time.monotonic() - started
+        self.last_report = report
+        return report
+
+    def run_all(self) -> MaintenanceReport:
+        """Finish the current pass (or run a whole one) without a time budget."""
+        return self.run_slice(0)
+
+    def vacuum_full(self) -> int:
+        """
+        Switch the database to incremental auto-vacuum and rebuild it once.
+        Blocks all writers while it runs; returns bytes reclaimed.
+        """
+        conn = sqlite3.connect(self.store.path)
+        try:
+            before = self._db_bytes(conn)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return max(0, before - self._db_bytes(conn))
+        finally:
+            conn.close()
+
+    def _step_prune(self, report: MaintenanceReport, deadline: float | None) -> bool:
+        if self.prune:
+            report.pruned += self.store.prune_old_memories(self.max_age_days)
+            report.pruned += self.store.prune_by_count(self.max_count)
+        return True
+
+    def _step_compact(self, report: MaintenanceReport, deadline: float | None) -> bool:
+        if self.vector_store is not None and hasattr(self.vector_store, "compact"):
+            report.compacted += self.vector_store.compact()
+            self.vector_store.flush()
+        return True
+
+    def _step_knn(self, report: MaintenanceReport, deadline: float | None) -> bool:
+        # A rebuild cannot yield part-way; it runs whole once its turn comes.
+        if self.knn_graph is not None and self.knn_graph.stale:
+            report.knn_nodes = self.knn_graph.build()
+        return True
+
+    def _step_vacuum(self, report: MaintenanceReport, deadline: float | None) -> bool:
+        conn = sqlite3.connect(self.store.path)
+        try:
+            # Incremental vacuum only works once the file is in auto_vacuum=INCREMENTAL
+            # mode; older databases are converted by ``vacuum_full``.
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return True
+            while True:
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free:
+                    return True
+                # executescript steps the pragma to completion; execute() frees a single page.
+                conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+                report.vacuumed_pages += min(free, self.vacuum_pages)
+                if free <= self.vacuum_pages:
+                    return True
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+        finally:
+            conn.close()
+
+    def _step_analyze(self, report: MaintenanceReport, deadline: float | None) -> bool:
+        conn = sqlite3.connect(self.store.path)
+        try:
+            # Sampled ANALYZE keeps the cost bounded on large tables.
+            conn.execute("PRAGMA analysis_limit=1000")
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        report.analyzed = True
+        return True
+
+    def _step_graph(self, report: MaintenanceReport, deadline: float | None) -> bool:
+        if self.graph is not None and getattr(self.graph, "dirty", True):
+            self.graph.save()
+            report.graph_saved = True
+        return True
+
+    @staticmethod
+    def _db_bytes(conn: sqlite3.Connection) -> int:
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return int(pages) * int(size)
+
+
+__all__ = ["MaintenanceReport", "MemoryMaintenance"]
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # pragma: no cover - optional dependency
+    SentenceTransformer = None
+
+_Key = Tuple[str, str, str]
+
+
+def canonical_model_name(name: str) -> str:
+    """``all-MiniLM-L6-v2`` and ``sentence-transformers/all-MiniLM-L6-v2`` name the same checkpoint."""
+    if "/" in name or "\\" in name or Path(name).exists():
+        return name
+    return f"sentence-transformers/{name}"
+
+
+class _Entry:
+    def __init__(self, model: Any):
+        self.model = model
+        self.refs = 0
+        # Fast tokenizers raise "Already borrowed" when one instance is used from two threads.
+        self.lock = threading.Lock()
+
+
+class SharedModel:
+    """
+    Handle on a resident SentenceTransformer. ``encode`` is serialized per model;
+    call ``release`` (or let the registry's finalizer do it) when done.
+    """
+
+    def __init__(self, registry: "ModelRegistry", key: _Key, entry: _Entry):
+        self._registry = registry
+        self.key = key
+        self._entry = entry
+        self._released = False
+
+    @property
+    def model(self) -> Any:
+        return self._entry.model
+
+    def encode(self, *args, **kwargs):
+        with self._entry.lock:
+            return self._entry.model.encode(*args, **kwargs)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._entry.model.get_sentence_embedding_dimension()
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._registry._release(self.key)
+
+    def __enter__(self) -> "SharedModel":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class ModelRegistry:
+    """
+    Process-wide SentenceTransformer instances keyed by (model, device, dtype),
+    reference counted. The last release parks the model in a small idle pool
+    (``max_idle`` entries, oldest evicted) so a /reload that drops every consumer
+    before building new ones does not load it from disk again.
+    """
+
+    def __init__(self, loader=None, *, max_idle: int = 1):
+        self._loader = loader
+        self.max_idle = max_idle
+        self._entries: Dict[_Key, _Entry] = {}
+        self._idle: "OrderedDict[_Key, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(
+        self,
+        model_name: str,
+        *,
+        device: Optional[str] = None,
+        dtype: Optional[str] = None,
+        cache_folder: Optional[str] = None,
+    ) -> SharedModel:
+        key = (canonical_model_name(model_name), device or "cpu", dtype or "float32")
+        with self._lock:
+            entry = self._entries.get(key) or self._idle.pop(key, None)
+            if entry is None:
+                # Loaded under the lock so concurrent first users share one load.
+                entry = _Entry(self._load(key, cache_folder))
+            self._entries[key] = entry
+            entry.refs += 1
+            return SharedModel(self, key, entry)
+
+    def _load(self, key: _Key, cache_folder: Optional[str]) -> Any:
+        name, device, dtype = key
+        if self._loader is not None:
+            return self._loader(name, device=device, cache_folder=cache_folder)
+        if SentenceTransformer is None:
+            raise RuntimeError("sentence-transformers chưa được cài để dùng embedder HF.")
+        model = SentenceTransformer(name, device=device, cache_folder=cache_folder)
+        if dtype == "float16":
+            model = model.half()
+        return model
+
+    def _release(self, key: _Key) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                del self._entries[key]
+                if self.max_idle > 0:
+                    self._idle[key] = entry
+                    while len(self._idle) > self.max_idle:
+                        self._idle.popitem(last=False)
+
+    def clear_idle(self) -> None:
+        """Drop parked models so their memory can be reclaimed."""
+        with self._lock:
+            self._idle.clear()
+
+    def resident(self) -> Dict[_Key, int]:
+        """Loaded models and their reference counts (0 = parked idle)."""
+        with self._lock:
+            counts = {key: 0 for key in self._idle}
+            counts.update({key: entry.refs for key, entry in self._entries.items()})
+            return counts
+
+
+_registry = ModelRegistry()
+
+
+def shared_registry() -> ModelRegistry:
+    return _registry
+
+
+def acquire_sentence_transformer(model_name: str, **kwargs) -> SharedModel:
+    return _registry.acquire(model_name, **kwargs)
+
+
+__all__ = [
+    "ModelRegistry",
+    "SharedModel",
+    "acquire_sentence_transformer",
+    "canonical_model_name",
+    "shared_registry",
+]
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import inspect
+import json
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .embedding import BaseEmbedder
+
+try:
+    import onnxruntime as ort
+except ImportError:  # pragma: no cover - optional dependency
+    ort = None
+
+# Sentences used to check that the exported graph still agrees with PyTorch.
+_PROBES = (
+    "The quick brown fox jumps over the lazy dog.",
+    "Ark thích uống cà phê buổi sáng.",
+    "def add(a, b): return a + b",
+    "Memory retrieval should be fast on CPU-only machines.",
+)
+
+
+def _model_dir(root: str, model_name: str) -> Path:
+    return Path(root) / re.sub(r"[^\w.-]+", "__", model_name)
+
+
+def _mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    weights = mask[..., None].astype(np.float32)
+    summed = (hidden * weights).sum(axis=1)
+    return summed / np.maximum(weights.sum(axis=1), 1e-9)
+
+
+def _min_cosine(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return float((a * b).sum(axis=1).min())
+
+
+def export_onnx(model_name: str, out_dir: Path, *, cache_folder: Optional[str] = None) -> Path:
+    """Export a transformers encoder (last_hidden_state) to ``out_dir/model.onnx`` with its tokenizer."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_folder)
+    model = AutoModel.from_pretrained(model_name, cache_dir=cache_folder).eval()
+    sample = tokenizer(list(_PROBES[:2]), padding=True, return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    target = out_dir / "model.onnx"
+
+    class _Encoder(torch.nn.Module):
+        # Binds inputs by name; positional order differs across transformers versions.
+        def __init__(self) -> None:
+            super().__init__()
+            self.model = model
+
+        def forward(self, *tensors):
+            return self.model(**dict(zip(names, tensors))).last_hidden_state
+
+    kwargs = dict(
+        input_names=names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic,
+        opset_version=17,
+    )
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False  # the TorchScript exporter handles dynamic_axes without extra deps
+    with torch.no_grad():
+        torch.onnx.export(_Encoder().eval(), tuple(sample[name] for name in names), str(target), **kwargs)
+    tokenizer.save_pretrained(str(out_dir))
+    return target
+
+
+def quantize_onnx(source: Path) -> Path:
+    """Dynamic int8 quantization of the MatMul/Gemm weights."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    target = source.with_name("model.int8.onnx")
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxEmbedder(BaseEmbedder):
+    """
+    MiniLM-class sentence embeddings on ONNX Runtime (mean pooling over the last
+    hidden state, like the sentence-transformers checkpoints it replaces).
+
+    Pre-exported graphs in ``onnx_dir/<model>/`` are loaded as-is; otherwise the
+    model is exported once (and dynamic-int8 quantized when ``quantize``). Each new
+    graph is checked against the PyTorch sentence-transformers output: an int8
+    graph whose cosine agreement falls below ``min_cosine`` is dropped for the fp32
+    one. Results are recorded in ``verified.json`` so the check runs once.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        onnx_dir: str = "./models/onnx",
+        quantize: bool = True,
+        threads: Optional[int] = None,
+        cache_folder: Optional[str] = None,
+        batch_size: int = 32,
+        max_length: int = 256,
+        min_cosine: float = 0.99,
+        verify: bool = True,
+    ):
+        if ort is None:
+            raise RuntimeError("onnxruntime chưa được cài để dùng embedder onnx (pip install witness-forge[onnx]).")
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.min_cosine = min_cosine
+        self.directory = _model_dir(onnx_dir, model_name)
+        fp32 = self.directory / "model.onnx"
+        if not fp32.exists():
+            export_onnx(model_name, self.directory, cache_folder=cache_folder)
+        tokenizer_source = str(self.directory) if (self.directory / "tokenizer_config.json").exists() else model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_source, cache_dir=cache_folder)
+
+        threads = threads or max(1, (os.cpu_count() or 2) // 2)
+        self._options = ort.SessionOptions()
+        self._options.intra_op_num_threads = threads
+        self._options.inter_op_num_threads = 1
+        self._options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        self._options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.quantized = False
+        path = fp32
+        if quantize:
+            int8 = self.directory / "model.int8.onnx"
+            if not int8.exists():
+                int8 = quantize_onnx(fp32)
+            if not verify or self._verified(int8):
+                path, self.quantized = int8, True
+        if path == fp32 and verify and not self._verified(fp32):
+            raise RuntimeError(f"ONNX export of {model_name} disagrees with the PyTorch model.")
+        self._load(path)
+        self._dimension = int(self.embed(["dimension probe"]).shape[1])
+
+    def _load(self, path: Path) -> None:
+        self.session = ort.InferenceSession(str(path), self._options, providers=["CPUExecutionProvider"])
+        self._inputs = {item.name for item in self.session.get_inputs()}
+
+    def _verified(self, path: Path) -> bool:
+        record_path = self.directory / "verified.json"
+        try:
+            record = json.loads(record_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            record = {}
+        if path.name not in record:
+            reference = self._reference(list(_PROBES))
+            if reference is None:
+                return True  # nothing to compare against; trust the export
+            self._load(path)
+            record[path.name] = _min_cosine(self.embed(list(_PROBES)), reference)
+            record_path.write_text(json.dumps(record, indent=2), encoding="utf-8")
+        return record[path.name] >= self.min_cosine
+
+    def _reference(self, texts: List[str]) -> Optional[np.ndarray]:
+        try:
+            from .model_registry import acquire_sentence_transformer
+
+            with acquire_sentence_transformer(self.model_name) as model:
+                return np.asarray(model.encode(texts, convert_to_numpy=True, show_progress_bar=False))
+        except Exception:
+            return None
+
+    def fit(self, texts: Sequence[str]) -> None:
+        return None
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        # Length-sorted batches keep padding (wasted FLOPs) low.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: Optional[np.ndarray] = None
+        for start in range(0, len(order), self.batch_size):
+            chunk = order[start : start + self.batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in chunk],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._inputs}
+            hidden = self.session.run(None, feeds)[0]
+            pooled = _mean_pool(hidden, encoded["attention_mask"])
+            if out is None:
+                out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[chunk] = pooled
+        return out
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    @property
+    def model_id(self) -> str:
+        return f"onnx:{self.model_name}:{'int8' if self.quantized else 'fp32'}"
+
+
+__all__ = ["OnnxEmbedder", "export_onnx", "quantize_onnx"]
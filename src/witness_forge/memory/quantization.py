@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows decoded per block when scoring; bounds the float32 scratch memory.
+_BLOCK_ROWS = 65536
+
+
+@dataclass
+class ScalarQuantizer:
+    """
+    Per-dimension affine scalar quantizer for embedding rows.
+
+    ``int8`` maps [offset, offset + 255 * scale] onto [-128, 127]; ``float16`` is a plain
+    cast; ``float32`` is the identity. Scores are computed directly on the codes:
+    x ≈ (c + 128) * scale + offset, so x·q = c·(scale * q) + (128 * scale + offset)·q.
+    """
+
+    kind: str = "float32"
+    scale: Optional[np.ndarray] = field(default=None, repr=False)
+    offset: Optional[np.ndarray] = field(default=None, repr=False)
+    # Rows the int8 bounds were learned from; 0 for fixed ``fit_range`` bounds.
+    rows: int = 0
+
+    def __post_init__(self) -> None:
+        if self.kind not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported vector storage: {self.kind}")
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(STORAGE_DTYPES[self.kind])
+
+    @property
+    def fitted(self) -> bool:
+        return self.kind != "int8" or self.scale is not None
+
+    def fit(self, matrix: np.ndarray) -> None:
+        if self.kind != "int8" or not len(matrix):
+            return
+        lo = matrix.min(axis=0).astype(np.float32)
+        hi = matrix.max(axis=0).astype(np.float32)
+        self.offset = lo
+        self.scale = np.maximum(hi - lo, 1e-6).astype(np.float32) / 255.0
+        self.rows = len(matrix)
+
+    def fit_range(self, dim: int, lo: float = -1.0, hi: float = 1.0) -> None:
+        """Fallback bounds before any corpus exists (unit-normalized embeddings)."""
+        if self.kind != "int8":
+            return
+        self.offset = np.full(dim, lo, dtype=np.float32)
+        self.scale = np.full(dim, (hi - lo) / 255.0, dtype=np.float32)
+        self.rows = 0
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        if self.kind != "int8":
+            return np.asarray(matrix, dtype=self.dtype)
+        codes = np.rint((matrix - self.offset) / self.scale) - 128.0
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        if self.kind != "int8":
+            return np.asarray(codes, dtype=np.float32)
+        return (codes.astype(np.float32) + 128.0) * self.scale + self.offset
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Inner products of code rows with ``query``: (n,) for one query, (n, nq) for a batch."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.kind == "float32":
+            return codes @ query.T
+        if self.kind == "int8":
+            weights = self.scale * query
+            bias = ((128.0 * self.scale + self.offset) * query).sum(axis=-1)
+        else:
+            weights, bias = query, 0.0
+        out = np.empty((len(codes),) + query.shape[:-1], dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start : start + _BLOCK_ROWS].astype(np.float32)
+            out[start : start + len(block)] = block @ weights.T + bias
+        return out
+
+    def to_header(self) -> dict:
+        if self.kind != "int8" or self.scale is None:
+            return {}
+        return {"scale": self.scale.tolist(), "offset": self.offset.tolist(), "rows": self.rows}
+
+    def load_header(self, payload: dict | None) -> None:
+        if self.kind != "int8" or not payload:
+            return
+        self.scale = np.asarray(payload["scale"], dtype=np.float32)
+        self.offset = np.asarray(payload["offset"], dtype=np.float32)
+        self.rows = int(payload.get("rows", 0))
+
+
+__all__ = ["ScalarQuantizer", "STORAGE_DTYPES"]
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # pragma: no cover - optional dependency
+    CrossEncoder = None
+
+# memory.reranker values naming a scorer in strategies/rerank.py, e.g. "strategy:token_overlap".
+STRATEGY_PREFIX = "strategy:"
+
+
+class Reranker:
+    """
+    Scores (query, candidate) pairs in one batched call per ``score``.
+
+    Scores are cached per pair in an LRU of ``cache_size`` entries, so a
+    candidate that survives fusion again for the same query is not re-scored.
+    """
+
+    def __init__(self, score_pairs: Callable[[List[Tuple[str, str]]], Sequence[float]], cache_size: int = 4096):
+        self._score_pairs = score_pairs
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def score(self, query: str, candidates: Sequence[str]) -> np.ndarray:
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        missing: List[int] = []
+        with self._lock:
+            for i, text in enumerate(candidates):
+                cached = self._cache.get((query, text))
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end((query, text))
+                    scores[i] = cached
+        if missing:
+            fresh = self._score_pairs([(query, candidates[i]) for i in missing])
+            with self._lock:
+                for i, value in zip(missing, fresh):
+                    scores[i] = float(value)
+                    self._cache[(query, candidates[i])] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, candidates: Sequence[str]) -> List[Tuple[str, float]]:
+        """Candidates sorted by reranker score, best first (stable on ties)."""
+        scores = self.score(query, candidates)
+        order = np.argsort(-scores, kind="stable")
+        return [(candidates[i], float(scores[i])) for i in order]
+
+
+class CrossEncoderReranker(Reranker):
+    """sentence-transformers CrossEncoder checkpoint (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2)."""
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        device: Optional[str] = None,
+        batch_size: int = 32,
+        cache_size: int = 4096,
+    ):
+        if CrossEncoder is None:
+            raise RuntimeError("sentence-transformers chưa được cài để dùng reranker.")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, device=device or "cpu")
+        super().__init__(self._predict, cache_size=cache_size)
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        return np.asarray(
+            self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False),
+            dtype=np.float32,
+        ).reshape(-1)
+
+
+class StrategyReranker(Reranker):
+    """
+    ``RerankStrategy`` from strategies/rerank.py (e.g. its token-overlap
+    scorer) behind the batched, cached ``Reranker`` interface; no model needed.
+    """
+
+    def __init__(self, strategy, cache_size: int = 4096):
+        self.strategy = strategy
+        super().__init__(self._predict, cache_size=cache_size)
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        return [float(self.strategy.scorer(query, text)) for query, text in pairs]
+
+
+def load_rerank_strategy(name: str, strategies_dir: str = "strategies"):
+    """
+    ``RerankStrategy(<name>_scorer)`` from ``<strategies_dir>/rerank.py``. The
+    file is read on every call, so edits are picked up on the next rebuild.
+    """
+    path = Path(strategies_dir) / "rerank.py"
+    spec = importlib.util.spec_from_file_location("witness_strategies_rerank", path)
+    if spec is None or spec.loader is None or not path.exists():
+        raise RuntimeError(f"Không tìm thấy {path} cho reranker strategy:{name}.")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # dataclasses look their module up while executing
+    spec.loader.exec_module(module)
+    scorer = getattr(module, f"{name}_scorer", None)
+    if scorer is None:
+        raise RuntimeError(f"{path} không có hàm {name}_scorer.")
+    return module.RerankStrategy(scorer)
+
+
+def build_reranker(
+    model_name: Optional[str],
+    *,
+    device: Optional[str] = None,
+    cache_size: int = 4096,
+    strategies_dir: str = "strategies",
+) -> Optional[Reranker]:
+    if not model_name:
+        return None
+    if model_name.startswith(STRATEGY_PREFIX):
+        strategy = load_rerank_strategy(model_name[len(STRATEGY_PREFIX) :], strategies_dir)
+        return StrategyReranker(strategy, cache_size=cache_size)
+    return CrossEncoderReranker(model_name, device=device, cache_size=cache_size)
+
+
+__all__ = [
+    "CrossEncoderReranker",
+    "Reranker",
+    "STRATEGY_PREFIX",
+    "StrategyReranker",
+    "build_reranker",
+    "load_rerank_strategy",
+]
@@ -1,19 +1,80 @@
-from typing import List, Optional
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
 
 from .embedding import BaseEmbedder
+from .schema import document_frequencies
 from .store import MemoryStore
+from .vector_metadata import MetadataFilter
 from .vector_store import VectorStore
 
 
 def build_vocab_from_mem(mem: List[str], min_freq: int = 2) -> dict[str, int]:
-    vocab = {}
-    for text in mem:
-        for token in text.lower().split():
-            if not token.isalpha():
-                continue
-            if token not in vocab and sum(1 for m in mem if token in m.lower()) >= min_freq:
-                vocab[token] = len(vocab)
-    return vocab
+    """Token -> index for tokens found in at least ``min_freq`` of ``mem``, in first-seen order."""
+    counts = document_frequencies(mem)
+    return {token: i for i, token in enumerate(t for t, n in counts.items() if n >= min_freq)}
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: NFKC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class RetrievalCache:
+    """
+    Thread-safe LRU of retrieval results tagged with a store generation.
+
+    A lookup under a different generation than the cached entries drops them
+    all, so any write to the underlying stores invalidates the cache. With
+    ``ttl`` (seconds) entries also expire, for results that drift with time
+    such as recency-weighted scores.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._generation: Hashable = None
+        # key -> (value, monotonic time it was stored)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: Hashable) -> Optional[Any]:
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, generation: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return  # a write landed while this result was computed
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
 
 
 class Retriever:
@@ -23,24 +84,97 @@ class Retriever:
         embedder: BaseEmbedder,
         vector_store: Optional[VectorStore],
         k: int = 6,
+        half_life_days: Optional[float] = None,
+        cache_size: int = 256,
     ):
         self.store = store
         self.embedder = embedder
         self.vector_store = vector_store
         self.k = k
+        # Recency weighting for vector matches; None ranks by similarity alone.
+        self.half_life = half_life_days * 86400.0 if half_life_days else None
+        # Recency weights move ~1% per half_life / 64, so such results expire.
+        self.cache = RetrievalCache(cache_size, ttl=self.half_life / 64 if self.half_life else None)
 
-    def retrieve(self, query: str) -> List[str]:
-        if self.vector_store and query.strip():
-            vector = self.embedder.embed([query])
-            if len(vector):
-                matches = self.vector_store.search(vector[0], self.k)
-                if matches:
-                    return [text for text, _ in matches]
+    @property
+    def generation(self) -> Tuple[int, int]:
+        """Changes whenever a cached result could be stale."""
+        return (self.store.generation, getattr(self.vector_store, "generation", 0))
+
+    def retrieve(self, query: str, where: Optional[MetadataFilter] = None) -> List[str]:
+        matches = self.search_many([query], where=where)[0]
+        if matches:
+            return [text for text, _ in matches]
         return self.store.recent_memories(self.k)
 
-    def graph(self, clusters: int = 4) -> List[List[str]]:
+    def search_many(
+        self,
+        queries: Sequence[str],
+        where: Optional[MetadataFilter] = None,
+        k: Optional[int] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """Scored matches for a batch of queries: one embed call, one vector search for the cache misses."""
+        return [[(text, score) for text, score, _ in matches] for matches in self._search(queries, where, k)]
+
+    def search_ids(
+        self,
+        queries: Sequence[str],
+        where: Optional[MetadataFilter] = None,
+        k: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Like ``search_many`` but yields vector row ids; shares its cache."""
+        return [[(rowid, score) for _, score, rowid in matches] for matches in self._search(queries, where, k)]
+
+    def _search(
+        self,
+        queries: Sequence[str],
+        where: Optional[MetadataFilter],
+        k: Optional[int],
+    ) -> List[List[Tuple[str, float, int]]]:
+        k = k or self.k
+        results: List[List[Tuple[str, float, int]]] = [[] for _ in queries]
+        if not self.vector_store:
+            return results
+        generation = self.generation
+        keys = [(normalize_query(query), k, where) for query in queries]
+        missing: Dict[Hashable, List[int]] = {}
+        for i, (query, key) in enumerate(zip(queries, keys)):
+            if not query.strip():
+                continue
+            cached = self.cache.get(key, generation)
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                missing.setdefault(key, []).append(i)
+        if not missing:
+            return results
+        firsts = [positions[0] for positions in missing.values()]
+        vectors = self.embedder.embed([queries[i] for i in firsts])
+        if not len(vectors):
+            return results
+        matched = self.vector_store.search_many(vectors, k, where=where, half_life=self.half_life, with_ids=True)
+        for (key, positions), matches in zip(missing.items(), matched):
+            self.cache.put(key, generation, tuple(matches))
+            for i in positions:
+                results[i] = list(matches)
+        return results
+
+    def retrieve_many(self, queries: Sequence[str], where: Optional[MetadataFilter] = None) -> List[List[str]]:
+        recent: Optional[List[str]] = None
+        out: List[List[str]] = []
+        for matches in self.search_many(queries, where=where):
+            if matches:
+                out.append([text for text, _ in matches])
+                continue
+            if recent is None:
+                recent = self.store.recent_memories(self.k)
+            out.append(list(recent))
+        return out
+
+    def graph(self, clusters: Optional[int] = None) -> List[List[str]]:
         if self.vector_store:
             return self.vector_store.graph(clusters)
+        clusters = clusters or 4
         recents = self.store.recent_memories(self.k * clusters)
         step = max(1, len(recents) // clusters)
         return [recents[i : i + step] for i in range(0, len(recents), step)]
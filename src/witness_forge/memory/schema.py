@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Iterable, List
+
+# Indexes per table, created by whichever module owns the table and by migrations.
+INDEXES = {
+    "messages": (
+        "CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_session_ts ON messages(session, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_role_ts ON messages(role, ts)",
+    ),
+    "memories": ("CREATE INDEX IF NOT EXISTS idx_memories_ts ON memories(ts)",),
+    "memory_vectors": (
+        "CREATE INDEX IF NOT EXISTS idx_memory_vectors_memory_id ON memory_vectors(memory_id)",
+        "CREATE INDEX IF NOT EXISTS idx_memory_vectors_ts ON memory_vectors(ts)",
+    ),
+    "tool_logs": ("CREATE INDEX IF NOT EXISTS idx_tool_logs_start_ts ON tool_logs(start_ts)",),
+    "patches_applied": (
+        "CREATE INDEX IF NOT EXISTS idx_patches_applied_sha256 ON patches_applied(sha256)",
+        "CREATE INDEX IF NOT EXISTS idx_patches_applied_applied_at ON patches_applied(applied_at)",
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    return row is not None
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> dict[str, int]:
+    """Column name -> primary-key position (0 when not part of the key)."""
+    return {row[1]: row[5] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def ensure_indexes(conn: sqlite3.Connection, table: str) -> None:
+    for statement in INDEXES.get(table, ()):
+        conn.execute(statement)
+
+
+def _initial_tables(conn: sqlite3.Connection) -> None:
+    # The original unversioned layout; databases that predate versioning already match it.
+    conn.execute("CREATE TABLE IF NOT EXISTS messages(ts REAL, role TEXT, text TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS memories(ts REAL, text TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS kv(k TEXT PRIMARY KEY, v TEXT)")
+
+
+def _rebuild(conn: sqlite3.Connection, table: str, create_sql: str, copy_sql: str) -> None:
+    """Recreate ``table`` from ``create_sql`` keeping rowids, so external references survive."""
+    if _columns(conn, table).get("id"):
+        return
+    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    conn.execute(create_sql)
+    conn.execute(copy_sql)
+    conn.execute(f"DROP TABLE {table}_legacy")
+
+
+def _keys_and_indexes(conn: sqlite3.Connection) -> None:
+    _rebuild(
+        conn,
+        "messages",
+        "CREATE TABLE messages(id INTEGER PRIMARY KEY, ts REAL NOT NULL, role TEXT, text TEXT, session TEXT)",
+        "INSERT INTO messages(id, ts, role, text) "
+        "SELECT rowid, COALESCE(ts, 0), role, text FROM messages_legacy ORDER BY rowid",
+    )
+    # memory_vectors.memory_id points at memories rowids, which the copy preserves.
+    _rebuild(
+        conn,
+        "memories",
+        "CREATE TABLE memories(id INTEGER PRIMARY KEY, ts REAL NOT NULL, text TEXT)",
+        "INSERT INTO memories(id, ts, text) SELECT rowid, COALESCE(ts, 0), text FROM memories_legacy ORDER BY rowid",
+    )
+    for table in INDEXES:
+        if _table_exists(conn, table) and (table != "memory_vectors" or "memory_id" in _columns(conn, table)):
+            ensure_indexes(conn, table)
+
+
+# Tables mirrored into an external-content FTS5 index named ``<table>_fts``.
+FTS_TABLES = ("memories", "messages")
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()
+    if row and row[0]:
+        return True
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _lexical_index(conn: sqlite3.Connection) -> None:
+    # Builds without FTS5 keep working; MemoryStore.search_text falls back to LIKE.
+    if not fts5_available(conn):
+        return
+    for table in FTS_TABLES:
+        fts = f"{table}_fts"
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"text, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+            f"INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END"
+        )
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def vocab_tokens(text: str) -> List[str]:
+    """Distinct alphabetic lowercase tokens of ``text`` in first-seen order (vocabulary terms)."""
+    return list(dict.fromkeys(token for token in text.lower().split() if token.isalpha()))
+
+
+def document_frequencies(texts: Iterable[str]) -> Counter:
+    """Token -> number of ``texts`` containing it, in one pass; keys in first-seen order."""
+    counts: Counter = Counter()
+    for text in texts:
+        counts.update(vocab_tokens(text or ""))
+    return counts
+
+
+def _vocabulary(conn: sqlite3.Connection) -> None:
+    # Kept current by MemoryStore writes; rowid order is first-seen order.
+    conn.execute("CREATE TABLE IF NOT EXISTS memory_vocab(token TEXT PRIMARY KEY, df INTEGER NOT NULL)")
+    texts = (row[0] for row in conn.execute("SELECT text FROM memories ORDER BY id"))
+    conn.executemany(
+        "INSERT OR REPLACE INTO memory_vocab(token, df) VALUES(?,?)", list(document_frequencies(texts).items())
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial tables", _initial_tables),
+    Migration(2, "integer primary keys, session column, ts/session/role indexes", _keys_and_indexes),
+    Migration(3, "FTS5 lexical index over memories and messages", _lexical_index),
+    Migration(4, "memory vocabulary with document frequencies", _vocabulary),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Latest applied migration; 0 for a new or never-versioned database."""
+    if not _table_exists(conn, "schema_version"):
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0] or 0)
+
+
+def pending_migrations(conn: sqlite3.Connection) -> List[Migration]:
+    current = schema_version(conn)
+    return [migration for migration in MIGRATIONS if migration.version > current]
+
+
+def migrate(conn: sqlite3.Connection) -> List[Migration]:
+    """Apply pending migrations, each in its own transaction. Returns those applied."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version(version INTEGER PRIMARY KEY, name TEXT, applied_at REAL)"
+    )
+    conn.commit()
+    applied: List[Migration] = []
+    for migration in pending_migrations(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= migration.version:
+                conn.rollback()  # another process got there first
+                continue
+            migration.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version(version, name, applied_at) VALUES(?,?,?)",
+                (migration.version, migration.name, time.time()),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(migration)
+    return applied
+
+
+__all__ = [
+    "FTS_TABLES",
+    "INDEXES",
+    "MIGRATIONS",
+    "Migration",
+    "SCHEMA_VERSION",
+    "document_frequencies",
+    "ensure_indexes",
+    "fts5_available",
+    "migrate",
+    "pending_migrations",
+    "schema_version",
+    "vocab_tokens",
+]
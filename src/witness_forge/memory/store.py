@@ -1,43 +1,248 @@
+import atexit
 import os
+import re
 import sqlite3
+import threading
 import time
-from typing import Callable, List, Optional, Sequence
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from .schema import FTS_TABLES, document_frequencies, migrate
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
 
 
 class MemoryStore:
-    def __init__(self, path: str):
+    """
+    SQLite-backed message log and memory table on one long-lived WAL connection.
+
+    ``add_message`` rows are queued and group-committed by a background flusher
+    after ``flush_interval`` seconds or ``flush_size`` rows, whichever comes
+    first; any other write commits the queue in the same transaction. Pass
+    ``durable=True`` to commit immediately with a full fsync. Opening a store
+    applies any pending schema migrations.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        session: Optional[str] = None,
+        flush_interval: float = 0.2,
+        flush_size: int = 32,
+    ):
         self.path = path
+        # Tags logged messages so one chat run can be queried by index.
+        self.session = session
+        self.flush_interval = flush_interval
+        self.flush_size = max(1, flush_size)
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        # Message rows waiting for the next group commit, and when the oldest arrived.
+        self._pending: List[tuple] = []
+        self._pending_since = 0.0
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        self._conn = self._connect()
         self._init()
         self._semantic_hook: Optional[tuple[Callable[[Sequence[str]], Sequence], object]] = None
+        # Bumped on every memory write or delete; retrieval caches key on it.
+        self.generation = 0
+        atexit.register(_close_at_exit, weakref.ref(self))
+
+    def _connect(self) -> sqlite3.Connection:
+        # Shared by the chat and maintenance threads; every use holds self._lock.
+        # The statement cache keeps the hot INSERT/SELECTs prepared across calls.
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=128)
+        # Only takes effect on a new file; lets maintenance reclaim pages incrementally.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
 
     def _init(self):
-        conn = sqlite3.connect(self.path)
-        c = conn.cursor()
-        c.execute("CREATE TABLE IF NOT EXISTS messages(ts REAL, role TEXT, text TEXT)")
-        c.execute("CREATE TABLE IF NOT EXISTS memories(ts REAL, text TEXT)")
-        c.execute("CREATE TABLE IF NOT EXISTS kv(k TEXT PRIMARY KEY, v TEXT)")
-        conn.commit()
-        conn.close()
-
-    def add_message(self, role: str, text: str):
-        conn = sqlite3.connect(self.path)
-        conn.execute("INSERT INTO messages VALUES(?,?,?)", (time.time(), role, text))
-        conn.commit()
-        conn.close()
-
-    def add_memory(self, text: str):
-        conn = sqlite3.connect(self.path)
-        conn.execute("INSERT INTO memories VALUES(?,?)", (time.time(), text))
-        conn.commit()
-        conn.close()
-        self._maybe_index_semantic(text)
+        with self._lock:
+            migrate(self._conn)
+            self._fts = {table: self._has_fts(table) for table in FTS_TABLES}
+
+    @contextmanager
+    def _write(self, durable: bool = False) -> Iterator[sqlite3.Connection]:
+        """Write transaction on the shared connection; queued messages commit with it."""
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("MemoryStore is closed")
+            rows, self._pending = self._pending, []
+            if durable:
+                self._conn.execute("PRAGMA synchronous=FULL")
+            try:
+                with self._conn:
+                    if rows:
+                        self._conn.executemany(
+                            "INSERT INTO messages(ts, role, text, session) VALUES(?,?,?,?)", rows
+                        )
+                    yield self._conn
+            except BaseException:
+                self._pending[:0] = rows
+                raise
+            finally:
+                if durable:
+                    self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def add_message(self, role: str, text: str, *, durable: bool = False):
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append((time.time(), role, text, self.session))
+            if durable or len(self._pending) >= self.flush_size:
+                self.flush(durable=durable)
+                return
+            self._ensure_flusher()
+            self._wake.notify()
+
+    def flush(self, *, durable: bool = False) -> None:
+        """Commit queued messages now."""
+        with self._lock:
+            if self._pending or durable:
+                with self._write(durable):
+                    pass
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="memory-store-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        with self._lock:
+            while not self._closed:
+                if not self._pending:
+                    self._wake.wait()
+                    continue
+                remaining = self._pending_since + self.flush_interval - time.monotonic()
+                if remaining > 0:
+                    self._wake.wait(remaining)
+                    continue
+                try:
+                    self.flush()
+                except sqlite3.Error:
+                    # Rows stay queued; retry after another interval.
+                    self._pending_since = time.monotonic()
+
+    def close(self) -> None:
+        """Flush queued messages and close the connection."""
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self.flush()
+            finally:
+                self._closed = True
+                self._wake.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._conn.close()
+
+    def add_memory(
+        self,
+        text: str,
+        *,
+        role: Optional[str] = None,
+        namespace: Optional[str] = None,
+        durable: bool = False,
+    ):
+        self.add_memories([text], role=role, namespace=namespace, durable=durable)
+
+    def add_memories(
+        self,
+        texts: Sequence[str],
+        *,
+        role: Optional[str] = None,
+        namespace: Optional[str] = None,
+        durable: bool = False,
+    ) -> List[int]:
+        """
+        Insert a batch of memories in one transaction and embed them in one encoder call.
+        ``role``/``namespace`` are stored with the vectors for filtered retrieval.
+        """
+        if not texts:
+            return []
+        now = time.time()
+        with self._write(durable) as conn:
+            conn.executemany("INSERT INTO memories(ts, text) VALUES(?,?)", [(now, text) for text in texts])
+            last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            self._count_vocab(conn, texts, 1)
+        rowids = list(range(last - len(texts) + 1, last + 1))
+        self._maybe_index_semantic(texts, rowids, {"source": "memory", "role": role, "namespace": namespace})
+        self.generation += 1
+        return rowids
+
+    @staticmethod
+    def _count_vocab(conn: sqlite3.Connection, texts: Sequence[str], sign: int) -> None:
+        counts = document_frequencies(texts)
+        if not counts:
+            return
+        if sign > 0:
+            conn.executemany(
+                "INSERT INTO memory_vocab(token, df) VALUES(?,?) "
+                "ON CONFLICT(token) DO UPDATE SET df = df + excluded.df",
+                list(counts.items()),
+            )
+        else:
+            conn.executemany(
+                "UPDATE memory_vocab SET df = df - ? WHERE token = ?", [(n, token) for token, n in counts.items()]
+            )
+            conn.execute("DELETE FROM memory_vocab WHERE df <= 0")
+
+    def vocabulary(self, min_freq: int = 2) -> dict[str, int]:
+        """Token -> index for tokens in at least ``min_freq`` memories, in first-seen order."""
+        with self._lock:
+            cur = self._conn.execute("SELECT token FROM memory_vocab WHERE df >= ? ORDER BY rowid", (min_freq,))
+            return {token: i for i, (token,) in enumerate(cur)}
 
     def recent_memories(self, n: int = 64) -> List[str]:
-        conn = sqlite3.connect(self.path)
-        cur = conn.execute("SELECT text FROM memories ORDER BY ts DESC LIMIT ?", (n,))
-        rows = [r[0] for r in cur.fetchall()]
-        conn.close()
-        return rows
+        with self._lock:
+            cur = self._conn.execute("SELECT text FROM memories ORDER BY ts DESC, id DESC LIMIT ?", (n,))
+            return [r[0] for r in cur.fetchall()]
+
+    def search_text(self, query: str, k: int = 6, *, table: str = "memories") -> List[Tuple[str, float]]:
+        """
+        Keyword search over ``memories`` or ``messages`` ranked by BM25 (higher is better).
+        Any query token may match; punctuation is ignored rather than parsed as FTS syntax.
+        """
+        if table not in FTS_TABLES:
+            raise ValueError(f"Unsupported table for text search: {table}")
+        tokens = list(dict.fromkeys(token.lower() for token in _TOKEN.findall(query)))
+        if not tokens or k <= 0:
+            return []
+        if table == "messages":
+            self.flush()
+        with self._lock:
+            if self._fts[table]:
+                match = " OR ".join('"' + token.replace('"', '""') + '"' for token in tokens)
+                cur = self._conn.execute(
+                    f"SELECT text, -bm25({table}_fts) FROM {table}_fts "
+                    f"WHERE {table}_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, k),
+                )
+                return [(text, float(score)) for text, score in cur.fetchall()]
+            # No FTS5 in this SQLite build: scan with LIKE and rank by matched tokens.
+            clause = " OR ".join(["text LIKE ?"] * len(tokens))
+            cur = self._conn.execute(
+                f"SELECT text FROM {table} WHERE {clause}", [f"%{token}%" for token in tokens]
+            )
+            scored = [
+                (text, float(sum(token in text.lower() for token in tokens)))
+                for (text,) in cur.fetchall()
+            ]
+            scored.sort(key=lambda item: item[1], reverse=True)
+            return scored[:k]
+
+    def _has_fts(self, table: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (f"{table}_fts",)
+        ).fetchone()
+        return row is not None
 
     def attach_semantic_hook(
         self,
@@ -46,13 +251,26 @@ class MemoryStore:
     ) -> None:
         self._semantic_hook = (encoder, vector_store)
 
-    def _maybe_index_semantic(self, text: str) -> None:
-        if not self._semantic_hook or not text.strip():
+    def _maybe_index_semantic(self, texts: Sequence[str], rowids: Sequence[int], metadata: dict) -> None:
+        if not self._semantic_hook:
             return
+        pairs = [(text, rowid) for text, rowid in zip(texts, rowids) if text.strip()]
+        if not pairs:
+            return
+        batch = [text for text, _ in pairs]
         encoder, vector_store = self._semantic_hook
-        vector = encoder([text])
+        vectors = encoder(batch)
         try:
-            vector_store.add(text, vector[0])
+            if hasattr(vector_store, "add_many"):
+                vector_store.add_many(
+                    batch,
+                    vectors,
+                    memory_ids=[rowid for _, rowid in pairs],
+                    metadata=[metadata] * len(batch),
+                )
+            else:
+                for text, vector in zip(batch, vectors):
+                    vector_store.add(text, vector)
         except Exception:
             pass
 
@@ -61,29 +279,39 @@ class MemoryStore:
         if max_age_days <= 0:
             return 0
         cutoff_ts = time.time() - (max_age_days * 86400)
-        conn = sqlite3.connect(self.path)
-        cursor = conn.execute(
-            "DELETE FROM memories WHERE ts < ?", (cutoff_ts,)
-        )
-        deleted = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return deleted
+        return self._delete_memories("SELECT id FROM memories WHERE ts < ?", (cutoff_ts,))
 
     def prune_by_count(self, max_count: int) -> int:
         """Keep only the most recent max_count memories. Pass <= 0 to disable."""
         if max_count <= 0:
             return 0
-        conn = sqlite3.connect(self.path)
-        cursor = conn.execute(
-            "DELETE FROM memories WHERE rowid NOT IN "
-            "(SELECT rowid FROM memories ORDER BY ts DESC LIMIT ?)",
-            (max_count,)
+        # Walks idx_memories_ts past the newest max_count rows.
+        return self._delete_memories(
+            "SELECT id FROM memories ORDER BY ts DESC, id DESC LIMIT -1 OFFSET ?",
+            (max_count,),
         )
-        deleted = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return deleted
+
+    def _delete_memories(self, select_sql: str, params: tuple) -> int:
+        """Delete the selected memories and, in the same transaction, their vectors."""
+        vector_store = self._semantic_hook[1] if self._semantic_hook else None
+        cascade = vector_store is not None and hasattr(vector_store, "delete_for_memories")
+        if cascade:
+            # Vectors can only be deleted atomically when they live in this database.
+            cascade = os.path.abspath(getattr(vector_store, "db_path", "")) == os.path.abspath(self.path)
+        with self._write() as conn:
+            rowids = [row[0] for row in conn.execute(select_sql, params).fetchall()]
+            vector_ids = vector_store.delete_for_memories(conn, rowids) if cascade and rowids else []
+            for start in range(0, len(rowids), 500):
+                chunk = rowids[start : start + 500]
+                marks = ",".join("?" * len(chunk))
+                texts = [row[0] for row in conn.execute(f"SELECT text FROM memories WHERE id IN ({marks})", chunk)]
+                self._count_vocab(conn, texts, -1)
+                conn.execute(f"DELETE FROM memories WHERE id IN ({marks})", chunk)
+        if vector_ids:
+            vector_store.forget(vector_ids)
+        if rowids:
+            self.generation += 1
+        return len(rowids)
 
     def auto_prune(self, max_age: int, max_count: int) -> None:
         """Auto-prune based on config"""
@@ -92,12 +320,12 @@ class MemoryStore:
 
     def clear_all(self) -> int:
         """Clear all memories and messages. Returns total deleted count."""
-        conn = sqlite3.connect(self.path)
-        cursor1 = conn.execute("DELETE FROM memories")
-        cursor2 = conn.execute("DELETE FROM messages")
-        deleted = cursor1.rowcount + cursor2.rowcount
-        conn.commit()
-        conn.close()
+        with self._write() as conn:
+            cursor1 = conn.execute("DELETE FROM memories")
+            cursor2 = conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM memory_vocab")
+            deleted = cursor1.rowcount + cursor2.rowcount
+        self.generation += 1
         
         # Clear vector index if attached
         if self._semantic_hook:
@@ -109,3 +337,9 @@ class MemoryStore:
                 pass
         
         return deleted
+
+
+def _close_at_exit(ref: "weakref.ref[MemoryStore]") -> None:
+    store = ref()
+    if store is not None:
+        store.close()
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Categorical columns stored next to ``ts``; each is dictionary-encoded to int32 codes.
+METADATA_COLUMNS = ("source", "role", "namespace")
+
+# Snapshot side columns (name -> dtype) holding ``VectorMetadata.arrays``.
+SNAPSHOT_COLUMNS = {"ts": "float64", **{column: "int32" for column in METADATA_COLUMNS}}
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """Pre-filter for vector search; ``None`` fields match everything."""
+
+    since: Optional[float] = None
+    until: Optional[float] = None
+    sources: Optional[Tuple[str, ...]] = None
+    roles: Optional[Tuple[str, ...]] = None
+    namespaces: Optional[Tuple[str, ...]] = None
+
+    def values(self, column: str) -> Optional[Tuple[str, ...]]:
+        return getattr(self, column + "s")
+
+
+class VectorMetadata:
+    """
+    Columnar metadata aligned row-for-row with the VectorStore buffer.
+
+    ``ts`` is float64 seconds; categorical columns hold codes into a per-column
+    vocabulary where 0 means NULL. Filters and recency weights are computed with
+    whole-array NumPy operations, never per row in Python.
+    """
+
+    def __init__(self) -> None:
+        self.ts = np.zeros(0, dtype=np.float64)
+        self.codes: Dict[str, np.ndarray] = {c: np.zeros(0, dtype=np.int32) for c in METADATA_COLUMNS}
+        self.vocab: Dict[str, Dict[str, int]] = {c: {} for c in METADATA_COLUMNS}
+
+    def _code(self, column: str, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        vocab = self.vocab[column]
+        code = vocab.get(value)
+        if code is None:
+            code = vocab[value] = len(vocab) + 1
+        return code
+
+    def _reserve(self, needed: int) -> None:
+        if len(self.ts) >= needed:
+            return
+        capacity = max(needed, len(self.ts) * 2, 16)
+        ts = np.zeros(capacity, dtype=np.float64)
+        ts[: len(self.ts)] = self.ts
+        self.ts = ts
+        for column, codes in self.codes.items():
+            grown = np.zeros(capacity, dtype=np.int32)
+            grown[: len(codes)] = codes
+            self.codes[column] = grown
+
+    def write(self, start: int, ts: Sequence[float], rows: Sequence[Mapping[str, Optional[str]]]) -> None:
+        """Store metadata for buffer rows [start, start + len(ts))."""
+        stop = start + len(ts)
+        self._reserve(stop)
+        self.ts[start:stop] = ts
+        for column in METADATA_COLUMNS:
+            self.codes[column][start:stop] = [self._code(column, row.get(column)) for row in rows]
+
+    def assign(
+        self,
+        count: int,
+        positions: np.ndarray,
+        ts: np.ndarray,
+        values: Mapping[str, Sequence[Optional[str]]],
+    ) -> None:
+        """Reset to ``count`` rows and fill ``positions`` from whole columns."""
+        self.ts = np.zeros(count, dtype=np.float64)
+        self.ts[positions] = ts
+        for column in METADATA_COLUMNS:
+            codes = np.zeros(count, dtype=np.int32)
+            encoded = (self._code(column, value) for value in values[column])
+            codes[positions] = np.fromiter(encoded, dtype=np.int32, count=len(positions))
+            self.codes[column] = codes
+
+    def arrays(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Rows [start, stop) as the ``SNAPSHOT_COLUMNS`` arrays."""
+        arrays = {"ts": self.ts[start:stop]}
+        arrays.update((c, self.codes[c][start:stop]) for c in METADATA_COLUMNS)
+        return arrays
+
+    def load_arrays(
+        self, arrays: Mapping[str, np.ndarray], vocab: Mapping[str, Sequence[str]]
+    ) -> None:
+        """Inverse of ``arrays`` plus ``vocab_header``; copies out of memory-mapped files."""
+        self.ts = np.array(arrays["ts"], dtype=np.float64)
+        for column in METADATA_COLUMNS:
+            self.codes[column] = np.array(arrays[column], dtype=np.int32)
+            self.vocab[column] = {value: i + 1 for i, value in enumerate(vocab.get(column, ()))}
+
+    def vocab_header(self) -> Dict[str, List[str]]:
+        """Each column's vocabulary in code order (code = index + 1)."""
+        return {column: list(vocab) for column, vocab in self.vocab.items()}
+
+    def take(self, positions: np.ndarray) -> None:
+        """Keep only ``positions`` (compaction)."""
+        self.ts = self.ts[positions]
+        for column in METADATA_COLUMNS:
+            self.codes[column] = self.codes[column][positions]
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def mask(self, where: MetadataFilter, count: int) -> np.ndarray:
+        """Boolean mask over the first ``count`` rows matching ``where``."""
+        keep = np.ones(count, dtype=bool)
+        if where.since is not None:
+            keep &= self.ts[:count] >= where.since
+        if where.until is not None:
+            keep &= self.ts[:count] <= where.until
+        for column in METADATA_COLUMNS:
+            wanted = where.values(column)
+            if wanted is None:
+                continue
+            vocab = self.vocab[column]
+            codes = [vocab[value] for value in wanted if value in vocab]
+            keep &= np.isin(self.codes[column][:count], codes)
+        return keep
+
+    def decay(self, count: int, now: float, half_life: float) -> np.ndarray:
+        """Recency weights 0.5 ** (age / half_life) for the first ``count`` rows."""
+        age = np.maximum(now - self.ts[:count], 0.0)
+        return np.exp2(-age / half_life).astype(np.float32)
+
+
+__all__ = ["METADATA_COLUMNS", "MetadataFilter", "SNAPSHOT_COLUMNS", "VectorMetadata"]
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+_SUFFIXES = {"float32": ".f32", "float16": ".f16", "int8": ".i8"}
+
+
+class EmbeddingSnapshot:
+    """
+    Append-only on-disk copy of the embedding matrix, memory-mapped read-only.
+
+    Layout for ``base``:
+      - ``<base>.f32``  raw row-major matrix (count x dim); ``.f16``/``.i8`` for
+        quantized storage
+      - ``<base>.ids``  raw int64 row ids aligned with the matrix
+      - ``<base>.<name>`` one raw array per ``columns`` entry (e.g. metadata),
+        aligned with the matrix
+      - ``<base>.dead`` raw int64 ids of rows deleted since the last rewrite
+      - ``<base>.json`` header {version, dim, dtype, count, generation, dead,
+        columns, extra}
+
+    The header is the source of truth: bytes past ``count`` rows or ``dead``
+    ids (e.g. from an interrupted append) are ignored and truncated on the next
+    append. Deletes only append tombstones (``retag``); ``rewrite`` drops them.
+    Every process mapping the same files shares the kernel page cache.
+    """
+
+    def __init__(
+        self,
+        base: str,
+        dim: int,
+        dtype: str = "float32",
+        *,
+        columns: Mapping[str, str] | None = None,
+    ):
+        self.base = Path(base)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        # Column name -> dtype of the per-row side arrays.
+        self.columns = {name: np.dtype(kind) for name, kind in (columns or {}).items()}
+        # Free-form header payload owned by the caller (e.g. quantizer parameters).
+        self.extra: dict = {}
+        # Filled by ``load``: side arrays found on disk and tombstoned ids (None
+        # when the snapshot predates them).
+        self.loaded_columns: Dict[str, np.ndarray] = {}
+        self.dead_ids: Optional[np.ndarray] = None
+        self.data_path = self.base.with_name(self.base.name + _SUFFIXES[self.dtype.name])
+        self.ids_path = self.base.with_name(self.base.name + ".ids")
+        self.dead_path = self.base.with_name(self.base.name + ".dead")
+        self.header_path = self.base.with_name(self.base.name + ".json")
+
+    def column_path(self, name: str) -> Path:
+        return self.base.with_name(f"{self.base.name}.{name}")
+
+    def read_header(self) -> Optional[dict]:
+        try:
+            header = json.loads(self.header_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if (
+            header.get("version") != SNAPSHOT_VERSION
+            or header.get("dim") != self.dim
+            or header.get("dtype") != self.dtype.name
+        ):
+            return None
+        return header
+
+    def load(self, generation: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Map (ids, matrix) when the snapshot matches ``generation``; None if stale."""
+        header = self.read_header()
+        if header is None or header.get("generation") != generation:
+            return None
+        count = int(header.get("count", 0))
+        row_bytes = self.dim * self.dtype.itemsize
+        if not self._has_bytes(self.data_path, count * row_bytes) or not self._has_bytes(
+            self.ids_path, count * 8
+        ):
+            return None
+        self.extra = dict(header.get("extra") or {})
+        self.loaded_columns = {}
+        for name in self._header_columns(header):
+            path = self.column_path(name)
+            if self._has_bytes(path, count * self.columns[name].itemsize):
+                self.loaded_columns[name] = (
+                    np.memmap(path, dtype=self.columns[name], mode="r", shape=(count,))
+                    if count
+                    else np.zeros(0, dtype=self.columns[name])
+                )
+        self.dead_ids = None
+        if "dead" in header:
+            dead = int(header["dead"])
+            if self._has_bytes(self.dead_path, dead * 8):
+                self.dead_ids = np.fromfile(self.dead_path, dtype=np.int64, count=dead)
+        return self._map(count)
+
+    def _header_columns(self, header: dict) -> Sequence[str]:
+        return [name for name in header.get("columns", ()) if name in self.columns]
+
+    @staticmethod
+    def _has_bytes(path: Path, size: int) -> bool:
+        try:
+            return path.stat().st_size >= size
+        except OSError:
+            return size == 0
+
+    def _map(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        if count == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=self.dtype)
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(count,))
+        matrix = np.memmap(self.data_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+        return ids, matrix
+
+    def append(
+        self,
+        ids: np.ndarray,
+        matrix: np.ndarray,
+        *,
+        expected_generation: int,
+        generation: int,
+        columns: Mapping[str, np.ndarray] | None = None,
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Append rows (and their side ``columns``) and return the remapped (ids, matrix).
+
+        Returns None (and invalidates the snapshot) when another writer moved the
+        header since ``expected_generation``; the next boot rebuilds from SQLite.
+        """
+        header = self.read_header()
+        if header is None or header.get("generation") != expected_generation:
+            self.invalidate()
+            return None
+        count = int(header["count"])
+        row_bytes = self.dim * self.dtype.itemsize
+        self._append_bytes(self.data_path, count * row_bytes, matrix.astype(self.dtype).tobytes())
+        self._append_bytes(self.ids_path, count * 8, ids.astype(np.int64).tobytes())
+        # A column missing from this append can no longer be trusted.
+        kept = [name for name in self._header_columns(header) if columns and name in columns]
+        for name in kept:
+            kind = self.columns[name]
+            payload = np.ascontiguousarray(columns[name], dtype=kind).tobytes()
+            self._append_bytes(self.column_path(name), count * kind.itemsize, payload)
+        count += len(ids)
+        dead = header.get("dead")
+        dead = None if dead is None else int(dead)
+        self._write_header(count, generation, dead=dead, columns=kept)
+        return self._map(count)
+
+    def retag(
+        self, *, expected_generation: int, generation: int, dead_ids: Sequence[int] = ()
+    ) -> bool:
+        """
+        Record rows deleted from SQLite as tombstones and move the header to
+        ``generation``; their bytes stay until the next ``rewrite``. Invalidates
+        and returns False when another writer moved the header.
+        """
+        header = self.read_header()
+        if header is None or header.get("generation") != expected_generation:
+            self.invalidate()
+            return False
+        dead = header.get("dead")
+        if dead is not None:
+            payload = np.asarray(dead_ids, dtype=np.int64).tobytes()
+            self._append_bytes(self.dead_path, int(dead) * 8, payload)
+            dead = int(dead) + len(dead_ids)
+        columns = self._header_columns(header)
+        self._write_header(int(header["count"]), generation, dead=dead, columns=columns)
+        return True
+
+    def rewrite(
+        self,
+        ids: np.ndarray,
+        matrix: np.ndarray,
+        generation: int,
+        columns: Mapping[str, np.ndarray] | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Replace the snapshot atomically with the given rows; tombstones are dropped."""
+        self.base.parent.mkdir(parents=True, exist_ok=True)
+        names = [name for name in self.columns if columns and name in columns]
+        payloads = [
+            (self.data_path, np.ascontiguousarray(matrix, dtype=self.dtype).tobytes()),
+            (self.ids_path, np.ascontiguousarray(ids, dtype=np.int64).tobytes()),
+            (self.dead_path, b""),
+        ]
+        for name in names:
+            payload = np.ascontiguousarray(columns[name], dtype=self.columns[name]).tobytes()
+            payloads.append((self.column_path(name), payload))
+        for path, payload in payloads:
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(payload)
+            os.replace(tmp, path)
+        self._write_header(len(ids), generation, dead=0, columns=names)
+        return self._map(len(ids))
+
+    def invalidate(self) -> None:
+        try:
+            self.header_path.unlink()
+        except OSError:
+            pass
+
+    def _append_bytes(self, path: Path, offset: int, payload: bytes) -> None:
+        mode = "r+b" if path.exists() else "w+b"
+        with path.open(mode) as handle:
+            handle.truncate(offset)
+            handle.seek(offset)
+            handle.write(payload)
+
+    def _write_header(
+        self, count: int, generation: int, *, dead: Optional[int] = 0, columns: Sequence[str] = ()
+    ) -> None:
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "count": count,
+            "generation": generation,
+            "columns": list(columns),
+            "extra": self.extra,
+        }
+        if dead is not None:
+            header["dead"] = dead
+        tmp = self.header_path.with_name(self.header_path.name + ".tmp")
+        tmp.write_text(json.dumps(header), encoding="utf-8")
+        os.replace(tmp, self.header_path)
+
+
+__all__ = ["EmbeddingSnapshot", "SNAPSHOT_VERSION"]
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import json
+import os
 import sqlite3
+import threading
 import time
 from pathlib import Path
-from typing import List, Sequence, Tuple
+from typing import Any, Callable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
 
 import numpy as np
 
+from .clustering import MiniBatchKMeans
+from .quantization import ScalarQuantizer
+from .schema import ensure_indexes
+from .vector_metadata import METADATA_COLUMNS, SNAPSHOT_COLUMNS, MetadataFilter, VectorMetadata
+from .vector_snapshot import EmbeddingSnapshot
+
 try:
     import faiss  # type: ignore
 except ImportError:  # pragma: no cover - optional
@@ -16,6 +25,32 @@ except ImportError:  # pragma: no cover - optional
         faiss = None  # type: ignore[assignment]
 
 
+# Similarity block size (rows x queries) for the NumPy search path.
+_SCORE_BLOCK = 4_000_000
+
+# Fewest rows int8 bounds are learned from; smaller corpora get fixed bounds.
+_MIN_QUANTIZER_ROWS = 256
+
+# Columns added after the first release; created with ALTER TABLE on old databases.
+_EXTRA_COLUMNS = {"memory_id": "INTEGER", "source": "TEXT", "role": "TEXT", "namespace": "TEXT"}
+
+
+class _View(NamedTuple):
+    """
+    Rows one search works on, captured under ``_index_lock``. Writers never
+    change these arrays below ``count`` in place (appends go past it, removals
+    and compaction swap in new arrays), so a view stays consistent while the
+    maintenance worker deletes or compacts.
+    """
+
+    matrix: np.ndarray
+    ids: np.ndarray
+    alive: np.ndarray
+    count: int
+    index: Any
+    index_dead: int
+
+
 class VectorStore:
     """
     Lightweight sqlite + (optional) faiss-lite index for semantic memories.
@@ -30,6 +65,19 @@ class VectorStore:
         metric: str = "cosine",
         normalize: bool = True,
         index_path: str | None = None,
+        snapshot_path: str | None = None,
+        embedder_id: str | None = None,
+        save_interval: float = 30.0,
+        train_threshold: int = 20000,
+        retrain_growth: float = 4.0,
+        nprobe: int = 16,
+        ef_search: int = 64,
+        background_training: bool = True,
+        storage: str = "float32",
+        rescore_factor: int = 4,
+        compact_ratio: float = 0.25,
+        clusters: int = 4,
+        clusters_path: str | None = None,
     ):
         self.db_path = db_path
         self.dim = dim
@@ -37,9 +85,34 @@ class VectorStore:
         self.metric = metric
         self.normalize = normalize
         self.index_path = index_path
+        self.embedder_id = embedder_id
+        self.save_interval = save_interval
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.train_threshold = train_threshold
+        self.retrain_growth = retrain_growth
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.background_training = background_training
+        # Rows the current ANN index was trained on; 0 while serving from flat search.
+        self._trained_count = 0
+        self._trainable: bool | None = None
+        self._train_thread: threading.Thread | None = None
+        self._index_lock = threading.RLock()
+        # Resident rows are kept as ``storage`` codes; float32 lives only in SQLite.
+        self._quantizer = ScalarQuantizer(storage)
+        self.storage = storage
+        self.rescore_factor = max(1, rescore_factor)
+        self.compact_ratio = compact_ratio
+        # Cluster view: mini-batch k-means kept up to date by add_many, saved on flush.
+        self.clusters = clusters
+        self.clusters_path = clusters_path
+        self._kmeans = MiniBatchKMeans.load(clusters_path, dim) if clusters_path else None
+        self._kmeans_dirty = False
 
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(db_path)
+        # Shared with the maintenance worker; in-memory mutations are serialized by _index_lock.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.execute(
             """
             CREATE TABLE IF NOT EXISTS memory_vectors(
@@ -50,102 +123,1005 @@ class VectorStore:
             )
             """
         )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(memory_vectors)")}
+        for name, kind in _EXTRA_COLUMNS.items():
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE memory_vectors ADD COLUMN {name} {kind}")
+        ensure_indexes(self.conn, "memory_vectors")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS memory_vectors_meta(k TEXT PRIMARY KEY, v INTEGER)")
+        self.conn.execute("INSERT OR IGNORE INTO memory_vectors_meta(k, v) VALUES('generation', 0)")
         self.conn.commit()
-        self._use_faiss = faiss is not None
-        self._records: List[Tuple[int, str]] = []
-        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        # A quantized flat store searches its own compact codes; FAISS would add a float32 copy.
+        self._use_faiss = faiss is not None and (storage == "float32" or self._is_ann_factory())
+        # Preallocated embedding buffer; only the first ``_count`` rows are live.
+        self._buffer = np.zeros((0, dim), dtype=self._quantizer.dtype)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        # Tombstone bitmap over buffer rows; removed rows stay until compaction.
+        self._alive = np.ones(0, dtype=bool)
+        self._dead = 0
+        # ts/source/role/namespace columns aligned with the buffer rows.
+        self._meta = VectorMetadata()
+        # Removed rows still present in a FAISS index that cannot remove_ids (e.g. HNSW).
+        self._index_dead = 0
+        self._snapshot = (
+            EmbeddingSnapshot(
+                snapshot_path, dim, dtype=self._quantizer.dtype.name, columns=SNAPSHOT_COLUMNS
+            )
+            if snapshot_path
+            else None
+        )
+        self._mapped = False
+        self.generation = self._read_generation()
         self._index = self._build_index()
         self._load_existing()
 
-    def add(self, text: str, vector: np.ndarray) -> int:
-        vec = self._normalize(vector)
-        blob = vec.astype(np.float32).tobytes()
-        cur = self.conn.execute(
-            "INSERT INTO memory_vectors(text, embedding, ts) VALUES(?,?,?)",
-            (text, sqlite3.Binary(blob), time.time()),
+    @property
+    def _matrix(self) -> np.ndarray:
+        return self._buffer[: self._count]
+
+    def __len__(self) -> int:
+        return self._count - self._dead
+
+    def _view(self) -> _View:
+        # Caller holds _index_lock.
+        count = self._count
+        return _View(
+            self._buffer[:count],
+            self._ids[:count],
+            self._alive[:count],
+            count,
+            self._index if self._use_faiss else None,
+            self._index_dead,
         )
-        self.conn.commit()
-        rowid = int(cur.lastrowid)
-        self._records.append((rowid, text))
-        self._matrix = np.vstack([self._matrix, vec[None, :]]) if self._matrix.size else vec[None, :]
-        if self._use_faiss:
-            self._index.add(vec.reshape(1, -1))
-        return rowid
-
-    def search(self, vector: np.ndarray, top_k: int = 6) -> List[Tuple[str, float]]:
-        if not self._records or vector.size == 0:
+
+    def add(
+        self,
+        text: str,
+        vector: np.ndarray,
+        memory_id: int | None = None,
+        metadata: Mapping[str, Optional[str]] | None = None,
+    ) -> int:
+        memory_ids = None if memory_id is None else [memory_id]
+        return self.add_many(
+            [text],
+            np.asarray(vector).reshape(1, -1),
+            memory_ids=memory_ids,
+            metadata=None if metadata is None else [metadata],
+        )[0]
+
+    def add_many(
+        self,
+        texts: Sequence[str],
+        vectors: np.ndarray,
+        *,
+        memory_ids: Sequence[int] | None = None,
+        metadata: Sequence[Mapping[str, Optional[str]]] | None = None,
+    ) -> List[int]:
+        """
+        Insert a batch in one transaction and one index update. Returns row ids.
+        ``metadata`` rows may carry ``source``/``role``/``namespace`` for filtering.
+        """
+        if not len(texts):
             return []
-        query = self._normalize(vector)
+        links = list(memory_ids) if memory_ids is not None else [None] * len(texts)
+        meta_rows = list(metadata) if metadata is not None else [{}] * len(texts)
+        matrix = self._normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {matrix.shape[1]}")
+        now = time.time()
+        rows = [
+            (text, sqlite3.Binary(vec.tobytes()), now, link, *(meta.get(c) for c in METADATA_COLUMNS))
+            for text, vec, link, meta in zip(texts, matrix, links, meta_rows)
+        ]
+        previous = self.generation
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO memory_vectors(text, embedding, ts, memory_id, source, role, namespace) "
+                "VALUES(?,?,?,?,?,?,?)",
+                rows,
+            )
+            # AUTOINCREMENT ids are contiguous while this transaction holds the write lock.
+            last = int(self.conn.execute("SELECT last_insert_rowid()").fetchone()[0])
+            self.generation = self._bump_generation()
+        rowids = np.arange(last - len(rows) + 1, last + 1, dtype=np.int64)
+        with self._index_lock:
+            # Buffer and index move together so a background retrain sees a consistent tail.
+            self._meta.write(self._count, [now] * len(rows), meta_rows)
+            self._append_rows(rowids, matrix, previous)
+            if self._use_faiss and self._index is not None:
+                self._index.add_with_ids(matrix, rowids)
+            if self._kmeans is not None:
+                self._kmeans.partial_fit(matrix, rowids)
+                self._kmeans_dirty = True
+        self._maybe_requantize()
         if self._use_faiss and self._index is not None:
-            scores, idxs = self._index.search(query.reshape(1, -1), top_k)
-            return self._gather_results(idxs[0], scores[0])
-        sims = self._matrix @ query
-        top_idx = np.argsort(-sims)[:top_k]
-        return [(self._records[i][1], float(sims[i])) for i in top_idx]
-
-    def _gather_results(self, idxs: np.ndarray, scores: np.ndarray) -> List[Tuple[str, float]]:
-        results = []
-        for i, idx in enumerate(idxs):
-            if idx < 0 or idx >= len(self._records):
+            self._dirty = True
+            self._maybe_train()
+            self._maybe_persist()
+        return rowids.tolist()
+
+    def _fit_quantizer(self, matrix: np.ndarray) -> None:
+        if self.normalize:
+            self._quantizer.fit_range(self.dim)  # unit rows: [-1, 1] holds for any corpus
+        elif len(matrix) < _MIN_QUANTIZER_ROWS:
+            # Bounds from a handful of rows would saturate later ones; leave headroom
+            # until _maybe_requantize learns them from the grown corpus.
+            bound = max(1.0, 2.0 * float(np.abs(matrix).max(initial=0.0)))
+            self._quantizer.fit_range(self.dim, -bound, bound)
+        else:
+            self._quantizer.fit(matrix)
+
+    def _maybe_requantize(self) -> int:
+        """
+        Relearn int8 bounds from the float32 rows in SQLite once the corpus has
+        doubled since they were fitted, and re-encode the buffer, snapshot and
+        index. Returns rows re-encoded.
+        """
+        quantizer = self._quantizer
+        if quantizer.kind != "int8" or self.normalize:
+            return 0
+        return self._without_training(
+            lambda: len(self) >= max(_MIN_QUANTIZER_ROWS, 2 * self._quantizer.rows),
+            self._requantize_locked,
+        )
+
+    def _requantize_locked(self) -> int:
+        count = self._count
+        ids = self._ids[:count]
+        # Removed rows are gone from SQLite; they keep their decoded values.
+        matrix = self._quantizer.decode(self._matrix)
+        exact = self._exact_vectors(ids)
+        have = np.fromiter((int(i) in exact for i in ids), dtype=bool, count=count)
+        if have.any():
+            matrix[have] = np.stack([exact[int(i)] for i in ids[have]])
+        self._quantizer.fit(matrix[have & self._alive[:count]])
+        self._buffer = self._quantizer.encode(matrix)
+        self._ids = np.array(ids, dtype=np.int64)
+        if self._snapshot is not None:
+            self._snapshot.extra["quantizer"] = self._quantizer.to_header()
+            self._rewrite_snapshot()
+        if self._use_faiss and self._index is not None:
+            self._index = self._build_index()
+            self._trained_count = 0
+            self._index_add_range(self._index, 0, self._count)
+            self._index_dead = 0
+            self._dirty = True
+        return count
+
+    def _rewrite_snapshot(self) -> None:
+        """Replace the snapshot with the live buffer rows and their metadata."""
+        count = self._count
+        self._snapshot.extra["vocab"] = self._meta.vocab_header()
+        self._ids, self._buffer = self._snapshot.rewrite(
+            self._ids[:count], self._buffer[:count], self.generation, self._meta.arrays(0, count)
+        )
+        self._mapped = True
+
+    def _append_rows(self, rowids: np.ndarray, matrix: np.ndarray, previous_generation: int) -> None:
+        if not self._quantizer.fitted:
+            self._fit_quantizer(matrix)
+            if self._snapshot is not None:
+                self._snapshot.extra["quantizer"] = self._quantizer.to_header()
+        codes = self._quantizer.encode(matrix)
+        if self._mapped and self._snapshot is not None:
+            # Metadata for these rows is already written (add_many fills it first).
+            self._snapshot.extra["vocab"] = self._meta.vocab_header()
+            mapped = self._snapshot.append(
+                rowids,
+                codes,
+                expected_generation=previous_generation,
+                generation=self.generation,
+                columns=self._meta.arrays(self._count, self._count + len(rowids)),
+            )
+            if mapped is not None:
+                self._ids, self._buffer = mapped
+                self._count = len(self._ids)
+                self._grow_alive()
+                return
+            # Another writer touched the snapshot: fall back to private memory.
+            self._buffer = np.array(self._matrix)
+            self._ids = np.array(self._ids[: self._count], dtype=np.int64)
+            self._mapped = False
+        needed = self._count + len(matrix)
+        capacity = self._buffer.shape[0]
+        if needed > capacity:
+            size = max(needed, capacity * 2, 16)
+            grown = np.zeros((size, self.dim), dtype=self._quantizer.dtype)
+            grown[: self._count] = self._buffer[: self._count]
+            self._buffer = grown
+            grown_ids = np.zeros(size, dtype=np.int64)
+            grown_ids[: self._count] = self._ids[: self._count]
+            self._ids = grown_ids
+        self._buffer[self._count : needed] = codes
+        self._ids[self._count : needed] = rowids
+        self._count = needed
+        self._grow_alive()
+
+    def _grow_alive(self) -> None:
+        if len(self._alive) >= self._count:
+            return
+        grown = np.ones(max(self._count, len(self._alive) * 2, 16), dtype=bool)
+        grown[: len(self._alive)] = self._alive
+        self._alive = grown
+
+    def _positions(self, labels: np.ndarray, view: Optional[_View] = None) -> np.ndarray:
+        """Map SQLite row ids (FAISS labels) to live buffer positions; -1 if unknown or removed."""
+        view = view or self._view()
+        labels = np.asarray(labels, dtype=np.int64)
+        if not view.count or not labels.size:
+            return np.full(labels.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(view.ids, labels), view.count - 1)
+        ok = (labels >= 0) & (view.ids[pos] == labels) & view.alive[pos]
+        return np.where(ok, pos, -1)
+
+    def remove(self, ids: Sequence[int]) -> int:
+        """Delete vectors by row id from SQLite and the in-memory index. Returns rows removed."""
+        with self.conn:
+            self.delete_rows(self.conn, ids)
+        return self.forget(ids)
+
+    def delete_rows(self, conn: sqlite3.Connection, ids: Sequence[int]) -> None:
+        """Delete rows inside the caller's transaction; call ``forget`` after it commits."""
+        wanted = [int(i) for i in ids]
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM memory_vectors WHERE id IN ({marks})", chunk)
+        if wanted:
+            conn.execute("UPDATE memory_vectors_meta SET v = v + 1 WHERE k='generation'")
+
+    def delete_for_memories(self, conn: sqlite3.Connection, memory_ids: Sequence[int]) -> List[int]:
+        """Cascade a ``memories`` delete to its vectors within ``conn``'s transaction."""
+        found: List[int] = []
+        wanted = [int(i) for i in memory_ids]
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = conn.execute(f"SELECT id FROM memory_vectors WHERE memory_id IN ({marks})", chunk)
+            found.extend(int(row[0]) for row in cur.fetchall())
+            # Rows written before memory_id existed are matched by text.
+            cur = conn.execute(
+                "SELECT v.id FROM memory_vectors v JOIN memories m ON m.text = v.text "
+                f"WHERE v.memory_id IS NULL AND m.rowid IN ({marks})",
+                chunk,
+            )
+            found.extend(int(row[0]) for row in cur.fetchall())
+        found = sorted(set(found))
+        self.delete_rows(conn, found)
+        return found
+
+    def forget(self, ids: Sequence[int]) -> int:
+        """Tombstone already-deleted rows in memory and drop them from the FAISS index."""
+        labels = np.unique(np.asarray(list(ids), dtype=np.int64))
+        with self._index_lock:
+            pos = self._positions(labels)
+            labels, pos = labels[pos >= 0], pos[pos >= 0]
+            if not len(pos):
+                return 0
+            # Copy-on-write: searches in flight keep the bitmap they started with.
+            alive = self._alive.copy()
+            alive[pos] = False
+            self._alive = alive
+            self._dead += len(pos)
+            if self._use_faiss and self._index is not None:
+                try:
+                    self._index.remove_ids(labels)
+                except Exception:
+                    self._index_dead += len(pos)  # filtered at search time until compaction
+                self._dirty = True
+            previous_generation, self.generation = self.generation, self._read_generation()
+            if self._mapped and not self._snapshot.retag(
+                expected_generation=previous_generation, generation=self.generation, dead_ids=labels
+            ):
+                # Another writer touched the snapshot: fall back to private memory.
+                self._buffer = np.array(self._matrix)
+                self._ids = np.array(self._ids[: self._count], dtype=np.int64)
+                self._mapped = False
+        # Tombstones persist (a mapped snapshot drops them on load), so compact lazily.
+        self.compact(force=False)
+        return len(pos)
+
+    def compact(self, *, force: bool = True) -> int:
+        """
+        Drop tombstoned rows from the buffer, snapshot and index. Returns rows
+        dropped. Unless ``force``, only once they exceed ``compact_ratio``.
+        """
+        dropped = self._without_training(
+            lambda: self._dead > 0 and (force or self._dead > self.compact_ratio * self._count),
+            self._compact_locked,
+        )
+        if dropped:
+            self._maybe_requantize()
+            self._maybe_train()
+        return dropped
+
+    def _without_training(self, due: Callable[[], bool], action: Callable[[], int]) -> int:
+        """
+        Run ``action`` under ``_index_lock`` if ``due()`` holds there. Background
+        training holds buffer positions, so it is joined first, but only when
+        the action will actually run.
+        """
+        while True:
+            with self._index_lock:
+                if not due():
+                    return 0
+                training = self._train_thread
+                if training is None or not training.is_alive():
+                    return action()
+            training.join()
+
+    def _compact_locked(self) -> int:
+        keep = np.flatnonzero(self._alive[: self._count])
+        dropped = self._count - len(keep)
+        self._buffer = np.array(self._matrix[keep])
+        self._ids = np.array(self._ids[: self._count][keep], dtype=np.int64)
+        self._meta.take(keep)
+        self._count = len(keep)
+        self._alive = np.ones(self._count, dtype=bool)
+        self._dead = 0
+        if self._snapshot is not None:
+            self._rewrite_snapshot()
+        if self._use_faiss and self._index is not None and self._index_dead:
+            self._index = self._build_index()
+            self._trained_count = 0
+            self._index_add_range(self._index, 0, self._count)
+            self._index_dead = 0
+            self._dirty = True
+        return dropped
+
+    def _index_add_range(self, index, start: int, stop: int) -> None:
+        live = start + np.flatnonzero(self._alive[start:stop])
+        if not len(live):
+            return
+        index.add_with_ids(self._decoded(live), np.ascontiguousarray(self._ids[live], dtype=np.int64))
+
+    def _read_generation(self) -> int:
+        row = self.conn.execute("SELECT v FROM memory_vectors_meta WHERE k='generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump_generation(self) -> int:
+        self.conn.execute("UPDATE memory_vectors_meta SET v = v + 1 WHERE k='generation'")
+        return self._read_generation()
+
+    def _texts(self, ids: Sequence[int]) -> dict[int, str]:
+        """Fetch texts lazily by row id (the matrix itself never holds text)."""
+        found: dict[int, str] = {}
+        wanted = [int(i) for i in ids]
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = self.conn.execute(f"SELECT id, text FROM memory_vectors WHERE id IN ({marks})", chunk)
+            found.update((int(rid), text) for rid, text in cur.fetchall())
+        return found
+
+    def _exact_vectors(self, ids: Sequence[int]) -> dict[int, np.ndarray]:
+        """Full-precision rows read lazily from SQLite (used for rescoring)."""
+        found: dict[int, np.ndarray] = {}
+        wanted = [int(i) for i in ids]
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            cur = self.conn.execute(f"SELECT id, embedding FROM memory_vectors WHERE id IN ({marks})", chunk)
+            found.update((int(rid), np.frombuffer(blob, dtype=np.float32)) for rid, blob in cur.fetchall())
+        return found
+
+    def search(
+        self,
+        vector: np.ndarray,
+        top_k: int = 6,
+        *,
+        where: MetadataFilter | None = None,
+        half_life: float | None = None,
+        now: float | None = None,
+    ) -> List[Tuple[str, float]]:
+        if vector.size == 0:
+            return []
+        return self.search_many(
+            np.asarray(vector).reshape(1, -1), top_k, where=where, half_life=half_life, now=now
+        )[0]
+
+    def search_many(
+        self,
+        queries: np.ndarray,
+        top_k: int = 6,
+        *,
+        where: MetadataFilter | None = None,
+        half_life: float | None = None,
+        now: float | None = None,
+        with_ids: bool = False,
+    ) -> List[List[tuple]]:
+        """
+        Top-k for a batch of queries: one FAISS call, or blocked matmul + argpartition.
+
+        ``where`` restricts candidates before scoring (a FAISS ID selector on the
+        index path). ``half_life`` (seconds) weights similarity by recency:
+        ``sim * 0.5 ** (age / half_life)``. With ``with_ids`` each match is
+        ``(text, score, row_id)`` instead of ``(text, score)``.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if not len(self) or not len(queries) or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        queries = self._normalize_rows(queries)
+        # Everything below reads this view only, never the live (mutable) attributes.
+        with self._index_lock:
+            view = self._view()
+            mask = self._candidate_mask(where, view)
+            weights = (
+                self._meta.decay(view.count, time.time() if now is None else now, half_life)
+                if half_life
+                else None
+            )
+        if not view.count or (mask is not None and not mask.any()):
+            return [[] for _ in range(len(queries))]
+        quantized = self.storage != "float32"
+        faiss_path = view.index is not None
+        # Re-weighting after the fact needs a wider candidate pool to pick from.
+        widen = quantized or (weights is not None and faiss_path)
+        fetch = top_k * self.rescore_factor if widen else top_k
+        if faiss_path:
+            rows = self._faiss_topk(view, queries, fetch, mask)
+        else:
+            rows = self._topk_blocked(view, queries, fetch, mask, weights)
+        if quantized:
+            rows = self._rescore_many(view, queries, rows, fetch if weights is not None else top_k)
+        if weights is not None and widen:
+            rows = self._reweight(rows, weights, top_k)
+        return self._gather_many(view, rows, with_ids)
+
+    def _candidate_mask(self, where: MetadataFilter | None, view: _View) -> Optional[np.ndarray]:
+        """Rows eligible for search, or None when every row is."""
+        if where is None:
+            return None if view.alive.all() else view.alive.copy()
+        return self._meta.mask(where, view.count) & view.alive
+
+    def _faiss_topk(
+        self, view: _View, queries: np.ndarray, fetch: int, mask: Optional[np.ndarray]
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        index = view.index
+        params = None
+        extra = view.index_dead
+        if mask is not None:
+            params = self._selector_params(view, index, view.ids[mask])
+            extra = 0  # the selector already excludes removed rows
+        # FAISS indexes are not safe to search while another thread adds to them.
+        with self._index_lock:
+            k = min(fetch + extra, index.ntotal)
+            if params is None:
+                scores, labels = index.search(np.ascontiguousarray(queries), k)
+            else:
+                scores, labels = index.search(np.ascontiguousarray(queries), k, params=params)
+        idxs = self._positions(labels, view)
+        return [(i[i >= 0][:fetch], s[i >= 0][:fetch]) for i, s in zip(idxs, scores)]
+
+    def _selector_params(self, view: _View, index, allowed: np.ndarray):
+        """Search parameters restricting FAISS to ``allowed`` row ids via a bitmap selector."""
+        bits = np.zeros(int(view.ids[view.count - 1]) + 1, dtype=bool)
+        bits[allowed] = True
+        packed = np.packbits(bits, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(packed))
+        selector.bitmap_ref = packed  # keep the buffer alive while FAISS reads it
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        else:
+            inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+            if isinstance(inner, faiss.IndexHNSW):
+                params = faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+        params.sel_ref = selector
+        return params
+
+    def _reweight(
+        self,
+        rows: List[Tuple[np.ndarray, np.ndarray]],
+        weights: np.ndarray,
+        top_k: int,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        distances = self._use_faiss and self.metric != "cosine"
+        out: List[Tuple[np.ndarray, np.ndarray]] = []
+        for idxs, scores in rows:
+            idxs = np.asarray(idxs, dtype=np.int64)
+            w = weights[idxs]
+            if distances:
+                # Older rows look farther away rather than less similar.
+                scored = np.asarray(scores, dtype=np.float32) / np.maximum(w, 1e-12)
+                order = np.argsort(scored)[:top_k]
+            else:
+                scored = np.asarray(scores, dtype=np.float32) * w
+                order = np.argsort(-scored)[:top_k]
+            out.append((idxs[order], scored[order]))
+        return out
+
+    def _topk_blocked(
+        self,
+        view: _View,
+        queries: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        k = min(k, int(mask.sum()) if mask is not None else int(view.alive.sum()))
+        if k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        excluded = np.flatnonzero(~mask) if mask is not None else None
+        # Keep each (rows x queries) similarity block around 4M floats.
+        step = max(1, _SCORE_BLOCK // view.count)
+        rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        for start in range(0, len(queries), step):
+            sims = self._quantizer.scores(view.matrix, queries[start : start + step]).T
+            if weights is not None:
+                sims *= weights
+            if excluded is not None:
+                sims[:, excluded] = -np.inf
+            if k < view.count:
+                part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            else:
+                part = np.broadcast_to(np.arange(view.count), sims.shape)
+            part_scores = np.take_along_axis(sims, part, axis=1)
+            order = np.argsort(-part_scores, axis=1)
+            top = np.take_along_axis(part, order, axis=1)
+            top_scores = np.take_along_axis(part_scores, order, axis=1)
+            rows.extend(zip(top, top_scores))
+        return rows
+
+    def _rescore_many(
+        self,
+        view: _View,
+        queries: np.ndarray,
+        rows: List[Tuple[np.ndarray, np.ndarray]],
+        top_k: int,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Re-rank quantized candidates with float32 rows fetched from SQLite in one pass."""
+        wanted = {int(view.ids[i]) for idxs, _ in rows for i in idxs if 0 <= i < view.count and view.alive[i]}
+        exact = self._exact_vectors(sorted(wanted))
+        rescored: List[Tuple[np.ndarray, np.ndarray]] = []
+        for query, (idxs, _) in zip(queries, rows):
+            keep = np.asarray(
+                [i for i in idxs if 0 <= i < view.count and int(view.ids[i]) in exact],
+                dtype=np.int64,
+            )
+            if not len(keep):
+                rescored.append((keep, np.zeros(0, dtype=np.float32)))
                 continue
-            results.append((self._records[idx][1], float(scores[i])))
+            matrix = np.stack([exact[int(view.ids[i])] for i in keep])
+            if self.metric == "cosine" or not self._use_faiss:
+                scores = matrix @ query
+                order = np.argsort(-scores)[:top_k]
+            else:
+                scores = ((matrix - query) ** 2).sum(axis=1)
+                order = np.argsort(scores)[:top_k]
+            rescored.append((keep[order], scores[order]))
+        return rescored
+
+    def measure_recall(self, queries: np.ndarray, top_k: int = 10) -> float:
+        """
+        Recall@k of ``search`` against exact float32 search over SQLite.
+        Loads every full-precision row, so meant for offline checks only.
+        """
+        exact = self._exact_vectors(self._ids[self._live_positions()])
+        ids = np.asarray(list(exact.keys()), dtype=np.int64)
+        if not len(ids) or not len(queries):
+            return 1.0
+        matrix = np.stack([exact[int(i)] for i in ids])
+        texts = self._texts(ids)
+        hits = total = 0
+        for raw in np.asarray(queries, dtype=np.float32).reshape(len(queries), -1):
+            query = self._normalize(raw)
+            truth = {texts[int(ids[i])] for i in np.argsort(-(matrix @ query))[:top_k]}
+            found = {text for text, _ in self.search(raw, top_k)}
+            hits += len(truth & found)
+            total += len(truth)
+        return hits / max(1, total)
+
+    def _gather_many(
+        self, view: _View, rows: List[Tuple[np.ndarray, np.ndarray]], with_ids: bool = False
+    ) -> List[List[tuple]]:
+        hits = [
+            [
+                (int(idx), float(score))
+                for idx, score in zip(idxs, scores)
+                if 0 <= idx < view.count and view.alive[idx] and np.isfinite(score)
+            ]
+            for idxs, scores in rows
+        ]
+        texts = self._texts(sorted({int(view.ids[idx]) for row in hits for idx, _ in row}))
+        results: List[List[tuple]] = []
+        for row in hits:
+            matches = []
+            for idx, score in row:
+                rowid = int(view.ids[idx])
+                text = texts.get(rowid)
+                if text is not None:
+                    matches.append((text, score, rowid) if with_ids else (text, score))
+            results.append(matches)
         return results
 
-    def graph(self, clusters: int = 4) -> List[List[str]]:
-        if len(self._records) < clusters or not self._matrix.size:
-            return [list(text for _, text in self._records)]
-        if faiss is None:
-            return self._naive_clusters(clusters)
-        kmeans = faiss.Kmeans(self.dim, clusters, niter=10)
-        kmeans.train(self._matrix)
-        distances, assignments = kmeans.index.search(self._matrix, 1)
-        groups: List[List[str]] = [[] for _ in range(clusters)]
-        for idx, (rid, text) in enumerate(self._records):
-            bucket = int(assignments[idx][0])
-            groups[bucket].append(text)
+    def texts(self, ids: Sequence[int]) -> dict[int, str]:
+        """Texts of the given row ids; ids that were deleted are absent."""
+        return self._texts(ids)
+
+    def live_ids(self) -> np.ndarray:
+        """Row ids of every searchable row, ascending."""
+        with self._index_lock:
+            return self._ids[self._live_positions()]
+
+    def neighbors(self, k: int = 8, *, batch: int = 1024) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Approximate k nearest neighbours of every live row, through the same index
+        as ``search``. Returns ``(ids, neighbor_ids, similarities)``: row ids of
+        shape (n,) and (n, k) arrays padded with -1 / -inf; a row is never its
+        own neighbour.
+        """
+        with self._index_lock:
+            view = self._view()
+            mask = self._candidate_mask(None, view)
+        live = np.flatnonzero(view.alive)
+        ids = np.ascontiguousarray(view.ids[live], dtype=np.int64)
+        neighbor_ids = np.full((len(live), k), -1, dtype=np.int64)
+        sims = np.full((len(live), k), -np.inf, dtype=np.float32)
+        if len(live) < 2 or k <= 0:
+            return ids, neighbor_ids, sims
+        distances = view.index is not None and self.metric != "cosine"
+        for start in range(0, len(live), max(1, batch)):
+            chunk = live[start : start + batch]
+            queries = np.ascontiguousarray(self._quantizer.decode(view.matrix[chunk]), dtype=np.float32)
+            if view.index is not None:
+                rows = self._faiss_topk(view, queries, k + 1, mask)
+            else:
+                rows = self._topk_blocked(view, queries, k + 1, mask)
+            for offset, (position, (idxs, scores)) in enumerate(zip(chunk, rows)):
+                keep = (idxs != position) & (idxs >= 0) & (idxs < view.count)
+                idxs, scores = np.asarray(idxs)[keep][:k], np.asarray(scores, dtype=np.float32)[keep][:k]
+                if distances:
+                    scores = 1.0 - scores / 2.0  # squared L2 -> cosine for unit vectors
+                neighbor_ids[start + offset, : len(idxs)] = view.ids[idxs]
+                sims[start + offset, : len(idxs)] = scores
+        return ids, neighbor_ids, sims
+
+    def _live_positions(self) -> np.ndarray:
+        return np.flatnonzero(self._alive[: self._count])
+
+    def _all_texts(self) -> List[str]:
+        ids = self._ids[self._live_positions()]
+        texts = self._texts(ids)
+        return [texts.get(int(rid), "") for rid in ids]
+
+    def graph(self, clusters: int | None = None) -> List[List[str]]:
+        """Texts grouped by cluster, answered from the cached assignments."""
+        clusters = clusters or self.clusters
+        if len(self) < clusters or not self._matrix.size:
+            return [self._all_texts()]
+        kmeans = self._cluster_model(clusters)
+        with self._index_lock:
+            ids = self._ids[self._live_positions()]
+        labels = kmeans.labels_for(ids)
+        texts = self._texts(ids)
+        groups: List[List[str]] = [[] for _ in range(kmeans.k)]
+        for rowid, label in zip(ids, labels):
+            text = texts.get(int(rowid))
+            if text is not None and label >= 0:
+                groups[label].append(text)
         return [g for g in groups if g]
 
-    def _naive_clusters(self, clusters: int) -> List[List[str]]:
-        step = max(1, len(self._records) // clusters)
-        buckets = []
-        for start in range(0, len(self._records), step):
-            chunk = self._records[start : start + step]
-            buckets.append([text for _, text in chunk])
-        return buckets or [[]]
+    def _cluster_model(self, clusters: int) -> MiniBatchKMeans:
+        """The cached k-means for ``clusters`` centres: trained on first use, then caught up."""
+        with self._index_lock:
+            live = self._live_positions()
+            ids = self._ids[live]
+            kmeans = self._kmeans
+            if kmeans is None or kmeans.k != clusters or not kmeans.fitted:
+                kmeans = MiniBatchKMeans(clusters, self.dim)
+                kmeans.fit(self._decoded(live), ids)
+                self._kmeans = kmeans
+                self._kmeans_dirty = True
+                return kmeans
+            # Rows added by another process or before the cache existed, and rows since removed.
+            missing = kmeans.labels_for(ids) < 0
+            if missing.any():
+                kmeans.partial_fit(self._decoded(live[missing]), ids[missing])
+                self._kmeans_dirty = True
+            if len(kmeans) > len(ids):
+                kmeans.prune(ids)
+                self._kmeans_dirty = True
+            return kmeans
+
+    def search_clustered(
+        self,
+        queries: np.ndarray,
+        top_k: int = 6,
+        *,
+        nprobe: int = 2,
+        clusters: int | None = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Coarse-to-fine search: route each query to its ``nprobe`` nearest
+        clusters, then score only the rows cached in them.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if not len(self) or not len(queries) or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        queries = self._normalize_rows(queries)
+        kmeans = self._cluster_model(clusters or self.clusters)
+        with self._index_lock:
+            view = self._view()
+        # Live positions grouped by cluster: cluster c is order[bounds[c] : bounds[c + 1]].
+        live = np.flatnonzero(view.alive)
+        labels = kmeans.labels_for(view.ids[live])
+        order = live[np.argsort(labels, kind="stable")]
+        bounds = np.searchsorted(np.sort(labels), np.arange(kmeans.k + 1))
+        rows: List[Tuple[np.ndarray, np.ndarray]] = []
+        for query, probes in zip(queries, kmeans.route(queries, nprobe)):
+            positions = np.concatenate([order[bounds[c] : bounds[c + 1]] for c in probes])
+            if not len(positions):
+                rows.append((positions, np.zeros(0, dtype=np.float32)))
+                continue
+            # Only the probed clusters' rows are scored.
+            sims = self._quantizer.scores(view.matrix[positions], query)
+            best = np.arange(len(positions))
+            if top_k < len(positions):
+                best = np.argpartition(-sims, top_k - 1)[:top_k]
+            best = best[np.argsort(-sims[best], kind="stable")]
+            rows.append((positions[best], sims[best]))
+        return self._gather_many(view, rows)
 
     def _load_existing(self) -> None:
-        cur = self.conn.execute("SELECT id, text, embedding FROM memory_vectors ORDER BY ts ASC")
+        if self._snapshot is not None:
+            mapped = self._snapshot.load(self.generation)
+            if mapped is not None and (self._quantizer.kind != "int8" or self._snapshot.extra.get("quantizer")):
+                self._quantizer.load_header(self._snapshot.extra.get("quantizer"))
+                self._ids, self._buffer = mapped
+                self._count = len(self._ids)
+                self._mapped = True
+                self._alive = self._load_snapshot_metadata()
+                self._dead = self._count - int(self._alive.sum())
+                self._index_loaded_rows()
+                return
+        cur = self.conn.execute(
+            "SELECT id, embedding, ts, source, role, namespace FROM memory_vectors ORDER BY id ASC"
+        )
         records = cur.fetchall()
-        if not records:
-            return
         matrix = np.zeros((len(records), self.dim), dtype=np.float32)
-        for idx, (rowid, text, blob) in enumerate(records):
+        ids = np.zeros(len(records), dtype=np.int64)
+        stamps: List[float] = []
+        meta_rows: List[dict] = []
+        count = 0
+        for rowid, blob, ts, *labels in records:
             vec = np.frombuffer(blob, dtype=np.float32)
             if vec.size != self.dim:
                 continue
-            matrix[idx] = vec
-            self._records.append((rowid, text))
-        self._matrix = matrix[: len(self._records)]
-        if self._use_faiss and self._matrix.size and self._index is not None:
+            matrix[count] = vec
+            ids[count] = rowid
+            stamps.append(ts or 0.0)
+            meta_rows.append(dict(zip(METADATA_COLUMNS, labels)))
+            count += 1
+        self._meta.write(0, stamps, meta_rows)
+        if count:
+            self._fit_quantizer(matrix[:count])
+        codes = self._quantizer.encode(matrix[:count]) if self._quantizer.fitted else matrix[:count]
+        del matrix  # the float32 copy is only needed to learn the quantizer
+        self._buffer = np.asarray(codes, dtype=self._quantizer.dtype)
+        self._ids = ids
+        self._count = count
+        self._alive = np.ones(count, dtype=bool)
+        if self._snapshot is not None:
+            self._snapshot.extra["quantizer"] = self._quantizer.to_header()
+            self._rewrite_snapshot()
+        self._index_loaded_rows()
+
+    def _load_snapshot_metadata(self) -> np.ndarray:
+        """
+        Metadata columns and the alive bitmap for snapshot-mapped rows; returns
+        the bitmap. Read from the snapshot's side files when it has them.
+        """
+        count = self._count
+        ids = self._ids[:count]
+        columns = self._snapshot.loaded_columns
+        dead = self._snapshot.dead_ids
+        if dead is not None and all(name in columns for name in SNAPSHOT_COLUMNS):
+            self._meta.load_arrays(columns, self._snapshot.extra.get("vocab") or {})
+            alive = np.ones(count, dtype=bool)
+            if len(dead) and count:
+                pos = np.minimum(np.searchsorted(ids, dead), count - 1)
+                alive[pos[ids[pos] == dead]] = False
+            return alive
+        # Older snapshot: metadata comes from SQLite, and rows missing there are tombstones.
+        cur = self.conn.execute("SELECT id, ts, source, role, namespace FROM memory_vectors ORDER BY id ASC")
+        rows = cur.fetchall()
+        sql_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        pos = np.minimum(np.searchsorted(ids, sql_ids), max(count - 1, 0))
+        hit = ids[pos] == sql_ids if count else np.zeros(len(rows), dtype=bool)
+        ts = np.fromiter((row[1] or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+        keep = np.flatnonzero(hit)
+        values = {
+            column: [rows[i][2 + c] for i in keep] for c, column in enumerate(METADATA_COLUMNS)
+        }
+        self._meta.assign(count, pos[keep], ts[keep], values)
+        alive = np.zeros(count, dtype=bool)
+        alive[pos[keep]] = True
+        return alive
+
+    def _decoded(self, positions: np.ndarray) -> np.ndarray:
+        """Float32 copy of the given buffer rows for FAISS training/adds."""
+        return np.ascontiguousarray(self._quantizer.decode(self._matrix[positions]), dtype=np.float32)
+
+    def _index_loaded_rows(self) -> None:
+        if not self._use_faiss or self._index is None:
+            return
+        start = self._restore_index()
+        if start == 0:
             self._index.reset()
-            self._index.add(self._matrix)
+        if start < self._count:
+            self._index_add_range(self._index, start, self._count)
+            self._dirty = True
+        self._maybe_train()
+
+    def _watermark(self) -> dict:
+        return {
+            "labels": "rowid",
+            "trained_count": self._trained_count,
+            "max_rowid": int(self._ids[self._count - 1]) if self._count else 0,
+            "count": len(self) + self._index_dead,
+            "dim": self.dim,
+            "factory": self.factory,
+            "metric": self.metric,
+            "embedder_id": self.embedder_id,
+        }
+
+    def _restore_index(self) -> int:
+        """
+        Load the persisted index when its watermark matches the stored rows.
+        Returns how many leading rows it already covers (0 means rebuild).
+        """
+        if not self.index_path:
+            return 0
+        meta_path = Path(self.index_path + ".meta.json")
+        if not Path(self.index_path).exists() or not meta_path.exists():
+            return 0
+        try:
+            mark = json.loads(meta_path.read_text(encoding="utf-8"))
+            expected = self._watermark()
+            if any(
+                mark.get(key) != expected[key] for key in ("labels", "dim", "factory", "metric", "embedder_id")
+            ):
+                return 0
+            covered = int(np.searchsorted(self._ids[: self._count], int(mark["max_rowid"]), side="right"))
+            # Tombstoned rows are in the index unless it was saved after their removal.
+            live = int(self._alive[:covered].sum())
+            if int(mark["count"]) not in (covered, live):
+                return 0
+            index = faiss.read_index(self.index_path)
+        except Exception:
+            return 0  # Fallback to a full rebuild if load fails
+        if index.ntotal != int(mark["count"]) or index.d != self.dim:
+            return 0
+        self._index = index
+        self._index_dead = index.ntotal - live
+        self._trained_count = int(mark.get("trained_count", 0)) if self._is_ann_factory() else 0
+        self._apply_search_params(index)
+        return covered
+
+    def _maybe_persist(self) -> None:
+        if not self._dirty or not self.index_path:
+            return
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def _new_index(self, description: str):
+        """Index labelled by SQLite row ids, so removals need no renumbering."""
+        metric = faiss.METRIC_INNER_PRODUCT if self.metric == "cosine" else faiss.METRIC_L2
+        index = faiss.index_factory(self.dim, description, metric)
+        if faiss.try_extract_index_ivf(index) is not None:
+            return index  # inverted lists store ids natively
+        return faiss.index_factory(self.dim, f"IDMap2,{description}", metric)
 
     def _build_index(self):
         if not self._use_faiss:
             return None
-        
-        if self.index_path and Path(self.index_path).exists():
+
+        if self._is_ann_factory():
+            index = self._new_index(self.factory)
+            if index.is_trained:
+                # Graph indexes such as HNSW need no training and serve immediately.
+                self._apply_search_params(index)
+                return index
+        # Trainable factories serve from exact search until enough rows exist.
+        return self._new_index("Flat")
+
+    def _is_ann_factory(self) -> bool:
+        return self.factory.replace(" ", "") not in {"", "Flat", "FlatIP", "FlatL2"}
+
+    def _needs_training(self) -> bool:
+        if not self._use_faiss or not self._is_ann_factory():
+            return False
+        if self._trainable is None:
+            metric = faiss.METRIC_INNER_PRODUCT if self.metric == "cosine" else faiss.METRIC_L2
+            self._trainable = not faiss.index_factory(self.dim, self.factory, metric).is_trained
+        return self._trainable
+
+    def _min_train_rows(self, index) -> int:
+        required = self.train_threshold
+        try:
+            required = max(required, faiss.extract_index_ivf(index).nlist)
+        except Exception:
+            pass  # not an IVF index
+        if "PQ" in self.factory:
+            required = max(required, 256)
+        return required
+
+    def _apply_search_params(self, index) -> None:
+        params = faiss.ParameterSpace()
+        for name, value in (("nprobe", self.nprobe), ("efSearch", self.ef_search)):
             try:
-                return faiss.read_index(self.index_path)
+                params.set_index_parameter(index, name, value)
             except Exception:
-                pass  # Fallback to new index if load fails
+                continue  # parameter not applicable to this index type
 
-        metric = faiss.METRIC_INNER_PRODUCT if self.metric == "cosine" else faiss.METRIC_L2
-        index = faiss.IndexFlatIP(self.dim) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(self.dim)
-        return index
+    def _maybe_train(self) -> None:
+        """Train (or retrain) the ANN index once the store is large enough."""
+        # Check-and-start under the lock, so compact() never misses a starting thread.
+        with self._index_lock:
+            if self._train_thread is not None and self._train_thread.is_alive():
+                return
+            if not self._needs_training():
+                return
+            if self._trained_count:
+                if len(self) < self._trained_count * self.retrain_growth:
+                    return
+            candidate = self._new_index(self.factory)
+            if len(self) < self._min_train_rows(candidate):
+                return
+            if self.background_training:
+                self._train_thread = threading.Thread(
+                    target=self._train_and_swap,
+                    args=(candidate,),
+                    name="vector-index-train",
+                    daemon=True,
+                )
+                self._train_thread.start()
+                return
+        self._train_and_swap(candidate)
+
+    def _train_and_swap(self, index) -> None:
+        upto = self._count
+        live = np.flatnonzero(self._alive[:upto])
+        sample = live
+        if len(live) > 100_000:
+            rng = np.random.default_rng(upto)
+            sample = np.sort(rng.choice(live, 100_000, replace=False))
+        try:
+            index.train(self._decoded(sample))
+            self._index_add_range(index, 0, upto)
+        except Exception:
+            return  # keep serving from the current index
+        self._apply_search_params(index)
+        with self._index_lock:
+            if self._count > upto:
+                self._index_add_range(index, upto, self._count)
+            # Rows removed while training ran were added above; drop them now.
+            dead = self._ids[live[~self._alive[live]]]
+            self._index_dead = 0
+            if len(dead):
+                try:
+                    index.remove_ids(np.ascontiguousarray(dead, dtype=np.int64))
+                except Exception:
+                    self._index_dead = len(dead)
+            self._index = index
+            self._trained_count = len(live)
+            self._dirty = True
+
+    def wait_for_training(self, timeout: float | None = None) -> None:
+        thread = self._train_thread
+        if thread is not None:
+            thread.join(timeout)
 
     def save(self, path: str | None = None) -> None:
-        """Save FAISS index to disk"""
+        """Save FAISS index to disk, tagged with a watermark sidecar."""
         if not self._use_faiss or self._index is None:
             return
         
@@ -154,7 +1130,16 @@ class VectorStore:
             return
             
         Path(target).parent.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self._index, target)
+        tmp = target + ".tmp"
+        with self._index_lock:
+            faiss.write_index(self._index, tmp)
+            mark = self._watermark()
+        os.replace(tmp, target)
+        meta_tmp = target + ".meta.json.tmp"
+        Path(meta_tmp).write_text(json.dumps(mark), encoding="utf-8")
+        os.replace(meta_tmp, target + ".meta.json")
+        self._dirty = False
+        self._last_save = time.monotonic()
 
     def load(self, path: str) -> None:
         """Load FAISS index from disk"""
@@ -174,6 +1159,12 @@ class VectorStore:
         norm = np.linalg.norm(vec) + 1e-8
         return vec / norm
 
+    def _normalize_rows(self, matrix: np.ndarray) -> np.ndarray:
+        if not self.normalize:
+            return matrix
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+        return (matrix / norms).astype(np.float32)
+
     def clear(self) -> int:
         """Clear all vectors from both in-memory cache and SQLite. Returns count deleted."""
         # Get count before clearing
@@ -181,21 +1172,54 @@ class VectorStore:
         count = cursor.fetchone()[0]
         
         # Clear SQLite table
-        self.conn.execute("DELETE FROM memory_vectors")
-        self.conn.commit()
+        with self.conn:
+            self.conn.execute("DELETE FROM memory_vectors")
+            self.generation = self._bump_generation()
         
         # Clear in-memory structures
-        self._records.clear()
-        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._buffer = np.zeros((0, self.dim), dtype=self._quantizer.dtype)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        self._alive = np.ones(0, dtype=bool)
+        self._dead = 0
+        self._index_dead = 0
+        self._meta.clear()
+        if self._kmeans is not None:
+            self._kmeans = None
+            self._kmeans_dirty = False
+            if self.clusters_path:
+                Path(self.clusters_path).unlink(missing_ok=True)
+        if self._snapshot is not None:
+            self._rewrite_snapshot()
         
         # Reset FAISS index if using
         if self._use_faiss and self._index is not None:
-            self._index.reset()
+            self.wait_for_training()
+            self._index = self._build_index()
+            self._trained_count = 0
+            self._dirty = True
+            self._maybe_persist()
         
         return count
 
+    def flush(self) -> None:
+        """Save the index (and the cluster cache) now if they have unsaved changes."""
+        if self._dirty and self.index_path:
+            try:
+                self.save()
+            except Exception:
+                pass
+        if self._kmeans_dirty and self._kmeans is not None and self.clusters_path:
+            try:
+                with self._index_lock:
+                    self._kmeans.save(self.clusters_path)
+                self._kmeans_dirty = False
+            except Exception:
+                pass
+
     def close(self) -> None:
-        """Close the SQLite connection."""
+        """Flush a pending index save and close the SQLite connection."""
+        self.flush()
         if self.conn:
             self.conn.close()
 
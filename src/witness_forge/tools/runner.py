@@ -10,6 +10,7 @@ from pathlib import Path
 from typing import Callable, Dict, Iterable, List, Optional
 
 from ..config import ToolsConfig
+from ..memory.schema import ensure_indexes
 
 
 ConfirmFn = Callable[[str], bool]
@@ -169,6 +170,7 @@ class ToolRunner:
                 )
                 """
             )
+            ensure_indexes(conn, "tool_logs")
             now = time.time()
             conn.execute(
                 """
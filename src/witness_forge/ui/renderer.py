@@ -98,6 +98,7 @@ class StreamRenderer:
         loop_info: Optional[str] = None,
         loop_state: Optional[Dict] = None,
         evolutions: Optional[List[str]] = None,
+        memory_cache: Optional[Dict[str, int]] = None,
     ) -> None:
         """
         Print performance and evolution metrics.
@@ -106,6 +107,7 @@ class StreamRenderer:
             loop_info: Optional loop debug info (Effective Temperature line)
             loop_state: Loop state dict to extract temperature from
             evolutions: List of evolution messages
+            memory_cache: Retrieval cache counters (hits/misses)
         """
         # Print loop info (Effective Temperature line)
         if loop_info:
@@ -141,6 +143,11 @@ class StreamRenderer:
         if not has_evolution_temp:
             metrics_parts.append(f"[italic grey70]temperature[/]=[green]{current_temp:.3f}[/]")
 
+        if memory_cache and memory_cache.get("hits", 0) + memory_cache.get("misses", 0):
+            hits = memory_cache.get("hits", 0)
+            lookups = hits + memory_cache.get("misses", 0)
+            metrics_parts.append(f"[italic grey70]mem_cache[/]=[green]{hits}/{lookups}[/]")
+
         self.console.print(" ".join(metrics_parts))
 
 
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import numpy as np
+
+from witness_forge.memory.clustering import MiniBatchKMeans
+from witness_forge.memory.vector_store import VectorStore
+
+
+def _blobs(rng, per: int, dim: int = 32):
+    centres = np.eye(dim, dtype=np.float32)[:3] * 4
+    rows = np.concatenate([c + rng.normal(scale=0.3, size=(per, dim)) for c in centres]).astype(np.float32)
+    return rows, np.repeat(np.arange(3), per)
+
+
+def test_minibatch_kmeans_separates_blobs_and_learns_incrementally(tmp_path):
+    rng = np.random.default_rng(0)
+    rows, truth = _blobs(rng, 40)
+    kmeans = MiniBatchKMeans(3, 32)
+    labels = kmeans.fit(rows[::2], np.arange(0, 120, 2))
+    # Each blob maps to exactly one cluster.
+    assert len({(t, l) for t, l in zip(truth[::2], labels)}) == 3
+
+    kmeans.partial_fit(rows[1::2], np.arange(1, 120, 2))
+    cached = kmeans.labels_for(np.arange(120))
+    assert len({(t, l) for t, l in zip(truth, cached)}) == 3
+    assert kmeans.labels_for(np.array([999]))[0] == -1
+
+    kmeans.save(str(tmp_path / "clusters.npz"))
+    loaded = MiniBatchKMeans.load(str(tmp_path / "clusters.npz"), 32)
+    assert np.array_equal(loaded.labels_for(np.arange(120)), cached)
+    assert MiniBatchKMeans.load(str(tmp_path / "clusters.npz"), 16) is None
+
+
+def test_vector_store_graph_answers_from_the_cluster_cache(tmp_path):
+    rng = np.random.default_rng(1)
+    rows, truth = _blobs(rng, 10)
+    path = str(tmp_path / "clusters.npz")
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32, clusters=3, clusters_path=path)
+    first, later = np.arange(0, 30, 2), np.arange(1, 30, 2)
+    vs.add_many([f"t{i}" for i in first], rows[first])
+    assert sorted(len(g) for g in vs.graph()) == [5, 5, 5]
+
+    vs.add_many([f"t{i}" for i in later], rows[later])
+    assert vs._kmeans.labels_for(vs._ids[:30]).min() >= 0  # assigned on insert
+    vs.close()
+
+    reopened = VectorStore(str(tmp_path / "witness.sqlite3"), 32, clusters=3, clusters_path=path)
+    groups = reopened.graph()
+    assert len(groups) == 3 and sum(len(g) for g in groups) == 30
+    assert {frozenset(g) for g in groups} == {frozenset(f"t{i}" for i in np.flatnonzero(truth == b)) for b in range(3)}
+    hits = reopened.search_clustered(rows[25], top_k=3, nprobe=1)[0]
+    assert hits[0][0] == "t25" and all(int(text[1:]) >= 20 for text, _ in hits)
+    reopened.close()
+
+
+def test_search_clustered_scores_only_probed_clusters_and_keeps_recall(tmp_path):
+    rng = np.random.default_rng(2)
+    centres = rng.normal(size=(8, 32)).astype(np.float32) * 3
+    rows = np.concatenate([c + rng.normal(size=(100, 32)) for c in centres]).astype(np.float32)
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32, clusters=8)
+    vs.add_many([f"t{i}" for i in range(800)], rows)
+    queries = rows[::40] + rng.normal(scale=0.1, size=(20, 32)).astype(np.float32)
+    flat = vs.search_many(queries, top_k=5)
+
+    scored = []
+    score = vs._quantizer.scores
+    vs._quantizer.scores = lambda codes, query: scored.append(len(codes)) or score(codes, query)
+    clustered = vs.search_clustered(queries, top_k=5, nprobe=2)
+    vs._quantizer.scores = score
+
+    assert len(scored) == 20 and max(scored) < 400  # 2 of 8 clusters, never the whole matrix
+    found = sum(len({t for t, _ in a} & {t for t, _ in b}) for a, b in zip(flat, clustered))
+    assert found / 100 >= 0.9
+    vs.close()
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import numpy as np
+
+from witness_forge.memory.embedding import HashingEmbedder, build_embedder
+
+
+def test_hashing_embedder_is_fixed_and_stable_without_fitting():
+    embedder = build_embedder("hashing", dim=256)
+    assert isinstance(embedder, HashingEmbedder) and embedder.dimension == 256
+
+    vectors = embedder.embed(["the sky is blue", "The sky is BLUE!", "grass grows green", ""])
+    assert vectors.shape == (4, 256) and vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[3].any()
+    assert vectors[0] @ embedder.embed(["blue skies"])[0] > vectors[0] @ vectors[2]
+
+    embedder.fit(["anything else entirely"])
+    np.testing.assert_array_equal(HashingEmbedder(256).embed(["the sky is blue"])[0], vectors[0])
+    assert embedder.model_id == HashingEmbedder(256).model_id != HashingEmbedder(512).model_id
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import numpy as np
+
+from witness_forge.memory.embedding import CachedEmbedder, SimpleEmbedder
+from witness_forge.memory.embedding_cache import EmbeddingCache
+
+
+class CountingEmbedder(SimpleEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+
+    def embed(self, texts):
+        self.seen.append(list(texts))
+        return super().embed(texts)
+
+
+def test_cached_embedder_only_encodes_unseen_texts():
+    inner = CountingEmbedder()
+    inner.fit(["red apples", "blue sky"])
+    embedder = CachedEmbedder(inner, EmbeddingCache(maxsize=8))
+
+    first = embedder.embed(["red apples", "blue sky", "red apples"])
+    assert inner.seen == [["red apples", "blue sky"]]
+    again = embedder.embed(["blue sky", "green grass"])
+    assert inner.seen[-1] == ["green grass"]
+    np.testing.assert_array_equal(again[0], first[1])
+    assert embedder.cache.stats()["hits"] == 2
+
+    # Refitting changes the vocabulary, hence the model id, so old vectors are not reused.
+    embedder.fit(["green grass"])
+    embedder.embed(["blue sky"])
+    assert inner.seen[-1] == ["blue sky"]
+    assert embedder.dimension == inner.dimension and embedder.vocab is inner.vocab
+
+
+def test_sqlite_tier_survives_a_new_process(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    calls = []
+
+    def compute(texts):
+        calls.append(list(texts))
+        return np.arange(len(texts) * 3, dtype=np.float32).reshape(len(texts), 3)
+
+    cache = EmbeddingCache(maxsize=1, path=path)
+    cache.embed("m", ["a", "b"], compute)
+    cache.close()
+
+    reopened = EmbeddingCache(maxsize=1, path=path)
+    vectors = reopened.embed("m", ["b", "a", "c"], compute)
+    assert calls == [["a", "b"], ["c"]]
+    np.testing.assert_array_equal(vectors[0], [3, 4, 5])
+    assert not vectors[0].flags.writeable
+    assert reopened.embed("other-model", ["a"], compute) and calls[-1] == ["a"]
+    reopened.close()
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+from witness_forge.memory.embedding import HashingEmbedder
+from witness_forge.memory.embedding_service import EmbeddingService
+
+
+def test_service_matches_local_embedder_and_falls_back_when_stopped():
+    service = EmbeddingService("hashing", dim=64, window=0.02)
+    local = HashingEmbedder(64)
+    try:
+        assert service.dimension == 64 and service.model_id == local.model_id
+        results = {}
+
+        def worker(i):
+            results[i] = service.embed([f"text number {i}", "shared"])
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i, vectors in results.items():
+            np.testing.assert_allclose(vectors, local.embed([f"text number {i}", "shared"]), rtol=1e-6)
+        assert service.fallbacks == 0
+    finally:
+        service.close()
+
+    assert not service.alive
+    np.testing.assert_allclose(service.embed(["after close"]), local.embed(["after close"]), rtol=1e-6)
+    assert service.fallbacks == 1
+
+
+def test_service_fits_vocabulary_embedders_in_the_worker():
+    service = EmbeddingService("tfidf")
+    try:
+        service.fit(["red apples", "blue sky", "green grass"])
+        assert service.embed(["blue sky"]).shape == (1, service.dimension)
+        assert service.dimension > 1
+    finally:
+        service.close()
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import threading
+
 from witness_forge.memory.graph_rag import GraphMemory
 
 
@@ -19,3 +21,91 @@ def test_graph_memory_add_and_search(tmp_path):
     gm2 = GraphMemory(str(path))
     results2 = gm2.search("planet", top_k=3)
     assert any("planet" in t.lower() for t, _ in results2)
+
+
+def test_indexed_search_matches_a_full_scan(tmp_path):
+    import random
+
+    def scan(gm, query, top_k):
+        q_lower = query.lower()
+        scores = []
+        for _, data in gm.graph.nodes(data=True):
+            text = data.get("text", "").lower()
+            if not text:
+                continue
+            if q_lower in text:
+                score = 1.0
+            else:
+                score = len(set(q_lower.split()) & set(text.split())) / max(1, len(q_lower.split()))
+            if score > 0:
+                scores.append((data["text"], score))
+        scores.sort(key=lambda x: x[1], reverse=True)
+        return scores[:top_k]
+
+    rng = random.Random(7)
+    words = ["alpha", "Beta", "gamma", "delta", "kappa", "lambda", "mu"]
+    path = tmp_path / "graph.json"
+    gm = GraphMemory(str(path))
+    for _ in range(60):
+        gm.add(" ".join(rng.choice(words) for _ in range(rng.randint(1, 5))))
+    gm.add("")
+    gm.save()
+    reloaded = GraphMemory(str(path))
+
+    queries = ["alpha", "beta gamma", "ta ga", "mma", "lambda mu zeta", "a", "", "zzz", "MU"]
+    for query in queries:
+        assert gm.search(query, top_k=10) == scan(gm, query, 10)
+        assert reloaded.search(query, top_k=10) == scan(reloaded, query, 10)
+
+
+def test_saves_append_to_a_journal_and_survive_a_torn_write(tmp_path):
+    path = tmp_path / "graph.json"
+    gm = GraphMemory(str(path), flush_interval=3600, compact_every=4)
+    first = gm.add("first node")
+    gm.save()  # no snapshot yet: written in full
+    assert path.exists() and gm.journal_path.read_text() == ""
+    snapshot = path.read_bytes()
+
+    gm.add("second node", [first])
+    gm.save()
+    assert path.read_bytes() == snapshot  # O(change): only the journal grew
+    assert gm.journal_path.read_text().count("\n") == 2
+    with open(gm.journal_path, "a", encoding="utf-8") as handle:
+        handle.write('{"op": "node", "id": "torn", "te')
+
+    reloaded = GraphMemory(str(path), flush_interval=3600, compact_every=4)
+    assert reloaded._graph is None  # lazy
+    assert [text for text, _ in reloaded.search("node", top_k=5)] == ["first node", "second node"]
+    assert reloaded.graph.number_of_edges() == 1
+    for i in range(3):
+        reloaded.add(f"more {i}")
+    reloaded.save()  # journal reached compact_every: folded into the snapshot
+    assert reloaded.journal_path.read_text() == ""
+    assert GraphMemory(str(path)).graph.number_of_nodes() == 5
+
+
+def test_search_while_another_thread_adds(tmp_path):
+    gm = GraphMemory(str(tmp_path / "graph.json"), flush_interval=3600)
+    gm.add("seed note about coffee")
+    errors: list = []
+    done = threading.Event()
+
+    def search():
+        while not done.is_set():
+            try:
+                gm.search("coffee note", top_k=3)
+                gm.search("co")
+            except Exception as exc:  # "dictionary changed size during iteration"
+                errors.append(exc)
+                return
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    try:
+        for i in range(3000):
+            gm.add(f"coffee note {i} with token{i}")
+    finally:
+        done.set()
+        thread.join()
+    assert not errors
+    assert gm.search("token2999")[0][0] == "coffee note 2999 with token2999"
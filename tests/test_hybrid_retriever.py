@@ -23,3 +23,136 @@ def test_hybrid_retriever_merges_graph_and_vector(tmp_path):
     assert "graph item one" in results
     assert "alpha match" in results
     assert len(results) <= 4
+
+
+def test_hybrid_retriever_interleaves_lexical_channel(tmp_path):
+    from witness_forge.memory.store import MemoryStore
+
+    store = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    store.add_memories(["gamma keyword note", "unrelated"])
+    hr = HybridRetriever(DummyRetriever(), None, k=2, lexical=store)
+
+    assert hr.retrieve("keyword") == ["alpha match", "gamma keyword note"]
+    store.close()
+
+
+class ScoredRetriever(DummyRetriever):
+    def search_many(self, queries, where=None, k=None):
+        return [[("alpha match", 0.9), ("shared hit", 0.5), ("beta value", 0.1)][:k] for _ in queries]
+
+
+class StaticLexical:
+    def search_text(self, query, k=6):
+        return [("shared hit", 3.0), ("lexical only", 1.0)][:k]
+
+
+def test_rrf_promotes_hits_found_by_several_channels():
+    hr = HybridRetriever(ScoredRetriever(), None, k=3, lexical=StaticLexical())
+    assert hr.retrieve("q") == ["shared hit", "alpha match", "lexical only"]
+
+    weighted = HybridRetriever(
+        ScoredRetriever(), None, k=2, lexical=StaticLexical(), fusion="weighted", weights={"lexical": 0.1}
+    )
+    assert weighted.retrieve("q") == ["alpha match", "shared hit"]
+
+
+def test_reranker_scores_only_the_fused_head_and_caches_pairs():
+    from witness_forge.memory.rerank import Reranker
+
+    calls = []
+
+    def score_pairs(pairs):
+        calls.append(list(pairs))
+        return [len(text) for _, text in pairs]
+
+    reranker = Reranker(score_pairs, cache_size=8)
+    hr = HybridRetriever(
+        ScoredRetriever(), None, k=2, lexical=StaticLexical(), reranker=reranker, rerank_top=3, cache_size=0
+    )
+
+    assert hr.retrieve("q") == ["lexical only", "alpha match"]
+    assert len(calls) == 1 and len(calls[0]) == 3
+    hr.retrieve("q")
+    assert len(calls) == 1
+
+
+def test_token_overlap_strategy_reranks_without_a_model():
+    from pathlib import Path
+
+    import pytest
+
+    from witness_forge.memory.rerank import StrategyReranker, build_reranker
+
+    strategies = str(Path(__file__).resolve().parents[1] / "strategies")
+    reranker = build_reranker("strategy:token_overlap", strategies_dir=strategies)
+    assert isinstance(reranker, StrategyReranker)
+    assert reranker.rerank("beta value", ["alpha match", "beta value", "beta"]) == [
+        ("beta value", 1.0),
+        ("beta", 0.5),
+        ("alpha match", 0.0),
+    ]
+    with pytest.raises(RuntimeError):
+        build_reranker("strategy:missing", strategies_dir=strategies)
+
+
+def test_deadline_fuses_channels_that_finished_and_reuses_late_results():
+    import threading
+
+    release = threading.Event()
+
+    class SlowLexical(StaticLexical):
+        def search_text(self, query, k=6):
+            release.wait(5)
+            return super().search_text(query, k)
+
+    hr = HybridRetriever(ScoredRetriever(), None, k=3, lexical=SlowLexical(), deadline=0.05)
+    try:
+        assert hr.retrieve("q") == ["alpha match", "shared hit", "beta value"]
+        assert hr.last_timings["lexical"] is None and hr.last_timings["vector"] is not None
+        assert hr._executor._max_workers == 2  # one thread per channel
+
+        # Still running: skipped rather than queued behind itself.
+        hr.retrieve("q")
+        assert hr.last_timings["lexical"] is None
+
+        release.set()
+        hr._late["lexical"][1].result(timeout=5)
+        assert hr.retrieve("q") == ["shared hit", "alpha match", "lexical only"]
+        assert hr.last_timings["lexical"] == 0.0
+    finally:
+        release.set()
+        hr.close()
+
+
+def test_results_are_cached_until_a_channel_store_changes(tmp_path):
+    from witness_forge.memory.store import MemoryStore
+
+    class CountingRetriever(ScoredRetriever):
+        generation = 0
+        calls = 0
+
+        def search_many(self, queries, where=None, k=None):
+            self.calls += 1
+            return super().search_many(queries, where, k)
+
+    base = CountingRetriever()
+    store = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    gm = GraphMemory(str(tmp_path / "g.json"))
+    hr = HybridRetriever(base, gm, k=3, lexical=store)
+
+    first = hr.retrieve("Alpha  note")
+    assert hr.retrieve("alpha note") == first
+    assert base.calls == 1 and hr.cache_stats()["hits"] == 1
+
+    store.add_memory("alpha note from the store")
+    assert "alpha note from the store" in hr.retrieve("alpha note")
+    gm.add("alpha note in the graph")
+    assert "alpha note in the graph" in hr.retrieve("alpha note")
+    assert base.calls == 3
+    store.close()
+
+    # Channels without a generation counter are never cached.
+    uncached = HybridRetriever(DummyRetriever(), None, k=2)
+    uncached.retrieve("q")
+    uncached.retrieve("q")
+    assert uncached.cache_stats() == {"hits": 0, "misses": 0, "size": 0}
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import numpy as np
+
+from witness_forge.memory.hybrid_retriever import HybridRetriever
+from witness_forge.memory.knn_graph import KnnGraph
+from witness_forge.memory.maintenance import MemoryMaintenance
+from witness_forge.memory.retrieval import Retriever
+from witness_forge.memory.store import MemoryStore
+from witness_forge.memory.vector_store import VectorStore
+
+
+def _chain(dim: int = 32) -> np.ndarray:
+    # a ~ b ~ c along a chain (a and c far apart), plus an unrelated far row.
+    vecs = np.zeros((4, dim), dtype=np.float32)
+    for i, angle in enumerate((0.0, 0.6, 1.2)):
+        vecs[i, 0], vecs[i, 1] = np.cos(angle), np.sin(angle)
+    vecs[3, 5] = 1.0
+    return vecs
+
+
+class TableEmbedder:
+    def __init__(self, table):
+        self.table = table
+
+    def embed(self, texts):
+        return np.stack([self.table[text] for text in texts])
+
+
+def test_expand_reaches_two_hops_and_survives_reload(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    vs = VectorStore(db, 32)
+    ids = vs.add_many(["a", "b", "c", "far"], _chain())
+    graph = KnnGraph(vs, str(tmp_path / "knn.npz"), k=1, min_similarity=0.5)
+    assert graph.stale and graph.build() == 4 and not graph.stale
+
+    assert [rowid for rowid, _ in graph.neighbors(ids[1])] == [ids[0], ids[2]]
+    assert [text for text, _ in graph.expand([ids[0]], 5)] == ["b", "c"]
+    one_hop = KnnGraph(vs, k=1, min_similarity=0.5, hops=1)
+    one_hop.build()
+    assert [text for text, _ in one_hop.expand([ids[0]], 5)] == ["b"]
+
+    reloaded = KnnGraph(vs, str(tmp_path / "knn.npz"))
+    assert len(reloaded) == 4 and reloaded.expand([ids[0]], 5) == graph.expand([ids[0]], 5)
+    vs.remove([ids[1]])
+    assert [text for text, _ in reloaded.expand([ids[0]], 5)] == ["c"]  # deleted rows drop out
+    vs.close()
+
+
+def test_stale_counts_churn_not_just_row_count(tmp_path):
+    rng = np.random.default_rng(3)
+    vecs = rng.normal(size=(24, 32)).astype(np.float32)
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32)
+    ids = vs.add_many([f"m{i}" for i in range(20)], vecs[:20])
+    graph = KnnGraph(vs, str(tmp_path / "knn.npz"), k=2)
+    graph.build()
+    assert not KnnGraph(vs, str(tmp_path / "knn.npz")).stale  # generation saved with the arrays
+
+    vs.remove(ids[:4])
+    vs.add_many([f"n{i}" for i in range(4)], vecs[20:])
+    assert len(vs) == 20 and graph.stale  # same size, but 8 of 20 rows changed
+    graph.build()
+    assert not graph.stale
+    vs.close()
+
+
+def test_knn_channel_and_maintenance_rebuild(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    store = MemoryStore(db)
+    vs = VectorStore(db, 32)
+    vecs = _chain()
+    table = dict(zip(["a", "b", "c", "far"], vecs))
+    vs.add_many(list(table), vecs)
+    graph = KnnGraph(vs, k=1, min_similarity=0.5)
+    maintenance = MemoryMaintenance(store, vs, knn_graph=graph)
+    assert maintenance.run_all().knn_nodes == 4
+    assert maintenance.run_all().knn_nodes == 0  # nothing changed: no rebuild
+
+    retriever = Retriever(store, TableEmbedder(table), vs, k=1)
+    hybrid = HybridRetriever(retriever, None, k=3, knn_graph=graph)
+    assert hybrid.retrieve("a") == ["a", "b", "c"]
+    assert hybrid.last_timings.keys() == {"vector", "knn"}
+    store.close()
+    vs.close()
+
+
+def test_build_in_background_only_when_stale(tmp_path):
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32)
+    vs.add_many(["a", "b", "c", "far"], _chain())
+    graph = KnnGraph(vs, k=1, min_similarity=0.5)
+    thread = graph.build_in_background()
+    thread.join(10)
+    assert len(graph) == 4 and not graph.stale
+    assert graph.build_in_background() is None
+    vs.close()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+
+import numpy as np
+
+from witness_forge.memory.graph_rag import GraphMemory
+from witness_forge.memory.maintenance import MemoryMaintenance
+from witness_forge.memory.store import MemoryStore
+from witness_forge.memory.vector_store import VectorStore
+
+
+def _vectors(texts):
+    rng = np.random.default_rng(len(texts))
+    return rng.normal(size=(len(texts), 16)).astype(np.float32)
+
+
+def test_full_pass_prunes_compacts_and_vacuums(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    store = MemoryStore(db)
+    vs = VectorStore(db, 16, compact_ratio=1.0)
+    store.attach_semantic_hook(_vectors, vs)
+    store.add_memories([f"memory {i} " + "x" * 2000 for i in range(200)])
+    graph = GraphMemory(str(tmp_path / "graph.json"))
+    graph.add("node")
+
+    maintenance = MemoryMaintenance(store, vs, graph, max_age_days=-1, max_count=20, vacuum_pages=8)
+    report = maintenance.run_all()
+
+    assert report.completed
+    assert report.pruned == 180
+    assert report.compacted == 180 and vs._dead == 0
+    assert report.vacuumed_pages > 0 and report.analyzed and report.graph_saved
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    conn.close()
+    vs.close()
+
+
+def test_slices_resume_where_the_budget_ran_out(tmp_path):
+    store = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    maintenance = MemoryMaintenance(store, prune=False)
+    maintenance.STEPS = ("prune", "analyze", "graph")
+    seen = []
+
+    def slow_prune(report, deadline):
+        seen.append("prune")
+        time.sleep(0.05)
+        return True
+
+    maintenance._step_prune = slow_prune
+    first = maintenance.run_slice(0.01)
+    assert not first.completed and seen == ["prune"]
+    second = maintenance.run_slice(5)
+    assert second.completed and second.analyzed
+    assert seen == ["prune"]
+
+
+def test_worker_runs_after_every_n_turns(tmp_path):
+    store = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    maintenance = MemoryMaintenance(store, every_turns=3, idle_seconds=0, max_count=-1, max_age_days=-1)
+    maintenance.start()
+    try:
+        for _ in range(3):
+            maintenance.notify_turn()
+        deadline = time.monotonic() + 5
+        while maintenance.last_report is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        maintenance.stop(timeout=5)
+    assert maintenance.last_report is not None and maintenance.last_report.completed
+
+
+def test_vacuum_full_converts_wal_database(tmp_path):
+    db = str(tmp_path / "legacy.sqlite3")
+    legacy = sqlite3.connect(db)
+    legacy.execute("CREATE TABLE memories(ts REAL, text TEXT)")
+    legacy.commit()
+    legacy.close()
+    store = MemoryStore(db)
+    MemoryMaintenance(store).vacuum_full()
+    check = sqlite3.connect(db)
+    assert check.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    check.close()
+    store.close()
@@ -15,3 +15,145 @@ def test_message_logging(tmp_path):
     store.add_message("assistant", "hi there")
     recent = store.recent_memories()
     assert recent == []
+
+
+def test_retrieve_many_batches_queries(tmp_path):
+    from witness_forge.memory.embedding import SimpleEmbedder
+    from witness_forge.memory.retrieval import Retriever
+    from witness_forge.memory.vector_store import VectorStore
+
+    db = str(tmp_path / "witness.sqlite3")
+    texts = ["apples are red", "the sky is blue", "grass grows green"]
+    embedder = SimpleEmbedder()
+    embedder.fit(texts)
+    store = MemoryStore(db)
+    vector_store = VectorStore(db, embedder.dimension)
+    store.attach_semantic_hook(embedder.embed, vector_store)
+    store.add_memories(texts)
+    retriever = Retriever(store, embedder, vector_store, k=1)
+
+    results = retriever.retrieve_many(["blue sky", "green grass", ""])
+    assert results[0] == ["the sky is blue"]
+    assert results[1] == ["grass grows green"]
+    assert len(results[2]) == 1  # blank query falls back to recent memories
+    vector_store.close()
+
+
+def test_retriever_caches_by_normalized_query_until_a_write(tmp_path):
+    from witness_forge.memory.embedding import SimpleEmbedder
+    from witness_forge.memory.retrieval import Retriever
+    from witness_forge.memory.vector_store import VectorStore
+
+    db = str(tmp_path / "witness.sqlite3")
+    texts = ["apples are red", "the sky is blue"]
+    embedder = SimpleEmbedder()
+    embedder.fit(texts + ["sky blue again"])
+    store = MemoryStore(db)
+    vector_store = VectorStore(db, embedder.dimension)
+    store.attach_semantic_hook(embedder.embed, vector_store)
+    store.add_memories(texts)
+    retriever = Retriever(store, embedder, vector_store, k=1)
+
+    assert retriever.retrieve("Blue  sky") == ["the sky is blue"]
+    assert retriever.retrieve_many(["blue sky", "BLUE SKY"]) == [["the sky is blue"]] * 2
+    assert retriever.cache.stats()["hits"] == 2
+
+    store.add_memory("sky blue again")
+    assert retriever.retrieve("blue sky") == ["sky blue again"]
+    assert retriever.cache.stats()["misses"] == 2
+    vector_store.close()
+
+
+def test_retrieval_cache_expires_after_ttl():
+    import time
+
+    from witness_forge.memory.retrieval import Retriever, RetrievalCache
+
+    cache = RetrievalCache(ttl=0.05)
+    assert cache.get("q", 1) is None
+    cache.put("q", 1, ("hit",))
+    assert cache.get("q", 1) == ("hit",)
+    time.sleep(0.1)
+    assert cache.get("q", 1) is None and cache.stats()["size"] == 0
+
+    # Recency-weighted retrievers expire cached results; plain ones do not.
+    assert Retriever(None, None, None, half_life_days=64).cache.ttl == 86400.0
+    assert Retriever(None, None, None).cache.ttl is None
+
+
+def test_messages_are_group_committed(tmp_path):
+    import sqlite3
+    import time
+
+    db = str(tmp_path / "witness.sqlite3")
+    store = MemoryStore(db, flush_interval=0.05, flush_size=3)
+    reader = sqlite3.connect(db)
+    count = lambda: reader.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    store.add_message("user", "one")
+    assert count() == 0  # queued, not yet committed
+    deadline = time.monotonic() + 5
+    while count() == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert count() == 1  # flushed by the timer
+
+    store.add_message("user", "two")
+    store.add_message("assistant", "three", durable=True)
+    assert count() == 3
+    for i in range(3):
+        store.add_message("user", f"batch {i}")
+    assert count() == 6  # size threshold
+    store.add_message("user", "last")
+    store.close()
+    assert count() == 7
+    reader.close()
+
+
+def test_search_text_ranks_with_bm25(tmp_path):
+    store = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    store.add_memories(
+        [
+            "Ark thích uống cà phê buổi sáng",
+            "the kettle boils water for tea",
+            "coffee, coffee and more coffee",
+            "meeting notes about the roadmap",
+        ]
+    )
+    store.add_message("user", "remember the roadmap deadline")
+
+    hits = store.search_text("coffee?", k=3)
+    assert [text for text, _ in hits] == ["coffee, coffee and more coffee"]
+    assert hits[0][1] > 0
+    assert [text for text, _ in store.search_text("ca phe")] == ["Ark thích uống cà phê buổi sáng"]
+    assert store.search_text("roadmap", table="messages")[0][0] == "remember the roadmap deadline"
+    assert store.search_text('"" OR *') == []
+
+    store.prune_by_count(1)
+    assert store.search_text("coffee") == []
+    store.close()
+
+
+def test_vocabulary_is_kept_current_by_memory_writes(tmp_path):
+    from witness_forge.agent.flame_core import _distance, _tfidf_vec
+    from witness_forge.memory.retrieval import build_vocab_from_mem
+
+    texts = ["Tea and cake", "tea time", "cake and coffee", "concatenate 42"]
+    store = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    store.add_memories(texts)
+    # Whole tokens count: "cat" inside "concatenate" is not "cake"/"tea".
+    assert store.vocabulary() == build_vocab_from_mem(texts) == {"tea": 0, "and": 1, "cake": 2}
+    assert list(store.vocabulary(min_freq=1)) == ["tea", "and", "cake", "time", "coffee", "concatenate"]
+
+    store.prune_by_count(2)  # drops "Tea and cake" and "tea time"
+    assert list(store.vocabulary(min_freq=1)) == ["and", "cake", "coffee", "concatenate"]
+    store.close()
+    reopened = MemoryStore(str(tmp_path / "witness.sqlite3"))
+    assert list(reopened.vocabulary(min_freq=1)) == ["and", "cake", "coffee", "concatenate"]
+    reopened.close()
+
+    vocab = build_vocab_from_mem(texts, min_freq=1)
+    vec = _tfidf_vec("tea tea cake unknown", vocab)
+    assert set(vec) == {vocab["tea"], vocab["cake"]}
+    assert abs(_distance(vec, _tfidf_vec("tea tea cake", vocab))) < 1e-6
+    assert abs(_distance(vec, {}) - 1.0) < 1e-6
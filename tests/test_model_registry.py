@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import gc
+
+import numpy as np
+
+from witness_forge.agent.flame_core import FlameCore, FlameParams
+from witness_forge.memory.embedding import HFEmbedder
+from witness_forge.memory.model_registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+    def encode(self, texts, **kwargs):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+def test_flame_and_memory_embedder_share_one_resident_model():
+    loads = []
+
+    def loader(name, device, cache_folder):
+        loads.append((name, device))
+        return FakeModel(name)
+
+    registry = ModelRegistry(loader)
+    embedder = HFEmbedder("sentence-transformers/all-MiniLM-L6-v2", registry=registry)
+    flame = FlameCore(FlameParams(), embedder_model="all-MiniLM-L6-v2", registry=registry)
+
+    assert loads == [("sentence-transformers/all-MiniLM-L6-v2", "cpu")]
+    assert embedder.model.model is flame._embedder.model
+    assert list(registry.resident().values()) == [2]
+    assert embedder.embed(["a", "b"]).shape == (2, 4)
+    assert flame.intent_vector("hello", "").shape == (4,)
+
+    other = HFEmbedder("all-MiniLM-L6-v2", device="cuda", registry=registry)
+    assert len(loads) == 2
+    other.model.release()
+    other.model.release()  # idempotent; parked, then evicted by the next idle model
+    assert registry.resident()[other.model.key] == 0
+
+    del embedder
+    gc.collect()
+    assert registry.resident()[flame._embedder.key] == 1
+    del flame
+    gc.collect()
+    # Parked rather than dropped (evicting the idle cuda copy): a reload picks it back up.
+    assert list(registry.resident().values()) == [0]
+    again = HFEmbedder("all-MiniLM-L6-v2", registry=registry)
+    assert len(loads) == 2 and list(registry.resident().values()) == [1]
+    again.model.release()
+    registry.clear_idle()
+    assert registry.resident() == {}
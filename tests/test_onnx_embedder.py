@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+
+def _tiny_bert(path):
+    torch = pytest.importorskip("torch")
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *"abcdefghijklmnopqrstuvwxyz", "the", "sky", "is", "blue"]
+    path.mkdir()
+    (path / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    tokenizer = BertTokenizerFast(vocab_file=str(path / "vocab.txt"))
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64
+    )
+    model = BertModel(config).eval()
+    model.save_pretrained(str(path))
+    tokenizer.save_pretrained(str(path))
+    return torch, tokenizer, model
+
+
+def test_onnx_embedder_matches_pytorch_mean_pooling(tmp_path, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    from witness_forge.memory.onnx_embedder import OnnxEmbedder
+
+    torch, tokenizer, model = _tiny_bert(tmp_path / "tiny")
+
+    def reference(texts):
+        with torch.no_grad():
+            encoded = tokenizer(list(texts), padding=True, return_tensors="pt")
+            hidden = model(**encoded).last_hidden_state
+            mask = encoded["attention_mask"].unsqueeze(-1).float()
+            return ((hidden * mask).sum(1) / mask.sum(1)).numpy()
+
+    texts = ["the sky is blue", "abc", "the sky"]
+    expected = reference(texts)
+    monkeypatch.setattr(OnnxEmbedder, "_reference", lambda self, texts: reference(texts))
+
+    fp32 = OnnxEmbedder(str(tmp_path / "tiny"), onnx_dir=str(tmp_path / "onnx"), quantize=False, batch_size=2)
+    assert fp32.directory.joinpath("verified.json").read_text().count("model.onnx") == 1
+    assert fp32.dimension == 32 and fp32.model_id.endswith(":fp32")
+    np.testing.assert_allclose(fp32.embed(texts), expected, atol=1e-4)
+
+    int8 = OnnxEmbedder(str(tmp_path / "tiny"), onnx_dir=str(tmp_path / "onnx"), quantize=True, verify=False)
+    assert int8.quantized and int8.model_id.endswith(":int8")
+    vectors = int8.embed(texts)
+    cosine = (vectors * expected).sum(1) / np.linalg.norm(vectors, axis=1) / np.linalg.norm(expected, axis=1)
+    assert cosine.min() > 0.9
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import sqlite3
+
+from witness_forge.memory.schema import SCHEMA_VERSION, migrate, schema_version
+from witness_forge.memory.store import MemoryStore
+
+
+def _legacy_db(path: str) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages(ts REAL, role TEXT, text TEXT)")
+    conn.execute("CREATE TABLE memories(ts REAL, text TEXT)")
+    conn.execute("CREATE TABLE kv(k TEXT PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO memories VALUES(?,?)", [(float(i), f"m{i}") for i in range(5)])
+    conn.execute("DELETE FROM memories WHERE text='m1'")
+    conn.execute("INSERT INTO messages VALUES(1.0, 'user', 'hi')")
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_upgrades_legacy_tables_in_place(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    _legacy_db(db)
+    conn = sqlite3.connect(db)
+    before = conn.execute("SELECT rowid, text FROM memories ORDER BY rowid").fetchall()
+
+    applied = migrate(conn)
+    assert [m.version for m in applied] == [1, 2, 3, 4]
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert conn.execute("SELECT id, text FROM memories ORDER BY id").fetchall() == before
+    assert conn.execute("SELECT role, text, session FROM messages").fetchall() == [("user", "hi", None)]
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT text FROM memories ORDER BY ts DESC LIMIT 3").fetchall()
+    assert any("idx_memories_ts" in row[-1] for row in plan)
+    assert migrate(conn) == []
+    conn.close()
+
+
+def test_store_migrates_on_open_and_tags_sessions(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    _legacy_db(db)
+    store = MemoryStore(db, session="s1")
+    store.add_message("user", "hello", durable=True)
+    store.add_memories(["m5", "m6"])
+    assert store.recent_memories(2) == ["m6", "m5"]
+    assert store.prune_by_count(3) == 3
+    assert store.recent_memories(10) == ["m6", "m5", "m4"]
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT text FROM messages WHERE session='s1'").fetchall() == [("hello",)]
+    conn.close()
+    store.close()
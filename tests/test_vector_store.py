@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from witness_forge.memory.store import MemoryStore
+from witness_forge.memory.vector_metadata import MetadataFilter
+from witness_forge.memory.vector_store import VectorStore
+
+
+def _unit(rng, n: int, dim: int) -> np.ndarray:
+    vecs = rng.normal(size=(n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_add_many_grows_buffer_and_persists(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    rng = np.random.default_rng(0)
+    vecs = _unit(rng, 40, 32)
+    vs = VectorStore(db, 32)
+    ids = vs.add_many([f"m{i}" for i in range(39)], vecs[:39])
+    ids.append(vs.add("m39", vecs[39]))
+
+    assert ids == list(range(ids[0], ids[0] + 40))
+    assert len(vs) == 40
+    assert vs._buffer.shape[0] >= 40
+    assert vs.search(vecs[7], top_k=1)[0][0] == "m7"
+    vs.close()
+
+    reopened = VectorStore(db, 32)
+    assert len(reopened) == 40
+    assert reopened.search(vecs[21], top_k=1)[0][0] == "m21"
+    reopened.close()
+
+
+def test_memory_store_add_memories_embeds_once(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    store = MemoryStore(db)
+    vs = VectorStore(db, 32)
+    calls = []
+
+    def encoder(texts):
+        calls.append(list(texts))
+        return _unit(np.random.default_rng(len(calls)), len(texts), 32)
+
+    store.attach_semantic_hook(encoder, vs)
+    store.add_memories(["alpha", "  ", "beta", "gamma"])
+
+    assert calls == [["alpha", "beta", "gamma"]]
+    assert len(vs) == 3
+    assert len(store.recent_memories(10)) == 4
+    vs.close()
+
+
+def test_snapshot_is_memory_mapped_and_tracks_appends(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    snap = str(tmp_path / "vectors.snapshot")
+    rng = np.random.default_rng(1)
+    vecs = _unit(rng, 12, 32)
+    vs = VectorStore(db, 32, snapshot_path=snap)
+    vs.add_many([f"m{i}" for i in range(10)], vecs[:10])
+    vs.add("m10", vecs[10])
+    vs.close()
+
+    reopened = VectorStore(db, 32, snapshot_path=snap)
+    assert isinstance(reopened._buffer, np.memmap)
+    assert len(reopened) == 11
+    assert reopened.search(vecs[10], top_k=1)[0][0] == "m10"
+    reopened.add("m11", vecs[11])
+    assert reopened.search(vecs[11], top_k=1)[0][0] == "m11"
+    reopened.close()
+
+
+def test_stale_snapshot_is_rebuilt_from_sqlite(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    snap = str(tmp_path / "vectors.snapshot")
+    rng = np.random.default_rng(2)
+    vecs = _unit(rng, 3, 32)
+    VectorStore(db, 32, snapshot_path=snap).add_many(["a", "b"], vecs[:2])
+    # A writer without the snapshot moves the SQLite generation forward.
+    VectorStore(db, 32).add("c", vecs[2])
+
+    reopened = VectorStore(db, 32, snapshot_path=snap)
+    assert len(reopened) == 3
+    assert reopened.search(vecs[2], top_k=1)[0][0] == "c"
+    reopened.close()
+
+
+def test_persisted_index_is_trusted_and_only_delta_is_added(tmp_path):
+    pytest.importorskip("faiss")
+    db = str(tmp_path / "witness.sqlite3")
+    index_path = str(tmp_path / "vectors.faiss")
+    rng = np.random.default_rng(3)
+    vecs = _unit(rng, 6, 32)
+    vs = VectorStore(db, 32, index_path=index_path, embedder_id="test")
+    vs.add_many([f"m{i}" for i in range(5)], vecs[:5])
+    vs.close()
+    # Written after the index was saved: must be picked up as a delta.
+    VectorStore(db, 32).add("m5", vecs[5])
+
+    reopened = VectorStore(db, 32, index_path=index_path, embedder_id="test")
+    assert reopened._index.ntotal == 6
+    assert reopened.search(vecs[5], top_k=1)[0][0] == "m5"
+    assert reopened.search(vecs[2], top_k=1)[0][0] == "m2"
+    reopened.close()
+
+    other = VectorStore(db, 32, index_path=index_path, embedder_id="other-model")
+    assert other._restore_index() == 0
+    other.close()
+
+
+def test_ivf_factory_trains_after_threshold(tmp_path):
+    faiss = pytest.importorskip("faiss")
+    rng = np.random.default_rng(4)
+    vecs = _unit(rng, 400, 32)
+    vs = VectorStore(
+        str(tmp_path / "witness.sqlite3"),
+        32,
+        factory="IVF8,Flat",
+        train_threshold=300,
+        nprobe=8,
+    )
+    vs.add_many([f"m{i}" for i in range(200)], vecs[:200])
+    assert isinstance(faiss.downcast_index(vs._index.index), faiss.IndexFlat)  # exact below the threshold
+    assert vs.search(vecs[5], top_k=1)[0][0] == "m5"
+
+    vs.add_many([f"m{i}" for i in range(200, 400)], vecs[200:])
+    vs.wait_for_training()
+    assert faiss.extract_index_ivf(vs._index).nprobe == 8
+    assert vs._index.ntotal == 400
+    assert vs.search(vecs[321], top_k=1)[0][0] == "m321"
+    vs.close()
+
+
+def test_hnsw_factory_serves_without_training(tmp_path):
+    faiss = pytest.importorskip("faiss")
+    vecs = _unit(np.random.default_rng(5), 50, 32)
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32, factory="HNSW16", ef_search=32)
+    vs.add_many([f"m{i}" for i in range(50)], vecs)
+    assert isinstance(faiss.downcast_index(vs._index.index), faiss.IndexHNSW)
+    assert vs.search(vecs[9], top_k=1)[0][0] == "m9"
+    vs.close()
+
+
+@pytest.mark.parametrize("storage", ["int8", "float16"])
+def test_quantized_storage_rescoring_keeps_recall(tmp_path, storage):
+    db = str(tmp_path / "witness.sqlite3")
+    snap = str(tmp_path / "vectors.snapshot")
+    rng = np.random.default_rng(6)
+    vecs = _unit(rng, 300, 32)
+    vs = VectorStore(db, 32, storage=storage, snapshot_path=snap)
+    vs.add_many([f"m{i}" for i in range(300)], vecs)
+
+    assert vs._buffer.dtype == np.dtype(storage)
+    assert vs.search(vecs[17], top_k=1) == [("m17", pytest.approx(1.0, abs=1e-4))]
+    assert vs.measure_recall(vecs[:20], top_k=5) >= 0.95
+    vs.close()
+
+    reopened = VectorStore(db, 32, storage=storage, snapshot_path=snap)
+    assert isinstance(reopened._buffer, np.memmap)
+    assert reopened.search(vecs[250], top_k=1)[0][0] == "m250"
+    reopened.close()
+
+
+@pytest.mark.parametrize("normalize", [True, False])
+def test_int8_bounds_survive_a_tiny_corpus_at_boot(tmp_path, normalize):
+    db = str(tmp_path / "witness.sqlite3")
+    vecs = _unit(np.random.default_rng(11), 400, 32) * (1.0 if normalize else 3.0)
+    vs = VectorStore(db, 32, storage="int8", normalize=normalize)
+    vs.add_many(["m0"], vecs[:1])
+    vs.close()
+
+    # Rebuilt from SQLite with a single row: bounds must not collapse onto it.
+    reopened = VectorStore(db, 32, storage="int8", normalize=normalize)
+    reopened.add_many([f"m{i}" for i in range(1, 400)], vecs[1:])
+    assert reopened.measure_recall(vecs[::20], top_k=10) >= 0.95
+    if not normalize:
+        assert reopened._quantizer.rows == 400  # relearned once the corpus grew
+    reopened.close()
+
+
+@pytest.mark.parametrize("storage", ["float32", "int8"])
+def test_search_many_matches_single_search(tmp_path, storage):
+    vecs = _unit(np.random.default_rng(7), 120, 32)
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32, storage=storage)
+    vs.add_many([f"m{i}" for i in range(120)], vecs)
+
+    batch = vs.search_many(vecs[:10], top_k=3)
+    assert [row[0][0] for row in batch] == [f"m{i}" for i in range(10)]
+    single = vs.search(vecs[4], top_k=3)
+    assert [text for text, _ in batch[4]] == [text for text, _ in single]
+    assert [score for _, score in batch[4]] == pytest.approx([score for _, score in single], abs=1e-5)
+    assert vs.search_many(np.zeros((0, 32), dtype=np.float32)) == []
+    vs.close()
+
+
+def test_search_stays_consistent_while_compacting(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    vecs = _unit(np.random.default_rng(9), 3000, 32)
+    vs = VectorStore(db, 32, compact_ratio=0.0)
+    ids = vs.add_many([f"m{i}" for i in range(3000)], vecs)
+    kept = np.arange(0, 3000, 2)
+    errors: list = []
+    done = threading.Event()
+
+    def search():
+        rng = np.random.default_rng(threading.get_ident() % 1000)
+        while not done.is_set():
+            picks = rng.choice(kept, 16)
+            for pick, hits in zip(picks, vs.search_many(vecs[picks], top_k=1)):
+                if not hits or hits[0][0] != f"m{pick}":
+                    errors.append((pick, hits))
+
+    threads = [threading.Thread(target=search) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for start in range(1, 3000, 100):
+            vs.remove(ids[start : start + 100 : 2])  # every batch compacts
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    assert len(vs) == 1500 and not errors
+    vs.close()
+
+
+def test_forget_only_waits_for_training_when_it_compacts(tmp_path):
+    vecs = _unit(np.random.default_rng(10), 40, 32)
+    vs = VectorStore(str(tmp_path / "witness.sqlite3"), 32, compact_ratio=0.5)
+    ids = vs.add_many([f"m{i}" for i in range(40)], vecs)
+    release = threading.Event()
+    vs._train_thread = threading.Thread(target=release.wait, args=(5,))
+    vs._train_thread.start()
+    try:
+        assert vs.remove(ids[:2]) == 2 and vs._dead == 2  # below the ratio: no wait
+        compacting = threading.Thread(target=vs.compact)
+        compacting.start()
+        compacting.join(0.2)
+        assert compacting.is_alive() and vs._dead == 2  # forced: waits for training
+        release.set()
+        compacting.join(5)
+        assert vs._dead == 0 and len(vs) == 38
+    finally:
+        release.set()
+    vs.close()
+
+
+@pytest.mark.parametrize("factory", ["FlatIP", "HNSW16"])
+def test_remove_drops_rows_from_search_and_compacts(tmp_path, factory):
+    db = str(tmp_path / "witness.sqlite3")
+    snap = str(tmp_path / "vectors.snapshot")
+    vecs = _unit(np.random.default_rng(8), 40, 32)
+    vs = VectorStore(db, 32, factory=factory, snapshot_path=snap, compact_ratio=0.5)
+    ids = vs.add_many([f"m{i}" for i in range(40)], vecs)
+
+    assert vs.remove(ids[3:6]) == 3
+    assert len(vs) == 37
+    assert vs._dead == 3 and vs._count == 40  # below compact_ratio: tombstoned only
+    hits = vs.search(vecs[4], top_k=5)
+    assert "m4" not in {text for text, _ in hits}
+    assert vs.search(vecs[10], top_k=1)[0][0] == "m10"
+    vs.close()
+
+    reopened = VectorStore(db, 32, factory=factory, snapshot_path=snap)
+    assert isinstance(reopened._buffer, np.memmap)
+    assert len(reopened) == 37 and reopened._dead == 3  # tombstones survive the reload
+    assert "m5" not in {text for text, _ in reopened.search(vecs[5], top_k=5)}
+    assert reopened.remove(ids[10:30]) == 20
+    assert reopened._dead == 0 and reopened._count == 17  # past compact_ratio: compacted
+    assert reopened.search(vecs[35], top_k=1)[0][0] == "m35"
+    reopened.close()
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+def test_snapshot_boot_restores_metadata_and_tombstones(tmp_path, legacy):
+    db = str(tmp_path / "witness.sqlite3")
+    snap = str(tmp_path / "vectors.snapshot")
+    vecs = _unit(np.random.default_rng(12), 12, 32)
+    vs = VectorStore(db, 32, snapshot_path=snap)
+    roles = ["user", "assistant"] * 6
+    metadata = [{"role": role} for role in roles]
+    ids = vs.add_many([f"m{i}" for i in range(8)], vecs[:8], metadata=metadata[:8])
+    vs.remove(ids[:2])
+    vs.add_many([f"m{i}" for i in range(8, 12)], vecs[8:], metadata=metadata[8:])
+    if legacy:  # snapshot written before the side files existed
+        header = json.loads((tmp_path / "vectors.snapshot.json").read_text())
+        header.pop("dead")
+        header["columns"] = []
+        (tmp_path / "vectors.snapshot.json").write_text(json.dumps(header))
+    else:  # boot reads the side files, not the SQLite metadata columns
+        with vs.conn:
+            vs.conn.execute("UPDATE memory_vectors SET role=NULL")
+    vs.close()
+
+    reopened = VectorStore(db, 32, snapshot_path=snap)
+    assert isinstance(reopened._buffer, np.memmap)
+    assert len(reopened) == 10 and reopened._dead == 2
+    users = reopened.search(vecs[0], top_k=12, where=MetadataFilter(roles=("user",)))
+    assert {text for text, _ in users} == {"m2", "m4", "m6", "m8", "m10"}
+    reopened.close()
+
+
+def test_pruning_memories_cascades_to_vectors(tmp_path):
+    db = str(tmp_path / "witness.sqlite3")
+    store = MemoryStore(db)
+    vs = VectorStore(db, 32)
+    vecs = _unit(np.random.default_rng(9), 10, 32)
+    store.attach_semantic_hook(lambda texts: vecs[: len(texts)], vs)
+    store.add_memories([f"m{i}" for i in range(10)])
+    generation = vs.generation
+
+    assert store.prune_by_count(4) == 6
+    assert len(vs) == 4
+    assert vs.generation > generation
+    assert vs.conn.execute("SELECT COUNT(*) FROM memory_vectors").fetchone()[0] == 4
+    survivors = {text for text, _ in vs.search(vecs[0], top_k=10)}
+    assert survivors == set(store.recent_memories(10))
+    vs.close()
+
+
+@pytest.mark.parametrize("factory,storage", [("FlatIP", "float32"), ("FlatIP", "int8"), ("HNSW16", "float32")])
+def test_metadata_filters_and_recency_decay(tmp_path, factory, storage):
+    db = str(tmp_path / "witness.sqlite3")
+    base = _unit(np.random.default_rng(10), 1, 32)[0]
+    noise = _unit(np.random.default_rng(11), 6, 32) * 0.05
+    vecs = base + noise
+    vs = VectorStore(db, 32, factory=factory, storage=storage)
+    roles = ["user", "assistant", "user", "assistant", "user", "assistant"]
+    vs.add_many([f"m{i}" for i in range(6)], vecs, metadata=[{"role": r, "namespace": "a"} for r in roles])
+    now = 1_000_000.0
+    stamps = [now - 86400 * 30 * (5 - i) for i in range(6)]  # m5 newest, m0 oldest
+    with vs.conn:
+        vs.conn.executemany("UPDATE memory_vectors SET ts=? WHERE text=?", [(t, f"m{i}") for i, t in enumerate(stamps)])
+    vs.close()
+
+    vs = VectorStore(db, 32, factory=factory, storage=storage)
+    only_users = vs.search(base, top_k=6, where=MetadataFilter(roles=("user",)))
+    assert {text for text, _ in only_users} == {"m0", "m2", "m4"}
+    recent = vs.search(base, top_k=6, where=MetadataFilter(since=stamps[3]))
+    assert {text for text, _ in recent} == {"m3", "m4", "m5"}
+    assert vs.search(base, top_k=3, where=MetadataFilter(namespaces=("missing",))) == []
+
+    decayed = vs.search(base, top_k=6, half_life=86400 * 30, now=now)
+    assert [text for text, _ in decayed] == [f"m{i}" for i in range(5, -1, -1)]
+    vs.close()